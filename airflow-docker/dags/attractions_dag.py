@@ -16,6 +16,9 @@ from urllib.parse import urlparse
 from playwright.async_api import async_playwright
 from dotenv import load_dotenv
 import json
+from price_parsing import parse_ticket_details_batch
+from catalog_snapshot import export_table_snapshot
+from catalog_versions import publish_load
 
 # Configure logging
 logging.basicConfig(
@@ -59,6 +62,8 @@ os.makedirs(DATA_DIR, exist_ok=True)
 RAW_ATTRACTIONS_PATH = f"{DATA_DIR}/multi_city_attractions.csv"
 CLEAN_ATTRACTIONS_PATH = f"{DATA_DIR}/cleaned_attractions.csv"
 GEOCODED_ATTRACTIONS_PATH = f"{DATA_DIR}/attractions_with_coords.csv"
+# Shared volume the backend serves per-city catalog snapshots from (CATALOG_BACKEND=snapshot)
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "/opt/airflow/data/snapshots")
 CHECKPOINT_PATH = f"{DATA_DIR}/scrape_checkpoint.json"
 
 # S3 paths
@@ -618,6 +623,12 @@ def load_from_s3_to_snowflake(s3_bucket, s3_key, table_name):
                 new_df[col] = df[col]
             else:
                 new_df[col] = ""
+
+        # Precompute free/paid flags and ticket prices so the backend does not re-parse them
+        prices = parse_ticket_details_batch(new_df["Ticket Details"])
+        new_df["IsFree"] = prices["IsFree"]
+        new_df["PriceValue"] = prices["PriceValue"]
+        logging.info(f"Parsed ticket prices: {int(prices['IsFree'].sum())} free, {int((~prices['IsFree']).sum())} paid")
         
         temp_file = "/tmp/attractions_with_coords_fixed.csv"
         new_df.to_csv(temp_file, index=False)
@@ -647,7 +658,9 @@ def load_from_s3_to_snowflake(s3_bucket, s3_key, table_name):
             LATITUDE NUMBER(38,14),
             LONGITUDE NUMBER(38,14),
             PLACENAME VARCHAR(16777216),
-            FORMATTEDADDRESS VARCHAR(16777216)
+            FORMATTEDADDRESS VARCHAR(16777216),
+            ISFREE BOOLEAN,
+            PRICEVALUE FLOAT
         )
         """
         cursor.execute(create_table_sql)
@@ -671,7 +684,9 @@ def load_from_s3_to_snowflake(s3_bucket, s3_key, table_name):
                 LATITUDE,
                 LONGITUDE,
                 PLACENAME,
-                FORMATTEDADDRESS
+                FORMATTEDADDRESS,
+                ISFREE,
+                PRICEVALUE
             )
             FROM @{S3_STAGE}/{file_name}
             FILE_FORMAT = (
@@ -703,6 +718,13 @@ def load_from_s3_to_snowflake(s3_bucket, s3_key, table_name):
         columns = cursor.fetchall()
         logging.info(f"Table columns: {[col[0] for col in columns]}")
 
+        # New per-city versions (under the backend's table name) tell it which cached cities to refresh;
+        # the load has committed, so a failure here is logged rather than failing (and re-running) the task
+        try:
+            publish_load(cursor, "ATTRACTION", new_df, source="triphobo_attractions_pipeline")
+        except Exception as e:
+            logging.error(f"Failed to record ATTRACTION versions: {str(e)}")
+
         cursor.close()
         conn.close()
         
@@ -774,5 +796,18 @@ with DAG(
         dag=dag
     )
 
+    # Publish the per-city snapshot the backend reads, once Snowflake has the same data
+    export_snapshot_task = PythonOperator(
+        task_id="export_catalog_snapshot",
+        python_callable=export_table_snapshot,
+        op_kwargs={
+            "table": "ATTRACTION",
+            "source": GEOCODED_ATTRACTIONS_PATH,
+            "directory": CATALOG_SNAPSHOT_DIR,
+            "source_name": "triphobo_attractions_pipeline"
+        },
+        dag=dag
+    )
+
     # Task dependencies - process all cities then perform the remaining steps
-    scrape_all_cities_task >> clean_attractions_task >> geocode_attractions_task >> upload_geocoded_attractions_task >> load_to_snowflake_task
\ No newline at end of file
+    scrape_all_cities_task >> clean_attractions_task >> geocode_attractions_task >> upload_geocoded_attractions_task >> load_to_snowflake_task >> export_snapshot_task
\ No newline at end of file
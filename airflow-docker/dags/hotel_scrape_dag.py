@@ -14,6 +14,9 @@ import random
 import csv
 import math
 from dotenv import load_dotenv
+from price_parsing import extract_prices
+from catalog_snapshot import export_table_snapshot
+from catalog_versions import publish_load
 
 load_dotenv()
 
@@ -26,6 +29,8 @@ DATA_DIR = "/tmp/ihg_data"
 os.makedirs(DATA_DIR, exist_ok=True)
 RAW_HOTELS_PATH = f"{DATA_DIR}/multi_city_ihg_hotels.csv"
 GEOCODED_HOTELS_PATH = f"{DATA_DIR}/hotels_with_coordinates.csv"
+# Shared volume the backend serves per-city catalog snapshots from (CATALOG_BACKEND=snapshot)
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "/opt/airflow/data/snapshots")
 
 CITIES = {
     "New York": "NY",
@@ -494,7 +499,7 @@ def add_geocoding_data():
         total_rows = len(all_rows)
         logger.info(f"Total hotels to process: {total_rows}")
 
-        fieldnames = list(all_rows[0].keys()) + ['Latitude', 'Longitude', 'CalculationMethod']
+        fieldnames = list(all_rows[0].keys()) + ['Latitude', 'Longitude', 'CalculationMethod', 'PriceValue']
         results = []
 
         for idx, row in enumerate(all_rows):
@@ -549,6 +554,11 @@ def add_geocoding_data():
 
             results.append(updated_row)
 
+        # Precompute numeric nightly prices so the backend does not re-parse them
+        prices = extract_prices(pd.Series([row.get('Price (per night)', '') for row in results], dtype=object))
+        for row, price_value in zip(results, prices):
+            row['PriceValue'] = price_value
+
         with open(GEOCODED_HOTELS_PATH, 'w', encoding='utf-8', newline='') as output_file:
             writer = csv.DictWriter(output_file, fieldnames=fieldnames)
             writer.writeheader()
@@ -643,7 +653,8 @@ def load_into_snowflake():
                 Certified STRING,
                 Latitude FLOAT,
                 Longitude FLOAT,
-                CalculationMethod STRING
+                CalculationMethod STRING,
+                PriceValue FLOAT
             )
         """)
 
@@ -659,6 +670,13 @@ def load_into_snowflake():
         cursor.execute(f"SELECT COUNT(*) FROM {table}")
         count = cursor.fetchone()[0]
         logger.info(f"Data loaded into Snowflake table: {table} ({count} rows)")
+
+        # New per-city versions tell the backend which cached cities to refresh; the load has
+        # committed, so a failure here is logged rather than failing (and re-running) the task
+        try:
+            publish_load(cursor, table, pd.read_csv(GEOCODED_HOTELS_PATH), source="ihg_hotels_dag")
+        except Exception as e:
+            logger.error(f"Failed to record {table} versions: {str(e)}")
         
         return count
     except Exception as e:
@@ -707,5 +725,18 @@ with DAG(
         dag=dag
     )
 
+    # Publish the per-city snapshot the backend reads, once Snowflake has the same data
+    snapshot_task = PythonOperator(
+        task_id="export_catalog_snapshot",
+        python_callable=export_table_snapshot,
+        op_kwargs={
+            "table": "HOTEL_DATA",
+            "source": GEOCODED_HOTELS_PATH,
+            "directory": CATALOG_SNAPSHOT_DIR,
+            "source_name": "ihg_hotels_dag"
+        },
+        dag=dag
+    )
+
     # Set task dependencies with the new geocoding step
-    scrape_task >> geocode_task >> upload_task >> snowflake_task
\ No newline at end of file
+    scrape_task >> geocode_task >> upload_task >> snowflake_task >> snapshot_task
\ No newline at end of file
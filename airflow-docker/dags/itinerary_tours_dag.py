@@ -15,6 +15,9 @@ import snowflake.connector
 from dotenv import load_dotenv
 from playwright.async_api import async_playwright
 from bs4 import BeautifulSoup
+from price_parsing import extract_prices
+from catalog_snapshot import export_table_snapshot
+from catalog_versions import publish_load
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +36,8 @@ os.makedirs(DATA_DIR, exist_ok=True)
 RAW_TOURS_PATH = f"{DATA_DIR}/triphobo_multi_city_tours.csv"
 CLEAN_TOURS_PATH = f"{DATA_DIR}/cleaned_tours.csv"
 GEOCODED_TOURS_PATH = f"{DATA_DIR}/tours_with_coords.csv"
+# Shared volume the backend serves per-city catalog snapshots from (CATALOG_BACKEND=snapshot)
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "/opt/airflow/data/snapshots")
 
 # AWS + S3
 S3_BUCKET = os.getenv("S3_BUCKET", "bigdatafinal2025")
@@ -490,6 +495,9 @@ def load_tours_from_s3_to_snowflake():
         for col in required_columns:
             ordered_df[col] = df[col] if col in df.columns else "N/A"
 
+        # Precompute numeric prices so the backend does not re-parse them
+        ordered_df["PriceValue"] = extract_prices(ordered_df["Price"])
+
         # Save to temp file
         temp_file = "/tmp/tours_with_coords.csv"
         ordered_df.to_csv(temp_file, index=False)
@@ -519,7 +527,8 @@ def load_tours_from_s3_to_snowflake():
             LATITUDE NUMBER(38,14),
             LONGITUDE NUMBER(38,14),
             PLACENAME VARCHAR(16777216),
-            FORMATTEDADDRESS VARCHAR(16777216)
+            FORMATTEDADDRESS VARCHAR(16777216),
+            PRICEVALUE FLOAT
         )
         """
         cursor.execute(create_table_sql)
@@ -550,6 +559,13 @@ def load_tours_from_s3_to_snowflake():
         count = cursor.fetchone()[0]
         logger.info(f"Snowflake table row count: {count}")
 
+        # New per-city versions (under the backend's table name) tell it which cached cities to refresh;
+        # the load has committed, so a failure here is logged rather than failing (and re-running) the task
+        try:
+            publish_load(cursor, "TOUR", ordered_df, source="triphobo_tours_pipeline")
+        except Exception as e:
+            logger.error(f"Failed to record TOUR versions: {str(e)}")
+
         cursor.close()
         conn.close()
 
@@ -622,6 +638,18 @@ with DAG(
         python_callable=load_tours_from_s3_to_snowflake
     )
 
+    # Publish the per-city snapshot the backend reads, once Snowflake has the same data
+    export_snapshot_task = PythonOperator(
+        task_id="export_catalog_snapshot",
+        python_callable=export_table_snapshot,
+        op_kwargs={
+            "table": "TOUR",
+            "source": GEOCODED_TOURS_PATH,
+            "directory": CATALOG_SNAPSHOT_DIR,
+            "source_name": "triphobo_tours_pipeline"
+        }
+    )
+
     # DAG dependencies
-    verify_env_vars_task >> scrape_tours_task >> upload_raw_tours_task >> clean_tours_task >> geocode_tours_task >> upload_geocoded_tours_task >> load_tours_snowflake_task
+    verify_env_vars_task >> scrape_tours_task >> upload_raw_tours_task >> clean_tours_task >> geocode_tours_task >> upload_geocoded_tours_task >> load_tours_snowflake_task >> export_snapshot_task
    
\ No newline at end of file
@@ -12,6 +12,9 @@ import time
 from collections import defaultdict
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 import logging
+from local_vector_store import write_city_shard
+import cassettes
+from catalog_versions import publish_hidden_gems
 
 from airflow import DAG
 from airflow.operators.python import PythonOperator
@@ -32,6 +35,9 @@ MAX_RESULTS_PER_QUERY = 20
 LOCAL_BASE_DIR = "/opt/airflow/data/city_transcripts"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+# Shared volume where each city's embeddings are also exported as a memory-mapped
+# shard for the backend's local vector store (HIDDEN_GEMS_BACKEND=local)
+LOCAL_VECTOR_EXPORT_DIR = os.getenv("LOCAL_VECTOR_EXPORT_DIR", "/opt/airflow/data/vectors")
 
 # City configuration
 CITIES = {
@@ -469,12 +475,14 @@ def download_city_transcripts(city_key, city_config, credentials, local_output_d
 def upload_city_data_to_s3(city_key, city_config, credentials, local_output_dir, transcripts_dir):
     try:
         # Initialize S3 client
-        s3_client = boto3.client(
+        # Writes are recorded as no-ops so replayed DAG runs never touch the bucket
+        s3_client = cassettes.proxy("s3", lambda: boto3.client(
             's3',
             region_name=credentials['aws_region'],
             aws_access_key_id=credentials['aws_access_key'],
             aws_secret_access_key=credentials['aws_secret_key']
-        )
+        ), {"put_object": {"key": lambda kwargs: (kwargs.get("Bucket"), kwargs.get("Key")), "to_record": lambda r: None},
+            "upload_file": {"to_record": lambda r: None}})
         
         bucket_name = credentials['s3_bucket_name']
         city_folder = city_config["folder_name"]
@@ -664,6 +672,7 @@ def process_and_embed_city_data(city_key, city_config, credentials, nlp_model, l
         successful_count = 0
         failed_count = 0
         total_vectors = 0
+        export_ids, export_embeddings, export_metadata = [], [], []
         
         for i, filename in enumerate(transcript_files):
             file_path = os.path.join(transcripts_dir, filename)
@@ -774,6 +783,9 @@ def process_and_embed_city_data(city_key, city_config, credentials, nlp_model, l
                                 'metadata': chunk_metadata
                             }]
                         )
+                        export_ids.append(vector_id)
+                        export_embeddings.append(embedding)
+                        export_metadata.append(chunk_metadata)
                         chunk_vectors += 1
                         total_vectors += 1
                         logger.info(f"[{city_key}] Successfully uploaded vector {j+1} for {filename}")
@@ -792,6 +804,21 @@ def process_and_embed_city_data(city_key, city_config, credentials, nlp_model, l
                 logger.error(f"[{city_key}] Error processing file {filename}: {str(e)}")
                 failed_count += 1
         
+        if LOCAL_VECTOR_EXPORT_DIR and export_ids:
+            try:
+                shard_path = write_city_shard(LOCAL_VECTOR_EXPORT_DIR, city_key, export_ids,
+                                              export_embeddings, export_metadata)
+                logger.info(f"[{city_key}] Exported {len(export_ids)} vectors to local shard {shard_path}")
+            except Exception as e:
+                logger.error(f"[{city_key}] Failed to export local vector shard: {str(e)}")
+        
+        if export_metadata:
+            try:
+                changed = publish_hidden_gems(city_key, export_metadata, source="city_travel_transcripts_processing")
+                logger.info(f"[{city_key}] Hidden gems version changed for {changed or 'no cities'}")
+            except Exception as e:
+                logger.error(f"[{city_key}] Failed to record hidden gems version: {str(e)}")
+        
         logger.info(f"[{city_key}] Processing complete!")
         logger.info(f"[{city_key}] Successfully processed {successful_count} transcripts")
         logger.info(f"[{city_key}] Failed to process {failed_count} transcripts")
@@ -877,14 +904,14 @@ def generate_processing_summary(**kwargs):
 def search_videos(youtube, query, max_results=50):
     """Search for videos matching the query."""
     try:
-        search_response = youtube.search().list(
+        search_response = cassettes.call("youtube", ("search", query, max_results), lambda: youtube.search().list(
             q=query,
             part="id,snippet",
             maxResults=max_results,
             type="video",
             relevanceLanguage="en",
             regionCode="US"
-        ).execute()
+        ).execute())
         
         video_ids = [item["id"]["videoId"] for item in search_response["items"]]
         return video_ids, search_response["items"]
@@ -895,10 +922,10 @@ def search_videos(youtube, query, max_results=50):
 def get_video_details(youtube, video_ids):
     """Get detailed information about specific videos."""
     try:
-        video_response = youtube.videos().list(
+        video_response = cassettes.call("youtube", ("videos", video_ids), lambda: youtube.videos().list(
             part="snippet,contentDetails,statistics,recordingDetails",
             id=",".join(video_ids)
-        ).execute()
+        ).execute())
         
         return video_response["items"]
     except Exception as e:
@@ -911,7 +938,7 @@ def get_video_transcript(video_id):
     for attempt in range(max_retries):
         try:
             try:
-                transcript_data = YouTubeTranscriptApi.get_transcript(video_id, languages=['en'])
+                transcript_data = cassettes.call("transcripts", (video_id, 'en'), YouTubeTranscriptApi.get_transcript, video_id, languages=['en'])
                 # If successful, return immediately
                 full_text = " ".join([item.get('text', '') for item in transcript_data])
                 return {
@@ -921,7 +948,7 @@ def get_video_transcript(video_id):
             except NoTranscriptFound:
                 logger.info(f"No English transcript found for {video_id}, trying en-US")
                 try:
-                    transcript_data = YouTubeTranscriptApi.get_transcript(video_id, languages=['en-US'])
+                    transcript_data = cassettes.call("transcripts", (video_id, 'en-US'), YouTubeTranscriptApi.get_transcript, video_id, languages=['en-US'])
                     full_text = " ".join([item.get('text', '') for item in transcript_data])
                     return {
                         'text': full_text,
@@ -1231,11 +1258,10 @@ def get_embedding(text, client):
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            response = client.embeddings.create(
-                input=text,
-                model=EMBEDDING_MODEL
+            return cassettes.call(
+                "embeddings", (EMBEDDING_MODEL, text),
+                lambda: client.embeddings.create(input=text, model=EMBEDDING_MODEL).data[0].embedding
             )
-            return response.data[0].embedding
         except Exception as e:
             if attempt < max_retries - 1:
                 logger.warning(f"Error getting embedding, retrying in 2 seconds: {str(e)}")
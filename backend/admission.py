@@ -0,0 +1,183 @@
+"""
+Admission control for the generation endpoints.
+
+Each endpoint has a concurrency limit and a bounded queue; all of them share
+ADMISSION_TOTAL_CONCURRENCY slots. A freed slot goes to the waiting request
+with the best priority class (FIFO within a class), so /ask and PDF exports are
+not stuck behind a burst of full itinerary generations.
+
+    ADMISSION_LIMITS             endpoint=concurrency:queue, per worker
+                                 (default "generate-itinerary=8:16,ask=16:32,generate-pdf=4:16")
+    ADMISSION_PRIORITY           endpoint=class, lower goes first
+                                 (default "ask=0,generate-pdf=0,generate-itinerary=1")
+    ADMISSION_QUEUE_TIMEOUT      endpoint=seconds a request may wait for a slot
+                                 (default "generate-itinerary=10,ask=5,generate-pdf=5")
+    ADMISSION_TOTAL_CONCURRENCY  slots shared by all endpoints (default 24)
+
+A request that finds its endpoint's queue full gets 429 at once; one that
+waits past its queue timeout gets 503. Both carry Retry-After, estimated from
+the queue length and the endpoint's recent service time. Endpoints listed in
+ADMISSION_DEGRADE (default "generate-itinerary") can answer such requests
+cheaply instead: they are passed on without a slot, with the rejection in
+request.state.admission_rejected, and the endpoint either serves a degraded
+response (the fast itinerary) or returns the rejection. Admitted requests
+thereby wait a bounded time instead of every request slowing down together.
+
+The controller keeps no event-loop state, so it works for every loop a worker
+runs (uvicorn's, a test client's).
+"""
+import asyncio
+import itertools
+import math
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+
+def _pairs(value):
+    return {name.strip(): setting.strip() for name, setting in
+            (item.split("=", 1) for item in value.split(",") if "=" in item)}
+
+
+ADMISSION_LIMITS = {
+    endpoint: tuple(int(n) for n in setting.split(":"))
+    for endpoint, setting in _pairs(os.getenv(
+        "ADMISSION_LIMITS", "generate-itinerary=8:16,ask=16:32,generate-pdf=4:16")).items()
+}
+ADMISSION_PRIORITY = {
+    endpoint: int(priority) for endpoint, priority in _pairs(os.getenv(
+        "ADMISSION_PRIORITY", "ask=0,generate-pdf=0,generate-itinerary=1")).items()
+}
+ADMISSION_QUEUE_TIMEOUT = {
+    endpoint: float(seconds) for endpoint, seconds in _pairs(os.getenv(
+        "ADMISSION_QUEUE_TIMEOUT", "generate-itinerary=10,ask=5,generate-pdf=5")).items()
+}
+ADMISSION_TOTAL_CONCURRENCY = int(os.getenv("ADMISSION_TOTAL_CONCURRENCY", "24"))
+ADMISSION_DEGRADE = {name.strip() for name in os.getenv("ADMISSION_DEGRADE", "generate-itinerary").split(",") if name.strip()}
+
+ADMISSION_WAIT = REGISTRY.summary(
+    "itinerary_admission_wait_seconds", "Time admitted requests waited for a slot", ["endpoint"])
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "itinerary_admission_queued", "Requests waiting for a slot", ["endpoint"])
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    "itinerary_admission_active", "Requests holding a slot", ["endpoint"])
+ADMISSION_REJECTED = REGISTRY.counter(
+    "itinerary_admission_rejected_total", "Requests turned away (queue_full: 429, timeout: 503)", ["endpoint", "reason"])
+
+
+class Rejected(Exception):
+    """Raised by acquire(); status_code is 429 or 503, retry_after is in seconds"""
+
+    def __init__(self, endpoint, status_code, reason, retry_after):
+        super().__init__(f"{endpoint} is over capacity ({reason}); retry in {retry_after}s")
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, endpoint, loop):
+        self.endpoint = endpoint
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+
+class AdmissionController:
+    def __init__(self, limits=None, priority=None, timeouts=None, total=None):
+        self.limits = ADMISSION_LIMITS if limits is None else limits
+        self.priority = ADMISSION_PRIORITY if priority is None else priority
+        self.timeouts = ADMISSION_QUEUE_TIMEOUT if timeouts is None else timeouts
+        self.total = ADMISSION_TOTAL_CONCURRENCY if total is None else total
+        self._lock = threading.Lock()
+        self._active = {endpoint: 0 for endpoint in self.limits}
+        self._queues = {}
+        self._order = itertools.count()
+        self._service = {}
+
+    def controls(self, endpoint):
+        return endpoint in self.limits
+
+    def _queued(self, endpoint):
+        return sum(1 for w in self._queues.values() if w.endpoint == endpoint)
+
+    def queued(self, endpoint):
+        with self._lock:
+            return self._queued(endpoint)
+
+    def _can_start(self, endpoint):
+        return self._active[endpoint] < self.limits[endpoint][0] and sum(self._active.values()) < self.total
+
+    def _dispatch(self):
+        """Grant free slots to waiters by (priority, arrival); called with the lock held"""
+        for key in sorted(self._queues):
+            waiter = self._queues[key]
+            if not self._can_start(waiter.endpoint):
+                continue
+            del self._queues[key]
+            waiter.granted = True
+            self._active[waiter.endpoint] += 1
+            ADMISSION_QUEUED.dec(endpoint=waiter.endpoint)
+            ADMISSION_ACTIVE.inc(endpoint=waiter.endpoint)
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+
+    def retry_after(self, endpoint):
+        """Seconds until the queue ahead of a new request has likely drained"""
+        queued = self.queued(endpoint)
+        service = self._service.get(endpoint, 1.0)
+        return max(1, min(60, math.ceil((queued + 1) * service / max(1, self.limits[endpoint][0]))))
+
+    async def acquire(self, endpoint):
+        """Wait for a slot; returns the seconds waited or raises Rejected"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        with self._lock:
+            if self._queued(endpoint) >= self.limits[endpoint][1]:
+                waiter = None
+            else:
+                waiter = _Waiter(endpoint, loop)
+                self._queues[(self.priority.get(endpoint, 0), next(self._order))] = waiter
+                ADMISSION_QUEUED.inc(endpoint=endpoint)
+                self._dispatch()
+        if waiter is None:
+            ADMISSION_REJECTED.inc(endpoint=endpoint, reason="queue_full")
+            raise Rejected(endpoint, 429, "queue_full", self.retry_after(endpoint))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.timeouts.get(endpoint, 10))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    key = next(k for k, w in self._queues.items() if w is waiter)
+                    del self._queues[key]
+                    ADMISSION_QUEUED.dec(endpoint=endpoint)
+            if isinstance(e, asyncio.CancelledError):
+                if granted:
+                    self.release(endpoint, 0)
+                raise
+            if not granted:
+                ADMISSION_REJECTED.inc(endpoint=endpoint, reason="timeout")
+                raise Rejected(endpoint, 503, "timeout", self.retry_after(endpoint)) from None
+        waited = time.perf_counter() - start
+        ADMISSION_WAIT.observe(waited, endpoint=endpoint)
+        return waited
+
+    def release(self, endpoint, service_seconds=None):
+        with self._lock:
+            self._active[endpoint] -= 1
+            ADMISSION_ACTIVE.dec(endpoint=endpoint)
+            if service_seconds:
+                previous = self._service.get(endpoint, service_seconds)
+                self._service[endpoint] = 0.8 * previous + 0.2 * service_seconds
+            self._dispatch()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+controller = AdmissionController()
@@ -1,244 +1,258 @@
-from crewai import Agent
-
 from dotenv import load_dotenv
 
-from litellm import completion
-
-from langchain.llms.base import LLM  # Import LangChain's base LLM class
+from functools import lru_cache
 
 from typing import Any, List, Mapping, Optional
 
-from datetime import datetime, timedelta
+from datetime import datetime
+
+import logging
 
 import os
 
-import json
+import asyncio
+
+from catalog_models import dumps
+
+from itinerary_planning import plan_days
+
+from metrics import stage_timer
 
-import math
+from profiling import sampled
 
-from random import shuffle
+from tracing import start_span
+
+import llm_client
+
+import llm_usage
  
 load_dotenv(override=True)
 
-#os.environ["LITELLM_API_KEY"] = os.getenv("XAI_API_KEY")
- 
-# Create a custom LangChain LLM wrapper for LiteLLM's Grok
+logger = logging.getLogger(__name__)
 
-class LiteLLMGrok(LLM):
+# Stream completions so time to first token can be measured; set to false to use a single blocking response
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() == "true"
 
-    model: str = "xai/grok-2-1212"
+# Model of the CrewAI / LangChain agents; the generation endpoints route across LLM_MODELS (see llm_router)
+LLM_MODEL = os.getenv("LLM_MODEL", "xai/grok-2-1212")
 
-    temperature: float = 0.7
+# Optional OpenAI-compatible base URL, e.g. the load-test stand-in at http://localhost:8100/v1
+LLM_API_BASE = os.getenv("LLM_API_BASE") or None
+ 
+def completion_kwargs(messages, **kwargs):
 
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+    """Arguments shared by every litellm completion call"""
 
-        response = completion(
+    params = dict(
 
-            model=self.model,
+        model=LLM_MODEL,
 
-            messages=[{"role": "user", "content": prompt}],
+        messages=messages,
 
-            provider="grok",
+        provider="grok",
 
-            api_key=os.getenv("XAI_API_KEY")
+        api_key=os.getenv("XAI_API_KEY"),
 
-        )
+        **kwargs
 
-        return response['choices'][0]['message']['content']
+    )
 
-    @property
+    if LLM_API_BASE:
 
-    def _llm_type(self) -> str:
+        params["api_base"] = LLM_API_BASE
 
-        return "litellm-grok"
+    return params
 
-    @property
+#os.environ["LITELLM_API_KEY"] = os.getenv("XAI_API_KEY")
+ 
+# crewai, langchain and litellm take seconds to import, so nothing here touches them
+# until first use; a cold start only pays for what the request path needs.
 
-    def _identifying_params(self) -> Mapping[str, Any]:
+def completion(**params):
 
-        return {"model": self.model, "temperature": self.temperature}
- 
-# Create an instance of our custom LLM
+    """litellm.completion, importing litellm on first call"""
+
+    from litellm import completion as litellm_completion
 
-custom_llm = LiteLLMGrok()
+    return litellm_completion(**params)
  
-# Use the custom LLM in your agents
+@lru_cache(maxsize=None)
 
-crew_agent = Agent(
+def _litellm_grok_class():
 
-    role="Travel Planner",
+    from langchain.llms.base import LLM  # Import LangChain's base LLM class
 
-    goal="Generate an HTML-based multi-day travel itinerary with hidden gems",
+    # Create a custom LangChain LLM wrapper for LiteLLM's Grok
 
-    backstory="You are a helpful AI travel assistant who plans perfect trips based on structured data and includes insider tips about hidden gems.",
+    class LiteLLMGrok(LLM):
 
-    verbose=True,
+        model: str = LLM_MODEL
 
-    llm=custom_llm,  # Explicitly set the LLM
+        temperature: float = 0.7
 
-)
- 
-chat_agent = Agent(
+        def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
 
-    role="Itinerary Q&A Expert",
+            response = completion(**completion_kwargs([{"role": "user", "content": prompt}]))
 
-    goal="Answer questions about a generated travel itinerary",
+            return response['choices'][0]['message']['content']
 
-    backstory="You are a specialized AI that helps travelers understand their itinerary and answer follow-up questions based solely on the trip details provided.",
+        @property
 
-    verbose=True,
+        def _llm_type(self) -> str:
 
-    llm=custom_llm,  # Explicitly set the LLM
+            return "litellm-grok"
 
-)
- 
-def calculate_distance(lat1, lon1, lat2, lon2):
+        @property
 
-    if None in (lat1, lon1, lat2, lon2):
+        def _identifying_params(self) -> Mapping[str, Any]:
 
-        return float('inf')
+            return {"model": self.model, "temperature": self.temperature}
 
-    try:
+    return LiteLLMGrok
+ 
+@lru_cache(maxsize=None)
 
-        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+def get_custom_llm():
 
-        R = 6371
+    return _litellm_grok_class()()
+ 
+@lru_cache(maxsize=None)
 
-        dLat = math.radians(lat2 - lat1)
+def get_crew_agent():
 
-        dLon = math.radians(lon2 - lon1)
+    from crewai import Agent
 
-        a = math.sin(dLat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon/2)**2
+    return Agent(
 
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+        role="Travel Planner",
 
-        return R * c
+        goal="Generate an HTML-based multi-day travel itinerary with hidden gems",
 
-    except:
+        backstory="You are a helpful AI travel assistant who plans perfect trips based on structured data and includes insider tips about hidden gems.",
 
-        return float('inf')
- 
-def get_coordinates(item):
+        verbose=True,
 
-    return item.get("LATITUDE"), item.get("LONGITUDE")
+        llm=get_custom_llm(),  # Explicitly set the LLM
+
+    )
  
-def find_closest_hotel(hotels, attractions):
+@lru_cache(maxsize=None)
+
+def get_chat_agent():
 
-    if not hotels or not attractions:
+    from crewai import Agent
 
-        return hotels[0] if hotels else None
+    return Agent(
 
-    avg_lat = sum(float(a.get("LATITUDE", 0)) for a in attractions) / len(attractions)
+        role="Itinerary Q&A Expert",
 
-    avg_lon = sum(float(a.get("LONGITUDE", 0)) for a in attractions) / len(attractions)
+        goal="Answer questions about a generated travel itinerary",
 
-    closest_hotel = min(hotels, key=lambda h: calculate_distance(avg_lat, avg_lon, h.get("LATITUDE"), h.get("LONGITUDE")))
+        backstory="You are a specialized AI that helps travelers understand their itinerary and answer follow-up questions based solely on the trip details provided.",
 
-    return closest_hotel
+        verbose=True,
+
+        llm=get_custom_llm(),  # Explicitly set the LLM
+
+    )
  
-def run_crew_with_data(data):
+_LAZY_ATTRIBUTES = {
 
-    try:
+    "LiteLLMGrok": _litellm_grok_class,
 
-        start = datetime.strptime(data["start_date"], "%Y-%m-%d")
+    "custom_llm": get_custom_llm,
 
-        end = datetime.strptime(data["end_date"], "%Y-%m-%d")
+    "crew_agent": get_crew_agent,
 
-        num_days = (end - start).days + 1
+    "chat_agent": get_chat_agent,
 
-        date_list = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(num_days)]
+}
  
-        hotels = data.get("hotels", [])
+def __getattr__(name):
 
-        tours = data.get("tours", [])[:]
+    """Build the LangChain / CrewAI objects the first time they are looked up"""
 
-        attractions = data.get("attractions", [])[:]
+    if name in _LAZY_ATTRIBUTES:
 
-        hidden_gems = data.get("hidden_gems", [])
- 
-        shuffle(tours)
+        return _LAZY_ATTRIBUTES[name]()
 
-        shuffle(attractions)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
  
-        used_tours = set()
+def _set_usage(span, usage):
 
-        used_attractions = set()
- 
-        days = []
+    if usage:
+
+        span.set_attributes(**{
 
-        for i in range(num_days):
+            "llm.prompt_tokens": getattr(usage, "prompt_tokens", None),
 
-            today_tours = []
+            "llm.completion_tokens": getattr(usage, "completion_tokens", None)
 
-            today_attractions = []
+        })
  
-            for t in tours:
+async def complete_with_timing(messages, stage, endpoint, **labels):
 
-                t_id = t.get("TITLE") or t.get("URL")
+    """Run a Grok completion through llm_client as a timed stage and an llm.completion span; labels (city, trip_days) go to the usage accounting"""
 
-                if t_id not in used_tours:
+    with stage_timer(stage), start_span("llm.completion", stage=stage, stream=LLM_STREAM,
 
-                    today_tours.append(t)
+                                        prompt_chars=sum(len(m["content"]) for m in messages)) as span:
 
-                    used_tours.add(t_id)
+        params = completion_kwargs(messages)
 
-                if len(today_tours) == 2:
+        if LLM_STREAM:
 
-                    break
- 
-            for a in attractions:
+            params = completion_kwargs(messages, stream=True, stream_options={"include_usage": True})
 
-                a_id = a.get("PLACENAME") or a.get("URL")
+        result = await llm_client.complete(params, stage, endpoint)
 
-                if a_id not in used_attractions:
+        _set_usage(span, result.usage)
 
-                    today_attractions.append(a)
+        span.set_attributes(**{"model": result.model, "completion_chars": len(result.content),
 
-                    used_attractions.add(a_id)
+                               "llm.attempts": result.attempts, "llm.hedged": result.hedged})
 
-                if len(today_attractions) == 2:
+        llm_usage.record(endpoint, stage, result, messages, **labels)
 
-                    break
- 
-            hotel = find_closest_hotel(hotels, today_attractions)
+        return result.content
  
-            days.append({
-
-                "day": i + 1,
+def build_itinerary_prompt(data):
 
-                "date": date_list[i],
+    start = datetime.strptime(data["start_date"], "%Y-%m-%d")
 
-                "hotel": hotel,
+    end = datetime.strptime(data["end_date"], "%Y-%m-%d")
 
-                "tours": today_tours,
+    num_days = (end - start).days + 1
 
-                "attractions": today_attractions
+    hidden_gems = data.get("hidden_gems", [])
 
-            })
+    days = plan_days(data)
  
-        reduced_data = {
+    reduced_data = {
 
-            "city": data["city"],
+        "city": data["city"],
 
-            "start_date": data["start_date"],
+        "start_date": data["start_date"],
 
-            "end_date": data["end_date"],
+        "end_date": data["end_date"],
 
-            "travel_type": data["travel_type"],
+        "travel_type": data["travel_type"],
 
-            "adults": data["adults"],
+        "adults": data["adults"],
 
-            "kids": data["kids"],
+        "kids": data["kids"],
 
-            "budget": data["budget"],
+        "budget": data["budget"],
 
-            "days": days,
+        "days": days,
 
-            "hidden_gems": hidden_gems
+        "hidden_gems": hidden_gems
 
-        }
+    }
  
-        prompt = f'''
+    def render(reduced, indent):
+
+        return f'''
 
 You are a travel itinerary expert.
  
@@ -267,7 +281,7 @@ Fallback if missing: https://placehold.co/400x300
  
 📦 Input JSON:
 
-{json.dumps(reduced_data, indent=2, default=str)}
+{dumps(reduced, indent=indent)}
  
 📋 Output rules:
 
@@ -283,57 +297,54 @@ Fallback if missing: https://placehold.co/400x300
 
 - End with the "Hidden Gems" section styled distinctly from the rest of the itinerary.
 
-        '''
+    '''
  
-        response = completion(
+    # Shrinks reduced_data when the prompt would exceed the itinerary token budget
 
-            model="xai/grok-2-1212",
+    return llm_usage.fit_prompt("itinerary", render, reduced_data)
+ 
+async def run_crew_with_data(data):
 
-            messages=[{"role": "user", "content": prompt}],
+    try:
 
-            provider="grok",
+        # Prompt building is CPU work; keep it off the event loop
 
-            api_key=os.getenv("XAI_API_KEY")
+        with stage_timer("prompt_build"):
 
-        )
+            prompt = await asyncio.to_thread(sampled(build_itinerary_prompt), data)
  
-        return response['choices'][0]['message']['content']
+        trip_days = (datetime.strptime(data["end_date"], "%Y-%m-%d") - datetime.strptime(data["start_date"], "%Y-%m-%d")).days + 1
+
+        return await complete_with_timing([{"role": "user", "content": prompt}], "llm.itinerary", "itinerary",
+
+                                          city=data["city"], trip_days=trip_days)
  
     except Exception as e:
 
-        print("Grok call error:", e)
+        logger.error(f"Grok call error: {e}")
 
         raise RuntimeError(f"Failed to generate itinerary from Grok: {str(e)}")
  
-def run_chat_with_agent(itinerary_text: str, question: str):
+async def run_chat_with_agent(itinerary_text: str, question: str):
 
     try:
 
-        prompt = f"""You are a helpful travel assistant. Here is the travel itinerary:\n{itinerary_text}\n\nNow answer this question based on the itinerary only:\n{question}"""
- 
-        response = completion(
-
-            model="xai/grok-2-1212",
-
-            messages=[
+        # The whole itinerary is re-sent every turn; cut it down if it would exceed the chat token budget
 
-                {"role": "system", "content": "Only answer based on the given itinerary."},
+        itinerary_text = llm_usage.fit_text("chat", itinerary_text, reserved=llm_usage.estimate_tokens(question) + 100)
 
-                {"role": "user", "content": prompt}
+        prompt = f"""You are a helpful travel assistant. Here is the travel itinerary:\n{itinerary_text}\n\nNow answer this question based on the itinerary only:\n{question}"""
+ 
+        return await complete_with_timing([
 
-            ],
+            {"role": "system", "content": "Only answer based on the given itinerary."},
 
-            provider="grok",
+            {"role": "user", "content": prompt}
 
-            api_key=os.getenv("XAI_API_KEY")
-
-        )
- 
-        return response['choices'][0]['message']['content']
+        ], "llm.chat", "chat")
 
     except Exception as e:
 
-        print("Chat Grok call error:", e)
+        logger.error(f"Chat Grok call error: {e}")
 
         raise RuntimeError(f"Failed to get chat response from Grok: {str(e)}")
- 
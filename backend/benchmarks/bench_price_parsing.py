@@ -0,0 +1,149 @@
+"""
+Benchmark ticket-price parsing: legacy per-row regexes vs the precompiled
+single-pass parser vs the pandas batch path.
+
+Usage:
+    python benchmarks/bench_price_parsing.py [attractions.csv] [--rows N]
+
+Pass the attractions CSV produced by the attractions DAG
+(attractions_with_coords.csv) to benchmark the real "Ticket Details"
+distribution. Without it, a synthetic sample with the same shapes as the
+scraped TripHobo data is used (mostly "N/A", multi-line Adult/Child/Senior
+price lists, free-entry notes, a few USD amounts).
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import price_parsing
+
+SYNTHETIC_TICKET_DETAILS = [
+    ("N/A", 0.45),
+    ("Adult Price: ${adult}\nChild Price: ${child}\nSenior Price: ${senior}", 0.25),
+    ("Free entry", 0.08),
+    ("Admission is free for all visitors. Donations are welcome.", 0.05),
+    ("Tickets start from USD {adult} per person", 0.04),
+    ("General admission {adult} USD, children under 3 enter for no charge", 0.03),
+    ("Adult: $ {adult}.50, Child (3-12): ${child}", 0.06),
+    ("Prices vary by season, check the official website for details", 0.04),
+]
+
+
+def legacy_is_attraction_free(attraction):
+    ticket_details = str(attraction.get('Ticket Details', '')).lower()
+    free_keywords = ['free', 'no charge', 'no fee', 'free entry', 'free admission', '$0']
+    for keyword in free_keywords:
+        if keyword in ticket_details:
+            return True
+    price_value = legacy_extract_price_from_ticket_details(ticket_details)
+    if price_value == 0 and ticket_details:
+        return True
+    return False
+
+
+def legacy_extract_price_from_ticket_details(ticket_details):
+    if not ticket_details:
+        return 0
+    price_patterns = [
+        r'\$\s*(\d+(?:\.\d+)?)',
+        r'USD\s*(\d+(?:\.\d+)?)',
+        r'(\d+(?:\.\d+)?)\s*USD',
+        r'Adult(?:[^$])\$\s(\d+(?:\.\d+)?)',
+        r'Price(?:[^$])\$\s(\d+(?:\.\d+)?)'
+    ]
+    for pattern in price_patterns:
+        matches = re.findall(pattern, ticket_details)
+        if matches:
+            try:
+                return float(matches[0])
+            except ValueError:
+                continue
+    return 0
+
+
+def legacy_parse(values):
+    results = []
+    for value in values:
+        attraction = {'Ticket Details': value}
+        is_free = legacy_is_attraction_free(attraction)
+        price_value = 0
+        if not is_free:
+            price_value = legacy_extract_price_from_ticket_details(attraction.get('Ticket Details', ''))
+        results.append((is_free, price_value))
+    return results
+
+
+def precompiled_parse(values):
+    return [price_parsing.parse_ticket_details(value) for value in values]
+
+
+def batch_parse(values):
+    parsed = price_parsing.parse_ticket_details_batch(pd.Series(values, dtype=object))
+    return list(zip(parsed['IsFree'].tolist(), parsed['PriceValue'].tolist()))
+
+
+def synthetic_ticket_details(rows, seed=7):
+    rng = random.Random(seed)
+    templates = [template for template, _ in SYNTHETIC_TICKET_DETAILS]
+    weights = [weight for _, weight in SYNTHETIC_TICKET_DETAILS]
+    values = []
+    for template in rng.choices(templates, weights=weights, k=rows):
+        adult = rng.randint(12, 95)
+        values.append(template.format(adult=adult, child=max(0, adult - 8), senior=max(0, adult - 4)))
+    return values
+
+
+def load_ticket_details(csv_path, rows):
+    df = pd.read_csv(csv_path, on_bad_lines='skip')
+    values = df['Ticket Details'].astype(object).where(df['Ticket Details'].notna(), None).tolist()
+    if rows and len(values) < rows:
+        values = (values * (rows // max(len(values), 1) + 1))[:rows]
+    return values
+
+
+def best_of(func, values, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(values)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv", nargs="?", help="attractions CSV with a 'Ticket Details' column")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.csv:
+        values = load_ticket_details(args.csv, args.rows)
+        source = args.csv
+    else:
+        values = synthetic_ticket_details(args.rows)
+        source = "synthetic"
+
+    expected = legacy_parse(values)
+    for name, func in [("precompiled", precompiled_parse), ("batch", batch_parse)]:
+        if func(values) != expected:
+            raise SystemExit(f"{name} parser disagrees with the legacy implementation")
+
+    print(f"Ticket Details sample: {source}, {len(values)} rows")
+    baseline = None
+    for name, func in [("legacy", legacy_parse), ("precompiled", precompiled_parse), ("batch", batch_parse)]:
+        elapsed = best_of(func, values, args.repeat)
+        baseline = baseline or elapsed
+        print(f"  {name:<12} {elapsed * 1000:9.2f} ms  {elapsed / len(values) * 1e6:7.2f} us/row  "
+              f"x{baseline / elapsed:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
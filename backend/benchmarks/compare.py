@@ -0,0 +1,71 @@
+"""
+Regression report for saved pytest-benchmark runs.
+
+Usage (from backend/):
+    python benchmarks/compare.py [--baseline FILE] [--current FILE] [--threshold 0.15] [--stat median]
+
+Defaults to the most recent run saved with "baseline" in its name as the
+baseline and the newest saved run as the current one. Prints a markdown table
+and exits 1 if any benchmark got slower by more than the threshold. No
+baseline is committed (timings are machine-specific); see conftest.py.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+# Where conftest.py points pytest-benchmark, whatever the working directory
+STORAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+
+
+def saved_runs(storage=STORAGE):
+    """Saved run files, oldest first (pytest-benchmark numbers them 0001_, 0002_, ...)"""
+    return sorted(glob.glob(os.path.join(storage, "*", "*.json")), key=os.path.basename)
+
+
+def load_stats(path, stat):
+    with open(path, "r", encoding="utf-8") as f:
+        run = json.load(f)
+    return {bench["fullname"]: bench["stats"][stat] for bench in run["benchmarks"]}
+
+
+def compare(baseline, current, threshold):
+    """Yield (name, baseline, current, change, regressed) for benchmarks present in both runs"""
+    for name in sorted(set(baseline) & set(current)):
+        change = current[name] / baseline[name] - 1 if baseline[name] else 0.0
+        yield name, baseline[name], current[name], change, change > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline")
+    parser.add_argument("--current")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCHMARK_THRESHOLD", "0.15")))
+    parser.add_argument("--stat", default="median", choices=["min", "median", "mean", "max"])
+    args = parser.parse_args()
+
+    runs = saved_runs()
+    current = args.current or (runs[-1] if runs else None)
+    baseline = args.baseline or next((r for r in reversed(runs) if "baseline" in os.path.basename(r) and r != current), None)
+    if baseline is None and len(runs) >= 2:
+        baseline = runs[-2]
+    if not current or not baseline:
+        sys.exit("Need a saved baseline and a current run: pytest benchmarks --benchmark-save=baseline, then --benchmark-autosave")
+
+    rows = list(compare(load_stats(baseline, args.stat), load_stats(current, args.stat), args.threshold))
+    print(f"Baseline: {os.path.basename(baseline)}  Current: {os.path.basename(current)}  "
+          f"Stat: {args.stat}  Threshold: +{args.threshold:.0%}\n")
+    print("| Benchmark | Baseline (ms) | Current (ms) | Change | |")
+    print("|---|---:|---:|---:|---|")
+    for name, before, after, change, regressed in rows:
+        print(f"| {name.split('::')[-1]} | {before * 1000:.3f} | {after * 1000:.3f} | {change:+.1%} | "
+              f"{'REGRESSION' if regressed else ''} |")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"\n{regressions} regression(s) out of {len(rows)} benchmarks")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
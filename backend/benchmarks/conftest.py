@@ -0,0 +1,190 @@
+"""
+Fixtures for the offline hot-path benchmarks (pytest-benchmark).
+
+Everything runs on synthetic data shaped like the Snowflake catalog rows, so
+no credentials or network are needed. Catalog fixtures come in 100, 1k and
+10k items per city. Run from backend/:
+
+    pytest benchmarks --benchmark-save=baseline
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:15%
+    python benchmarks/compare.py            # markdown report of the last two saved runs
+
+Saved runs go to benchmarks/.benchmarks from any working directory, which is
+where compare.py looks. The directory is git-ignored because timings only
+compare on the same machine, so no baseline is committed: save one on the
+machine doing the comparison, from the commit to compare against (e.g. main
+before a change), then run the changed tree with --benchmark-autosave.
+"""
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from catalog_models import Attraction, Hotel, Tour
+
+# pytest-benchmark's default storage is relative to the working directory; compare.py reads this one
+STORAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+DEFAULT_STORAGE = "file://./.benchmarks"
+
+CATALOG_SIZES = [100, 1000, 10000]
+TRIP_DAYS = 14
+
+# Roughly Manhattan; most items end up within a few km of each other like the real data
+CENTER_LAT, CENTER_LON = 40.758, -73.9855
+SPREAD = 0.08
+
+NEIGHBOURHOODS = ["Midtown", "SoHo", "Harlem", "Chelsea", "Tribeca", "Williamsburg", "Astoria"]
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """Anchor the run storage to this directory unless --benchmark-storage was given"""
+    if config.getoption("benchmark_storage", None) == DEFAULT_STORAGE:
+        config.option.benchmark_storage = "file://" + STORAGE
+
+
+def _coordinates(rng):
+    return round(CENTER_LAT + rng.uniform(-SPREAD, SPREAD), 6), round(CENTER_LON + rng.uniform(-SPREAD, SPREAD), 6)
+
+
+def make_hotels(size, rng):
+    hotels = []
+    for i in range(size):
+        lat, lon = _coordinates(rng)
+        price = rng.randint(60, 900)
+        hotels.append(Hotel.from_dict({
+            "NAME": f"Hotel {i}",
+            "ADDRESS": f"{i} {rng.choice(NEIGHBOURHOODS)} Ave, New York",
+            "CITY": "New York",
+            "RATING": round(rng.uniform(2.5, 5.0), 1),
+            "REVIEWS": rng.randint(5, 4000),
+            "Price (per night)": f"${price}",
+            "PriceValue": float(price),
+            "LATITUDE": lat,
+            "LONGITUDE": lon
+        }))
+    return hotels
+
+
+def make_tours(size, rng):
+    tours = []
+    for i in range(size):
+        price = rng.randint(15, 400)
+        tours.append(Tour.from_dict({
+            "TITLE": f"{rng.choice(NEIGHBOURHOODS)} walking tour {i}",
+            "CITY": "New York",
+            "RATING": round(rng.uniform(3.0, 5.0), 1),
+            "Review Count": rng.randint(1, 2500),
+            "PRICE": f"${price}",
+            "PriceValue": float(price),
+            "URL": f"https://example.com/tours/{i}",
+            "IMAGE": f"https://example.com/tours/{i}.jpg"
+        }))
+    return tours
+
+
+def make_attractions(size, rng):
+    attractions = []
+    for i in range(size):
+        lat, lon = _coordinates(rng)
+        free = rng.random() < 0.3
+        price = 0.0 if free else float(rng.randint(5, 80))
+        attractions.append(Attraction.from_dict({
+            "PLACENAME": f"{rng.choice(NEIGHBOURHOODS)} landmark {i}",
+            "CITY": "New York",
+            "RATING": round(rng.uniform(3.0, 5.0), 1),
+            "Ticket Details": "Free entry" if free else f"Adult Price: ${price:.0f}",
+            "IsFree": free,
+            "PriceValue": price,
+            "LATITUDE": lat,
+            "LONGITUDE": lon,
+            "URL": f"https://example.com/attractions/{i}",
+            "DESCRIPTION": "A well-loved stop with views over the city. " * 3
+        }))
+    return attractions
+
+
+@pytest.fixture(scope="session", params=CATALOG_SIZES, ids=lambda size: f"size={size}")
+def catalog(request):
+    """One city's hotels, tours and attractions at the parametrized size"""
+    rng = random.Random(request.param)
+    return {
+        "size": request.param,
+        "hotels": make_hotels(request.param, rng),
+        "tours": make_tours(request.param, rng),
+        "attractions": make_attractions(request.param, rng)
+    }
+
+
+@pytest.fixture(scope="session")
+def local_catalog_db(catalog, tmp_path_factory):
+    """The synthetic catalog seeded into a local SQLite catalog (CATALOG_BACKEND=sqlite)"""
+    import pandas as pd
+    from local_catalog import seed_catalog
+
+    path = str(tmp_path_factory.mktemp("catalog") / f"catalog_{catalog['size']}.sqlite")
+    frames = {name: pd.DataFrame([record.to_dict() for record in catalog[name]])
+              for name in ("hotels", "tours", "attractions")}
+    seed_catalog(path, **frames)
+    return path
+
+
+@pytest.fixture(scope="session")
+def catalog_snapshot_dir(catalog, tmp_path_factory):
+    """The synthetic catalog written as a memory-mapped Arrow snapshot (CATALOG_BACKEND=snapshot)"""
+    import pandas as pd
+    from catalog_snapshot import write_snapshot
+
+    directory = str(tmp_path_factory.mktemp("snapshots") / f"size_{catalog['size']}")
+    frames = {name: pd.DataFrame([record.to_dict() for record in catalog[name]])
+              for name in ("hotels", "tours", "attractions")}
+    write_snapshot(directory, **frames)
+    return directory
+
+
+def make_itinerary_html(days, items_per_section=2):
+    """HTML in the shape the itinerary prompt asks Grok for"""
+    start = date(2025, 5, 1)
+    parts = ['<div class="header"><h1>New York Travel Itinerary</h1><p>Trip for 2 adults and 1 kid.</p></div>']
+    for day in range(1, days + 1):
+        parts.append(f'<div class="day-card"><h2>Day {day} - {start + timedelta(days=day - 1)}</h2>')
+        parts.append('<div class="item-section"><h3>Hotel</h3><ul>'
+                     f'<li><strong>Hotel {day}</strong></li><li>Address: {day} Broadway</li>'
+                     '<li>Rating: 4.5 (1200 reviews)</li><li>Price: $250</li></ul></div>')
+        for section in ("Tours", "Attractions"):
+            parts.append(f'<div class="item-section"><h3>{section}</h3>')
+            for item in range(items_per_section):
+                parts.append(f'<h3>{section[:-1]} {day}.{item}</h3>'
+                             '<p>Description: A long description of what makes this stop worth the time. ' * 2 +
+                             '</p><div class="image-block"><img src="https://placehold.co/400x300" /></div>')
+            parts.append('</div>')
+        parts.append('</div>')
+    parts.append('<div class="hidden-gems"><h2>Hidden Gems of New York</h2>')
+    for gem in range(5):
+        parts.append(f'<h3>Gem {gem}</h3><p>Insider tip {gem}: go early and try the dumplings.</p>')
+    parts.append('</div>')
+    return "".join(parts)
+
+
+def make_itinerary_text(days):
+    """Text in the shape convert_itinerary_to_text produces, as sent to /generate-pdf"""
+    lines = []
+    for day in range(1, days + 1):
+        lines.append(f"Day {day}: Exploring New York")
+        lines.append(f"Hotel: Hotel {day}")
+        lines.append(f"Address: {day} Broadway, New York")
+        for tour in range(2):
+            lines.append(f"Tour {tour + 1}: Neighbourhood walking tour {day}.{tour}, Rating 4.7, Price $45")
+        for attraction in range(2):
+            lines.append(f"Attractions: Landmark {day}.{attraction}")
+            lines.append("Ticket Details: Adult Price: $25")
+            lines.append("Description: A long description of what makes this stop worth the time. " * 2)
+            lines.append("How to Reach: Subway to 42 St")
+            lines.append("Hours: 9am - 6pm")
+    lines.append("HIDDEN GEMS")
+    lines.extend(f"Gem {gem}: go early and try the dumplings." for gem in range(5))
+    return "\n".join(lines)
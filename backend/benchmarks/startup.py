@@ -0,0 +1,131 @@
+"""
+Cold start of the backend: a fresh interpreter importing main, then serving the
+first /generate-itinerary, as a new Cloud Run instance would.
+
+Every measurement runs in a new process so nothing is warm. The first request
+runs offline: the catalog comes from a seeded local SQLite file, there are no
+vector shards (hidden gems use the fallback data) and the Grok completion is
+replayed from a cassette with CASSETTE_LATENCY_SCALE=0, so the numbers are the
+backend's own startup cost. The child also reports which generator served the
+request and which heavy AI frameworks ended up imported; the request path
+should not need the agent frameworks.
+
+Run from backend/:
+    python benchmarks/startup.py             # one cold start, printed as JSON
+    pytest benchmarks -k startup             # tracked with the other benchmarks
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+HEAVY_MODULES = ["crewai", "langchain", "litellm", "openai", "pinecone", "snowflake.connector"]
+STARTUP_MODEL = "startup-benchmark"
+STARTUP_CITY = "New York"
+STARTUP_DAYS = 3
+
+
+def prepare(directory):
+    """Seed the local catalog and record the itinerary completion; returns the child's environment"""
+    import pandas as pd
+    import cassettes
+    from conftest import make_attractions, make_hotels, make_tours
+    from local_catalog import seed_catalog
+    from loadtest.fake_llm_server import canned_output
+
+    rng = random.Random(0)
+    catalog_path = os.path.join(directory, "catalog.sqlite")
+    seed_catalog(catalog_path, **{
+        name: pd.DataFrame([record.to_dict() for record in make(200, rng)])
+        for name, make in (("hotels", make_hotels), ("tours", make_tours), ("attractions", make_attractions))
+    })
+
+    cassette_dir = os.path.join(directory, "cassettes")
+    html = canned_output([{"content": f"{STARTUP_DAYS}-day HTML travel itinerary"}])
+
+    def stream(**params):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=html))], usage=None)
+
+    mode, cassette_dir_before = cassettes.CASSETTE_MODE, cassettes.CASSETTE_DIR
+    cassettes.CASSETTE_MODE, cassettes.CASSETTE_DIR = "record", cassette_dir
+    try:
+        list(cassettes.completion(stream, "llm.itinerary", model=STARTUP_MODEL, messages=[], stream=True))
+    finally:
+        cassettes.CASSETTE_MODE, cassettes.CASSETTE_DIR = mode, cassette_dir_before
+
+    env = dict(
+        os.environ,
+        CATALOG_BACKEND="sqlite",
+        LOCAL_CATALOG_PATH=catalog_path,
+        HIDDEN_GEMS_BACKEND="local",
+        LOCAL_VECTOR_DIR=os.path.join(directory, "vectors"),
+        CASSETTE_MODE="replay",
+        CASSETTE_DIR=cassette_dir,
+        CASSETTE_LATENCY_SCALE="0",
+        LLM_MODEL=STARTUP_MODEL,
+        LLM_STREAM="true",
+        TRACING_EXPORTER="none"
+    )
+    env.setdefault("XAI_API_KEY", "startup-benchmark")  # main.py requires it; replay never sends it
+    return env
+
+
+def measure(env):
+    """One cold start in a new interpreter -> {import_seconds, first_request_seconds, status, generator, heavy_modules}"""
+    result = subprocess.run([sys.executable, __file__, "--child"], env=env, cwd=BACKEND_DIR,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup child failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def child():
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+    from datetime import date, timedelta
+    client = TestClient(main.app)
+    trip_start = date.today() + timedelta(days=30)
+    payload = {
+        "city": STARTUP_CITY,
+        "start_date": str(trip_start),
+        "end_date": str(trip_start + timedelta(days=STARTUP_DAYS - 1)),
+        "preference": "Suggest an itinerary with Tours, Accommodation, Things to do",
+        "travel_type": "Solo",
+        "adults": 1,
+        "kids": 0,
+        "budget": "medium",
+        "include_tours": True,
+        "include_accommodation": True,
+        "include_things": True
+    }
+    request_start = time.perf_counter()
+    response = client.post("/generate-itinerary", json=payload)
+    finished = time.perf_counter()
+
+    sys.stdout.flush()
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "first_request_seconds": finished - request_start,
+        "status": response.status_code,
+        "generator": response.json()["data"]["generator"] if response.status_code == 200 else None,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]
+    }))
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child()
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            print(json.dumps(measure(prepare(directory)), indent=2))
@@ -0,0 +1,83 @@
+"""Hot paths of an itinerary request, benchmarked on synthetic catalogs"""
+from unittest.mock import patch
+
+import pytest
+
+import catalog_snapshot
+import snowflake_fetch
+
+from conftest import TRIP_DAYS, make_itinerary_html, make_itinerary_text
+from generate_pdf import create_itinerary_pdf
+from itinerary_planning import plan_days
+from llm_formating import convert_itinerary_to_text
+from snowflake_fetch import find_best_hotel_near_attractions, get_nearby_attractions, sort_hotels_by_value
+
+
+@pytest.mark.benchmark(group="fetch_layer")
+@pytest.mark.parametrize("fetch", ["fetch_hotels", "fetch_tours", "fetch_attractions"])
+def test_fetch_layer_local_catalog(benchmark, catalog, local_catalog_db, fetch):
+    with patch.object(snowflake_fetch, "CATALOG_BACKEND", "sqlite"), \
+         patch.object(snowflake_fetch, "LOCAL_CATALOG_PATH", local_catalog_db), \
+         patch("builtins.print"):
+        # Drop the catalog cache before each round so every call pays for the query
+        results = benchmark.pedantic(getattr(snowflake_fetch, fetch), rounds=20,
+                                     setup=lambda: (snowflake_fetch.invalidate_catalog(), (("New York", "medium"), {}))[1])
+    assert results
+
+
+@pytest.mark.benchmark(group="fetch_layer")
+@pytest.mark.parametrize("fetch", ["fetch_hotels", "fetch_tours", "fetch_attractions"])
+def test_fetch_layer_snapshot(benchmark, catalog, catalog_snapshot_dir, fetch):
+    with patch.object(snowflake_fetch, "CATALOG_BACKEND", "snapshot"), \
+         patch.object(catalog_snapshot, "_reader", catalog_snapshot.SnapshotReader(catalog_snapshot_dir)), \
+         patch("builtins.print"):
+        results = benchmark(getattr(snowflake_fetch, fetch), "New York", "medium")
+    assert results
+
+
+@pytest.mark.benchmark(group="sort_hotels_by_value")
+@pytest.mark.parametrize("budget", ["low", "medium", "high"])
+def test_sort_hotels_by_value(benchmark, catalog, budget):
+    ranked = benchmark(sort_hotels_by_value, catalog["hotels"], budget)
+    assert len(ranked) == catalog["size"]
+
+
+@pytest.mark.benchmark(group="get_nearby_attractions")
+def test_get_nearby_attractions(benchmark, catalog):
+    nearby = benchmark(get_nearby_attractions, catalog["attractions"], 3, 3.0)
+    assert len(nearby) == 3
+
+
+@pytest.mark.benchmark(group="find_best_hotel_near_attractions")
+def test_find_best_hotel_near_attractions(benchmark, catalog):
+    attractions = catalog["attractions"][:3]
+    assert benchmark(find_best_hotel_near_attractions, catalog["hotels"], attractions) is not None
+
+
+@pytest.mark.benchmark(group="plan_days")
+def test_plan_days(benchmark, catalog):
+    data = {
+        "start_date": "2025-05-01",
+        "end_date": f"2025-05-{TRIP_DAYS:02d}",
+        "hotels": catalog["hotels"],
+        "tours": catalog["tours"],
+        "attractions": catalog["attractions"]
+    }
+    days = benchmark(plan_days, data)
+    assert len(days) == TRIP_DAYS
+
+
+@pytest.mark.benchmark(group="convert_itinerary_to_text")
+@pytest.mark.parametrize("days", [TRIP_DAYS, 60], ids=lambda days: f"days={days}")
+def test_convert_itinerary_to_text(benchmark, days):
+    html = make_itinerary_html(days)
+    text = benchmark(convert_itinerary_to_text, html)
+    assert f"Day {days}" in text
+
+
+@pytest.mark.benchmark(group="create_itinerary_pdf")
+def test_create_itinerary_pdf(benchmark):
+    # A city without a default cover image, so nothing is downloaded
+    itinerary = make_itinerary_text(TRIP_DAYS)
+    pdf = benchmark(create_itinerary_pdf, "Boston", itinerary, "2025-05-01")
+    assert pdf.getbuffer().nbytes > 0
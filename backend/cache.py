@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small thread-safe cache whose entries expire after a fixed number of seconds.
+    With stale_ttl, expired entries are kept that much longer for get_stale(),
+    so callers can serve the last good value while its source is unavailable.
+    With max_entries, the least recently used entries are evicted beyond that
+    many, for caches keyed by open-ended input.
+    """
+
+    def __init__(self, ttl, clock=time.monotonic, stale_ttl=0, max_entries=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, allow_stale):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        now = self._clock()
+        if expires_at + self.stale_ttl <= now:
+            del self._entries[key]
+            return None
+        if expires_at <= now and not allow_stale:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key, allow_stale=False)
+        return default if entry is None else entry[1]
+
+    def get_stale(self, key, default=None):
+        """The value even if it has expired, as long as it is within stale_ttl"""
+        with self._lock:
+            entry = self._lookup(key, allow_stale=True)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, predicate=None, keep_stale=False):
+        """
+        Drop every entry, or only the entries whose key matches predicate. With
+        keep_stale they are expired instead, still available to get_stale().
+        Returns the count.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            now = self._clock()
+            for key in keys:
+                if keep_stale:
+                    self._entries[key] = (min(self._entries[key][0], now), self._entries[key][1])
+                else:
+                    del self._entries[key]
+            return len(keys)
+
+    def keys(self):
+        """Keys of the entries that have not expired"""
+        now = self._clock()
+        with self._lock:
+            return [key for key, (expires_at, _) in self._entries.items() if expires_at > now]
+
+    def __len__(self):
+        return len(self.keys())
@@ -0,0 +1,449 @@
+"""
+Record/replay of external service calls.
+
+CASSETTE_MODE selects the behaviour of every wrapped client:
+    off      (default) calls go straight through
+    record   real calls are made and their responses and latencies appended to
+             <CASSETTE_DIR>/<name>.pkl.gz
+    replay   no network: responses come from the cassette, after sleeping the
+             recorded latency times CASSETTE_LATENCY_SCALE (0 disables sleeping)
+
+Each cassette is a stream of gzip members, one pickled interaction each, so
+recording only ever appends and a crash loses at most the call in flight.
+Cassettes hold real payloads and are unpickled on load: only replay files you
+recorded yourself.
+
+Replay matches on a key built from the request. Some requests never repeat
+exactly (prompts embed shuffled catalog rows, images vary per itinerary), so
+wrappers can name a group; on a key miss the next recording from the same
+group is replayed instead. A miss with no group raises CassetteMiss.
+
+Wrappers: connection() for DB-API (Snowflake), proxy() for client objects
+(Pinecone index), completion() / acompletion() for litellm including
+streaming, call() for any other function (requests.get, YouTube,
+transcripts, embeddings, S3).
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from types import SimpleNamespace
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", os.path.join(os.path.dirname(__file__), "data", "cassettes"))
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+def recording():
+    return CASSETTE_MODE == "record"
+
+
+def replaying():
+    return CASSETTE_MODE == "replay"
+
+
+def request_key(*parts):
+    encoded = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _sleep(seconds):
+    if seconds > 0 and CASSETTE_LATENCY_SCALE > 0:
+        time.sleep(seconds * CASSETTE_LATENCY_SCALE)
+
+
+async def _async_sleep(seconds):
+    if seconds > 0 and CASSETTE_LATENCY_SCALE > 0:
+        await asyncio.sleep(seconds * CASSETTE_LATENCY_SCALE)
+
+
+class Cassette:
+    """Interactions of one service, keyed by request and optionally grouped"""
+
+    def __init__(self, name, directory=None):
+        self.name = name
+        self.path = os.path.join(directory or CASSETTE_DIR, f"{name}.pkl.gz")
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_group = {}
+        self._positions = {}
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        with gzip.open(self.path, "rb") as f:
+            while True:
+                try:
+                    self._index(pickle.load(f))
+                except EOFError:
+                    break
+
+    def _index(self, interaction):
+        self._by_key.setdefault(interaction["key"], []).append(interaction)
+        if interaction.get("group") is not None:
+            self._by_group.setdefault(interaction["group"], []).append(interaction)
+
+    def append(self, interaction):
+        with self._lock:
+            self._load()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            try:
+                payload = pickle.dumps(interaction)
+                pickle.loads(payload)  # exceptions with custom __init__ pickle fine but fail to load
+            except Exception:
+                if interaction.get("error") is None:
+                    raise
+                interaction = dict(interaction, error=RuntimeError(repr(interaction["error"])))
+                payload = pickle.dumps(interaction)
+            with gzip.open(self.path, "ab") as f:
+                f.write(payload)
+            self._index(interaction)
+
+    def _next(self, bucket_name, interactions):
+        position = self._positions.get(bucket_name, 0)
+        self._positions[bucket_name] = position + 1
+        return interactions[position % len(interactions)]
+
+    def lookup(self, key, group=None):
+        with self._lock:
+            self._load()
+            if key in self._by_key:
+                return self._next(("key", key), self._by_key[key])
+            if group is not None and group in self._by_group:
+                return self._next(("group", group), self._by_group[group])
+        raise CassetteMiss(f"No recording in {self.path} for key {key[:12]}" + (f" or group {group}" if group else ""))
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return sum(len(v) for v in self._by_key.values())
+
+
+def get_cassette(name):
+    with _cassettes_lock:
+        cassette = _cassettes.get(name)
+        if cassette is None or os.path.dirname(cassette.path) != CASSETTE_DIR:
+            cassette = _cassettes[name] = Cassette(name)
+        return cassette
+
+
+def call(name, key_parts, fn, *args, group=None, to_record=None, from_record=None, **kwargs):
+    """
+    Run fn(*args, **kwargs) through the named cassette. to_record turns the
+    response into picklable data when recording; from_record rebuilds what the
+    caller expects when replaying. Exceptions are recorded and re-raised too.
+    """
+    if CASSETTE_MODE not in ("record", "replay"):
+        return fn(*args, **kwargs)
+    cassette = get_cassette(name)
+    key = request_key(*key_parts)
+
+    if replaying():
+        interaction = cassette.lookup(key, group)
+        _sleep(interaction["latency"])
+        if interaction.get("error") is not None:
+            raise interaction["error"]
+        response = interaction["response"]
+        return from_record(response) if from_record else response
+
+    start = time.perf_counter()
+    try:
+        response = fn(*args, **kwargs)
+    except Exception as e:
+        cassette.append({"key": key, "group": group, "latency": time.perf_counter() - start,
+                         "response": None, "error": e})
+        raise
+    latency = time.perf_counter() - start
+    cassette.append({"key": key, "group": group, "latency": latency,
+                     "response": to_record(response) if to_record else response, "error": None})
+    return response
+
+
+# ---------------- DB-API (Snowflake) ---------------- #
+
+class CassetteCursor:
+    """Records execute + fetchall per query; replays them without a database"""
+
+    def __init__(self, name, cursor=None):
+        self.name = name
+        self._cursor = cursor
+        self._result = None
+        self.description = None
+        self.sfqid = None
+
+    def execute(self, query, *args, **kwargs):
+        def run():
+            self._cursor.execute(query, *args, **kwargs)
+            executed = time.perf_counter()
+            rows = self._cursor.fetchall()
+            return {
+                "description": [tuple(column)[:2] for column in self._cursor.description or []],
+                "rows": rows,
+                "fetch_latency": time.perf_counter() - executed,
+                "sfqid": getattr(self._cursor, "sfqid", None)
+            }
+
+        self._result = call(self.name, ("execute", query, args), run)
+        self.description = self._result["description"]
+        self.sfqid = self._result["sfqid"]
+        return self
+
+    def fetchall(self):
+        if replaying():
+            _sleep(self._result["fetch_latency"])
+        rows, self._result = self._result["rows"], dict(self._result, rows=[])
+        return rows
+
+    def fetchone(self):
+        rows = self._result["rows"]
+        if not rows:
+            return None
+        self._result = dict(self._result, rows=rows[1:])
+        return rows[0]
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+
+
+class CassetteConnection:
+    def __init__(self, name, connection=None):
+        self.name = name
+        self._connection = connection
+
+    def cursor(self):
+        return CassetteCursor(self.name, self._connection.cursor() if self._connection is not None else None)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+
+def connection(name, factory):
+    """A DB-API connection from factory(), recorded or replayed per CASSETTE_MODE"""
+    if replaying():
+        return CassetteConnection(name)
+    if recording():
+        return CassetteConnection(name, factory())
+    return factory()
+
+
+# ---------------- Client objects (Pinecone index) ---------------- #
+
+class CassetteProxy:
+    """
+    Wraps selected methods of a client. methods maps a method name to a dict
+    with optional key(kwargs) -> parts, group(kwargs) -> str, to_record and
+    from_record. Other attributes pass through to the real client.
+    """
+
+    def __init__(self, name, target, methods):
+        self._name = name
+        self._target = target
+        self._methods = methods
+
+    def __getattr__(self, attribute):
+        spec = self._methods.get(attribute)
+        if spec is None:
+            if self._target is None:
+                raise AttributeError(f"{attribute} is not available while replaying {self._name}")
+            return getattr(self._target, attribute)
+
+        def method(*args, **kwargs):
+            key_parts = spec["key"](kwargs) if "key" in spec else (args, kwargs)
+            group = spec["group"](kwargs) if "group" in spec else None
+            target = getattr(self._target, attribute) if self._target is not None else None
+            return call(self._name, (attribute, key_parts), target, *args, group=group,
+                        to_record=spec.get("to_record"), from_record=spec.get("from_record"), **kwargs)
+        return method
+
+
+def proxy(name, factory, methods):
+    if replaying():
+        return CassetteProxy(name, None, methods)
+    if recording():
+        return CassetteProxy(name, factory(), methods)
+    return factory()
+
+
+def query_response_to_record(response):
+    """Pinecone QueryResponse (or the local index's namespace) -> plain data"""
+    return [
+        {"id": m.id, "score": m.score, "metadata": dict(m.metadata or {}),
+         "values": list(m.values) if getattr(m, "values", None) else None}
+        for m in response.matches
+    ]
+
+
+def query_response_from_record(matches):
+    return SimpleNamespace(matches=[SimpleNamespace(**match) for match in matches])
+
+
+PINECONE_QUERY = {
+    "key": lambda kwargs: (
+        kwargs.get("filter"), kwargs.get("top_k"), kwargs.get("include_values"),
+        [round(float(v), 5) for v in kwargs.get("vector") or []]
+    ),
+    "group": lambda kwargs: json.dumps(kwargs.get("filter"), sort_keys=True, default=str),
+    "to_record": query_response_to_record,
+    "from_record": query_response_from_record
+}
+
+
+# ---------------- litellm completions ---------------- #
+
+def _usage_to_record(usage):
+    if not usage:
+        return None
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None)}
+
+
+def _chunk(content=None, usage=None):
+    choices = [] if content is None else [SimpleNamespace(delta=SimpleNamespace(content=content))]
+    return SimpleNamespace(choices=choices, usage=SimpleNamespace(**usage) if usage else None)
+
+
+def _replay_stream(chunks):
+    for delay, content, usage in chunks:
+        _sleep(delay)
+        yield _chunk(content, usage)
+
+
+def _record_stream(cassette, key, group, stream, start):
+    chunks = []
+    previous = start
+    try:
+        for chunk in stream:
+            now = time.perf_counter()
+            choices = getattr(chunk, "choices", None)
+            content = getattr(choices[0].delta, "content", None) if choices else None
+            chunks.append((now - previous, content, _usage_to_record(getattr(chunk, "usage", None))))
+            previous = now
+            yield chunk
+    finally:
+        cassette.append({"key": key, "group": group, "latency": 0.0, "response": {"chunks": chunks}, "error": None})
+
+
+async def _async_replay_stream(chunks):
+    for delay, content, usage in chunks:
+        await _async_sleep(delay)
+        yield _chunk(content, usage)
+
+
+async def _async_record_stream(cassette, key, group, stream, start):
+    chunks = []
+    previous = start
+    try:
+        async for chunk in stream:
+            now = time.perf_counter()
+            choices = getattr(chunk, "choices", None)
+            content = getattr(choices[0].delta, "content", None) if choices else None
+            chunks.append((now - previous, content, _usage_to_record(getattr(chunk, "usage", None))))
+            previous = now
+            yield chunk
+    finally:
+        cassette.append({"key": key, "group": group, "latency": 0.0, "response": {"chunks": chunks}, "error": None})
+
+
+def _completion_to_record(response):
+    return {"content": response['choices'][0]['message']['content'], "usage": _usage_to_record(response.get('usage'))}
+
+
+def _completion_from_record(data):
+    return {"choices": [{"message": {"content": data["content"]}}],
+            "usage": SimpleNamespace(**data["usage"]) if data["usage"] else None}
+
+
+def completion(completion_fn, stage, **params):
+    """
+    litellm.completion through the "llm" cassette. Prompts are matched exactly
+    first, then by model + stage + streaming. Streams replay chunk by chunk with
+    the recorded gaps, so time to first token is preserved.
+    """
+    if CASSETTE_MODE not in ("record", "replay"):
+        return completion_fn(**params)
+    stream = bool(params.get("stream"))
+    key_parts = (params.get("model"), params.get("messages"), stream)
+    group = f"{params.get('model')}:{stage}:{'stream' if stream else 'blocking'}"
+
+    if stream:
+        cassette = get_cassette("llm")
+        key = request_key(*key_parts)
+        if replaying():
+            interaction = cassette.lookup(key, group)
+            if interaction.get("error") is not None:
+                _sleep(interaction["latency"])
+                raise interaction["error"]
+            return _replay_stream(interaction["response"]["chunks"])
+        start = time.perf_counter()
+        try:
+            response = completion_fn(**params)
+        except Exception as e:
+            cassette.append({"key": key, "group": group, "latency": time.perf_counter() - start,
+                             "response": None, "error": e})
+            raise
+        return _record_stream(cassette, key, group, response, start)
+
+    return call("llm", key_parts, completion_fn, group=group,
+                to_record=_completion_to_record, from_record=_completion_from_record, **params)
+
+
+async def acompletion(acompletion_fn, stage, **params):
+    """completion() for litellm.acompletion: same cassette, keys and groups, replayed without blocking the loop"""
+    if CASSETTE_MODE not in ("record", "replay"):
+        return await acompletion_fn(**params)
+    stream = bool(params.get("stream"))
+    cassette = get_cassette("llm")
+    key = request_key(params.get("model"), params.get("messages"), stream)
+    group = f"{params.get('model')}:{stage}:{'stream' if stream else 'blocking'}"
+
+    if replaying():
+        interaction = cassette.lookup(key, group)
+        if interaction.get("error") is not None:
+            await _async_sleep(interaction["latency"])
+            raise interaction["error"]
+        if stream:
+            return _async_replay_stream(interaction["response"]["chunks"])
+        await _async_sleep(interaction["latency"])
+        return _completion_from_record(interaction["response"])
+
+    start = time.perf_counter()
+    try:
+        response = await acompletion_fn(**params)
+    except Exception as e:
+        cassette.append({"key": key, "group": group, "latency": time.perf_counter() - start,
+                         "response": None, "error": e})
+        raise
+    if stream:
+        return _async_record_stream(cassette, key, group, response, start)
+    cassette.append({"key": key, "group": group, "latency": time.perf_counter() - start,
+                     "response": _completion_to_record(response), "error": None})
+    return response
+
+
+# ---------------- HTTP ---------------- #
+
+def http_get(name, get_fn, url, group=None, **kwargs):
+    """requests.get through a cassette; replays return status_code, content and headers"""
+    return call(
+        name, (url,), get_fn, url, group=group,
+        to_record=lambda r: {"status_code": r.status_code, "content": r.content, "headers": dict(r.headers)},
+        from_record=lambda d: SimpleNamespace(**d),
+        **kwargs
+    )
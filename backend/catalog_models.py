@@ -0,0 +1,227 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CatalogRecord:
+    """
+    Compact record for a catalog row.
+
+    Values live in __slots__ instead of a per-item dict. Items still support
+    dict-style access by their Snowflake column name (item.get('Ticket Details'),
+    item['PriceValue'] = ...) so existing callers keep working. Slots that were
+    never assigned behave like missing keys.
+    """
+    __slots__ = ("extra",)
+
+    # Snowflake column name -> slot name (aliases may share a slot)
+    COLUMNS = {}
+    # (canonical column name, slot name) in output order
+    FIELDS = ()
+
+    def __init__(self, **values):
+        for key, value in values.items():
+            self[key] = value
+
+    @classmethod
+    def from_row(cls, columns, row):
+        """Build a record from a cursor row, converting Decimal values to float"""
+        record = cls.__new__(cls)
+        for column, value in zip(columns, row):
+            if isinstance(value, Decimal):
+                value = float(value)
+            record[column] = value
+        return record
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls.from_row(data.keys(), data.values())
+
+    def _slot(self, key):
+        return self.COLUMNS.get(key)
+
+    def __getitem__(self, key):
+        slot = self._slot(key)
+        try:
+            if slot:
+                return getattr(self, slot)
+            return self.extra[key]
+        except (AttributeError, KeyError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        slot = self._slot(key)
+        if slot:
+            setattr(self, slot, value)
+            return
+        extra = getattr(self, "extra", None)
+        if extra is None:
+            extra = self.extra = {}
+        extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def items(self):
+        pairs = []
+        for column, slot in self.FIELDS:
+            try:
+                pairs.append((column, getattr(self, slot)))
+            except AttributeError:
+                continue
+        extra = getattr(self, "extra", None)
+        if extra:
+            pairs.extend(extra.items())
+        return pairs
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def copy(self):
+        clone = self.__class__.__new__(self.__class__)
+        for key, value in self.items():
+            clone[key] = value
+        return clone
+
+    def __eq__(self, other):
+        if not isinstance(other, CatalogRecord):
+            return NotImplemented
+        return type(self) is type(other) and self.items() == other.items()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+
+def _record_type(name, columns):
+    fields = {}
+    for column, slot in columns.items():
+        fields.setdefault(slot, column)
+    return type(name, (CatalogRecord,), {
+        "__slots__": tuple(fields),
+        "COLUMNS": dict(columns),
+        "FIELDS": tuple((column, slot) for slot, column in fields.items()),
+    })
+
+
+Hotel = _record_type("Hotel", {
+    "CITY": "city",
+    "NAME": "name",
+    "LINK": "link",
+    "IMAGE": "image",
+    "ADDRESS": "address",
+    "DISTANCE": "distance",
+    "RATING": "rating",
+    "REVIEWS": "reviews",
+    "Price (per night)": "price_text",
+    "Room Fees": "room_fees",
+    "EXCLUSIONS": "exclusions",
+    "CERTIFIED": "certified",
+    "LATITUDE": "latitude",
+    "LONGITUDE": "longitude",
+    "CALCULATIONMETHOD": "calculation_method",
+    "PriceValue": "price_value",
+    "PRICEVALUE": "price_value",
+    "ValueScore": "value_score",
+})
+
+Tour = _record_type("Tour", {
+    "URL": "url",
+    "TITLE": "title",
+    "RATING": "rating",
+    "Review Count": "review_count",
+    "PRICE": "price_text",
+    "OVERVIEW": "overview",
+    "Know More": "know_more",
+    "ITINERARY": "itinerary",
+    "INCLUSIONS": "inclusions",
+    "EXCLUSIONS": "exclusions",
+    "Additional Info": "additional_info",
+    "Key Details": "key_details",
+    "REVIEWS": "reviews",
+    "IMAGE": "image",
+    "CITY": "city",
+    "Short Reviews": "short_reviews",
+    "LATITUDE": "latitude",
+    "LONGITUDE": "longitude",
+    "PLACENAME": "place_name",
+    "FORMATTEDADDRESS": "formatted_address",
+    "PriceValue": "price_value",
+    "PRICEVALUE": "price_value",
+})
+
+Attraction = _record_type("Attraction", {
+    "URL": "url",
+    "DESCRIPTION": "description",
+    "Travel Tips": "travel_tips",
+    "Ticket Details": "ticket_details",
+    "HOURS": "hours",
+    "How to Reach": "how_to_reach",
+    "Restaurants Nearby": "restaurants_nearby",
+    "IMAGE": "image",
+    "CITY": "city",
+    "Short Description": "short_description",
+    "LATITUDE": "latitude",
+    "LONGITUDE": "longitude",
+    "PLACENAME": "place_name",
+    "FORMATTEDADDRESS": "formatted_address",
+    "IsFree": "is_free",
+    "ISFREE": "is_free",
+    "PriceValue": "price_value",
+    "PRICEVALUE": "price_value",
+})
+
+HiddenGem = _record_type("HiddenGem", {
+    "title": "title",
+    "description": "description",
+    "locations": "locations",
+    "costs": "costs",
+    "food": "food",
+    "url": "url",
+    "source": "source",
+    "time_references": "time_references",
+    "landmarks": "landmarks",
+    "transport": "transport",
+})
+
+
+def records_from_cursor(cursor, record_type):
+    """Single conversion point from a Snowflake cursor to catalog records"""
+    columns = [desc[0] for desc in cursor.description]
+    return [record_type.from_row(columns, row) for row in cursor.fetchall()]
+
+
+def json_default(obj):
+    """json.dumps default hook for catalog records and Snowflake scalar types"""
+    if isinstance(obj, CatalogRecord):
+        return obj.to_dict()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(obj, indent=False):
+    """Encode catalog data to a JSON string, using orjson when it is installed"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=json_default, option=option).decode("utf-8")
+    return json.dumps(obj, default=json_default, indent=2 if indent else None)
@@ -0,0 +1,299 @@
+"""
+Versioned per-city catalog snapshots, exported by the DAGs and memory-mapped by
+every uvicorn worker.
+
+Each catalog DAG ends with a task that calls export_table_snapshot() on its
+geocoded output. The rows are split by city into uncompressed Arrow IPC files
+with the columns local_catalog uses (Snowflake names, PRICEVALUE and ISFREE
+precomputed, coordinates from geocoding), ordered by rating so the fetch
+layer's rankings start from sorted input. Workers memory-map the files
+read-only, so the page cache holds one copy of the catalog however many
+workers run, and reads are zero-copy until a city's rows are first turned into
+records; those records are then kept until the version changes.
+
+Layout under CATALOG_SNAPSHOT_DIR (a volume shared by Airflow and the backend):
+
+    CURRENT                          name of the live version (swapped with os.replace)
+    <version>/manifest.json          per table: source DAG, export time, rows and file per city
+    <version>/<TABLE>/<city>.arrow
+
+An export builds a complete new version (hard-linking the other tables' files
+from the current one) before swapping CURRENT, so readers see either the old
+or the new snapshot, never a mix. Exports take a file lock so DAGs finishing
+together do not drop each other's tables. Readers re-check CURRENT at most
+every CATALOG_SNAPSHOT_CHECK_SECONDS; old versions are pruned after
+KEEP_VERSIONS newer ones (mapped files stay readable after unlink on POSIX).
+
+Set CATALOG_BACKEND=snapshot to serve the fetch layer from here; tables
+missing from the snapshot fall back to Snowflake.
+"""
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+
+import local_catalog
+from cities import city_slug, partition_city
+
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "data", "snapshots"))
+CATALOG_SNAPSHOT_CHECK_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_CHECK_SECONDS", "2"))
+KEEP_VERSIONS = 3
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+
+ARROW_TYPES = {"TEXT": pa.string(), "REAL": pa.float64(), "BOOLEAN": pa.bool_()}
+
+
+class SnapshotNotFound(FileNotFoundError):
+    pass
+
+
+def _column_array(values, sql_type):
+    if sql_type == "TEXT":
+        values = [None if v is None else str(v) for v in values]
+    elif sql_type == "REAL":
+        values = [None if v is None or v == "" else float(v) for v in values]
+    else:
+        values = [None if v is None else bool(v) for v in values]
+    return pa.array(values, type=ARROW_TYPES[sql_type])
+
+
+def _empty_table(table):
+    return pa.table({name: pa.array([], type=ARROW_TYPES[sql_type])
+                     for name, sql_type in local_catalog.CATALOG_SCHEMAS[table]})
+
+
+def _rating(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def partition_frame(frame, table):
+    """DAG output (DataFrame) -> {city: Arrow table with the catalog schema, best rated first}"""
+    aligned = local_catalog.align_frame(frame, table)
+    ratings = aligned["RATING"].map(_rating) if "RATING" in aligned else 0.0
+    aligned = aligned.assign(_city=aligned["CITY"].map(partition_city), _rating=ratings)
+    columns = local_catalog.CATALOG_SCHEMAS[table]
+    partitions = {}
+    for city, rows in aligned.groupby("_city", sort=True):
+        if not city:
+            continue
+        rows = rows.sort_values("_rating", ascending=False, kind="stable")
+        partitions[city] = pa.table({name: _column_array(rows[name].tolist(), sql_type) for name, sql_type in columns})
+    return partitions
+
+
+def new_version():
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:6]
+
+
+def current_version(directory=None):
+    path = os.path.join(directory or CATALOG_SNAPSHOT_DIR, CURRENT_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(directory, version):
+    with open(os.path.join(directory, version, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _prune(directory, keep):
+    versions = sorted(name for name in os.listdir(directory)
+                      if os.path.isdir(os.path.join(directory, name)) and not name.endswith(".tmp"))
+    live = current_version(directory)
+    for version in versions[:-keep] if keep else []:
+        if version != live:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def _write_partitions(version_dir, table, partitions):
+    table_dir = os.path.join(version_dir, table)
+    os.makedirs(table_dir)
+    cities = {}
+    for city, arrow_table in partitions.items():
+        file_name = f"{city_slug(city)}.arrow"
+        with pa.OSFile(os.path.join(table_dir, file_name), "wb") as sink:
+            with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+        cities[city] = {"rows": arrow_table.num_rows, "file": f"{table}/{file_name}"}
+    return cities
+
+
+def publish_snapshot(directory=None, sources=None, source_name=None, version=None, keep=KEEP_VERSIONS):
+    """
+    Make a new current version from {table: CSV/Parquet path or DataFrame}. Tables
+    not in sources are carried over from the current version. Returns the manifest.
+    """
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    sources = sources or {}
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        previous = current_version(directory)
+        version = version or new_version()
+        version_dir = os.path.join(directory, version)
+        tmp_dir = version_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        manifest = {"version": version, "created_at": time.time(), "previous": previous, "tables": {}}
+        if previous:
+            for table, entry in read_manifest(directory, previous)["tables"].items():
+                if table in sources:
+                    continue
+                # Unchanged tables are hard links into the previous version: no copy, same pages
+                shutil.copytree(os.path.join(directory, previous, table), os.path.join(tmp_dir, table),
+                                copy_function=os.link)
+                manifest["tables"][table] = entry
+
+        for table, source in sources.items():
+            partitions = partition_frame(local_catalog.read_frame(source), table)
+            manifest["tables"][table] = {
+                "source": source_name,
+                "exported_at": time.time(),
+                "rows": sum(t.num_rows for t in partitions.values()),
+                "cities": _write_partitions(tmp_dir, table, partitions)
+            }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(tmp_dir, version_dir)
+        pointer_tmp = os.path.join(directory, f"{CURRENT_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(directory, CURRENT_FILE))
+        _prune(directory, keep)
+    return manifest
+
+
+def export_table_snapshot(table, source, directory=None, source_name=None):
+    """Final task of a catalog DAG: publish its table's per-city snapshot"""
+    return publish_snapshot(directory, {table: source}, source_name=source_name)
+
+
+def write_snapshot(directory=None, hotels=None, tours=None, attractions=None, version=None, keep=KEEP_VERSIONS):
+    """Publish any of the three tables at once (local seeding, tests, benchmarks)"""
+    sources = {table: source for table, source in
+               (("HOTEL_DATA", hotels), ("TOUR", tours), ("ATTRACTION", attractions)) if source is not None}
+    return publish_snapshot(directory, sources, source_name="manual", version=version, keep=keep)
+
+
+class SnapshotReader:
+    """Maps the current snapshot version and follows CURRENT when it changes"""
+
+    def __init__(self, directory=None, check_seconds=None):
+        self.directory = directory or CATALOG_SNAPSHOT_DIR
+        self.check_seconds = CATALOG_SNAPSHOT_CHECK_SECONDS if check_seconds is None else check_seconds
+        self._lock = threading.Lock()
+        # (version, manifest, {(table, city): mapped Arrow table}, {(table, city): records})
+        # replaced as one reference on a switch
+        self._current = (None, None, {}, {})
+        self._checked_at = 0.0
+
+    @property
+    def version(self):
+        return self._refresh()[0]
+
+    def manifest(self):
+        return self._refresh()[1]
+
+    def _refresh(self):
+        now = time.monotonic()
+        current = self._current
+        if current[0] is not None and now - self._checked_at < self.check_seconds:
+            return current
+        with self._lock:
+            self._checked_at = now
+            version = current_version(self.directory)
+            if version is None:
+                raise SnapshotNotFound(f"No catalog snapshot in {self.directory}")
+            if version != self._current[0]:
+                # Requests holding tables of the old version keep using them safely
+                self._current = (version, read_manifest(self.directory, version), {}, {})
+            return self._current
+
+    def table(self, table, city):
+        """The memory-mapped Arrow table for one city, or None if the snapshot does not have the table"""
+        version, manifest, mapped_tables, _ = self._refresh()
+        city = partition_city(city)
+        mapped = mapped_tables.get((table, city))
+        if mapped is None:
+            entry = manifest["tables"].get(table)
+            if entry is None:
+                return None
+            partition = entry["cities"].get(city)
+            if partition is None:
+                # The DAG exported this table, so a city it did not see has no rows
+                return _empty_table(table)
+            with pa.memory_map(os.path.join(self.directory, version, partition["file"]), "r") as source:
+                mapped = pa.ipc.open_file(source).read_all()
+            mapped_tables[(table, city)] = mapped
+        return mapped
+
+    def records(self, table, city, record_type, prepare=None):
+        """
+        A city's rows as catalog records, or None when the table is not in the
+        snapshot. prepare(records) runs once; the records are then shared by every
+        caller until the version changes, so they must not be mutated.
+        """
+        _, _, mapped_tables, cached = self._refresh()
+        key = (table, partition_city(city))
+        records = cached.get(key)
+        if records is not None:
+            return records
+        arrow_table = self.table(table, city)
+        if arrow_table is None:
+            return None
+        columns = arrow_table.column_names
+        records = [record_type.from_row(columns, row)
+                   for row in zip(*(column.to_pylist() for column in arrow_table.columns))]
+        if prepare is not None:
+            prepare(records)
+        # Only cities the snapshot has are kept, so unknown city names cannot grow the cache
+        if mapped_tables.get(key) is arrow_table:
+            cached[key] = records
+        return records
+
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def get_reader():
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _reader = SnapshotReader()
+    return _reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish a catalog snapshot from DAG output files")
+    parser.add_argument("--dir", default=CATALOG_SNAPSHOT_DIR)
+    parser.add_argument("--hotels", help="hotels_with_coordinates.csv (hotel DAG)")
+    parser.add_argument("--tours", help="tours_with_coords.csv (tours DAG)")
+    parser.add_argument("--attractions", help="attractions_with_coords.csv (attractions DAG)")
+    args = parser.parse_args()
+    manifest = write_snapshot(args.dir, hotels=args.hotels, tours=args.tours, attractions=args.attractions)
+    for table, info in manifest["tables"].items():
+        print(f"{table}: {info['rows']} rows in {len(info['cities'])} cities")
+    print(f"Snapshot {manifest['version']} is now current in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
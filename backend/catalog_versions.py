@@ -0,0 +1,252 @@
+"""
+Dataset versions written by the loading DAGs, and the backend side that turns a
+new version into targeted cache invalidation.
+
+After a successful load each DAG records one CATALOG_VERSIONS row per
+(DATASET, CITY): HOTEL_DATA, TOUR, ATTRACTION from the Snowflake loads and
+HIDDEN_GEMS from the YouTube Pinecone upsert. A catalog VERSION is a
+fingerprint of that city's loaded rows, so a reload that leaves a city
+unchanged keeps its version and the backend keeps its cached rows.
+
+The backend learns about new versions two ways:
+
+    polling   a background thread reads CATALOG_VERSIONS every
+              CATALOG_VERSION_POLL_SECONDS (one small query per worker)
+    notify    the DAG POSTs the changed cities to BACKEND_NOTIFY_URL
+              (/cache/invalidate, guarded by CACHE_NOTIFY_TOKEN) so the
+              instance it reaches refreshes at once; polling covers the rest
+
+Either way only the cache entries of the changed (dataset, city) pairs are
+dropped. Entries loaded before the first poll are bounded by their TTL.
+
+This module is mounted into the Airflow plugins folder, so it only depends on
+cities.py; the fetch modules register their invalidators with it.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+
+from cities import partition_city
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_POLL_SECONDS = float(os.getenv("CATALOG_VERSION_POLL_SECONDS", "60"))
+BACKEND_NOTIFY_URL = os.getenv("BACKEND_NOTIFY_URL", "")
+CACHE_NOTIFY_TOKEN = os.getenv("CACHE_NOTIFY_TOKEN", "")
+
+VERSIONS_TABLE = "CATALOG_VERSIONS"
+HIDDEN_GEMS = "HIDDEN_GEMS"
+
+CREATE_VERSIONS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+        DATASET VARCHAR,
+        CITY VARCHAR,
+        VERSION VARCHAR,
+        SOURCE VARCHAR,
+        ROW_COUNT INTEGER,
+        LOADED_AT FLOAT
+    )
+"""
+
+REMOVED_VERSION = "removed"
+
+
+def _literal(value):
+    # Statements are built as text so the same SQL runs on Snowflake and the SQLite catalog
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# ---------------- DAG side ---------------- #
+
+def city_fingerprints(frame, city_column="City"):
+    """Loaded rows (DataFrame) -> {city: (version, rows)}, the version being a hash of the city's rows"""
+    import pandas as pd
+
+    cities = frame[city_column].map(partition_city)
+    versions = {}
+    for city, rows in frame.groupby(cities, sort=True):
+        if not city:
+            continue
+        digest = hashlib.sha1(pd.util.hash_pandas_object(rows.astype(str), index=False).values.tobytes())
+        versions[city] = (digest.hexdigest()[:16], len(rows))
+    return versions
+
+
+def read_versions(cursor, dataset=None):
+    """{(dataset, city): version} as currently recorded"""
+    query = f"SELECT DATASET, CITY, VERSION FROM {VERSIONS_TABLE}"
+    if dataset is not None:
+        query += f" WHERE DATASET = {_literal(dataset)}"
+    cursor.execute(query)
+    return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+
+def record_versions(cursor, dataset, versions, source, complete=True):
+    """
+    Record {city: (version, rows)} for a dataset after a successful load. When the
+    load replaced the whole dataset (complete), cities missing from it are marked
+    removed. Returns the changed cities.
+    """
+    cursor.execute(CREATE_VERSIONS_TABLE)
+    current = read_versions(cursor, dataset)
+    changes = {city: value for city, value in versions.items() if current.get((dataset, city)) != value[0]}
+    for (_, city), version in current.items():
+        if complete and city not in versions and version != REMOVED_VERSION:
+            changes[city] = (REMOVED_VERSION, 0)
+    loaded_at = time.time()
+    for city, (version, rows) in sorted(changes.items()):
+        cursor.execute(f"DELETE FROM {VERSIONS_TABLE} WHERE DATASET = {_literal(dataset)} AND CITY = {_literal(city)}")
+        cursor.execute(
+            f"INSERT INTO {VERSIONS_TABLE} (DATASET, CITY, VERSION, SOURCE, ROW_COUNT, LOADED_AT) VALUES "
+            f"({_literal(dataset)}, {_literal(city)}, {_literal(version)}, {_literal(source)}, {rows}, {loaded_at!r})"
+        )
+    return sorted(changes)
+
+
+def connect_snowflake():
+    """Snowflake connection from the SNOWFLAKE_* variables, for DAGs without one of their own"""
+    import snowflake.connector
+    return snowflake.connector.connect(
+        user=os.getenv("SNOWFLAKE_USER"),
+        password=os.getenv("SNOWFLAKE_PASSWORD"),
+        account=os.getenv("SNOWFLAKE_ACCOUNT"),
+        warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
+        database=os.getenv("SNOWFLAKE_DATABASE"),
+        schema=os.getenv("SNOWFLAKE_SCHEMA")
+    )
+
+
+def notify_backend(dataset, versions, url=None, token=None, timeout=5):
+    """
+    Tell the backend which cities of a dataset changed ({city: version}). Best
+    effort: polling picks the change up anyway, so failures are only logged.
+    """
+    url = url or BACKEND_NOTIFY_URL
+    if not url or not versions:
+        return False
+    body = json.dumps({"dataset": dataset, "versions": versions}).encode("utf-8")
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "X-Notify-Token": token or CACHE_NOTIFY_TOKEN
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            logger.info(f"Notified backend of {dataset} changes in {sorted(versions)}: HTTP {response.status}")
+            return True
+    except Exception as e:
+        logger.warning(f"Could not notify backend of {dataset} changes: {e}")
+        return False
+
+
+def publish_load(cursor, dataset, frame, source, city_column="City"):
+    """End of a catalog load: record the per-city versions and notify the backend of the changed cities"""
+    versions = city_fingerprints(frame, city_column)
+    changed = record_versions(cursor, dataset, versions, source)
+    logger.info(f"{dataset} versions changed for {changed or 'no cities'}")
+    notify_backend(dataset, {city: versions.get(city, (REMOVED_VERSION, 0))[0] for city in changed})
+    return changed
+
+
+def publish_hidden_gems(city_key, vector_metadata, source, connect=None):
+    """
+    After the YouTube DAG upserts a city's vectors: record its HIDDEN_GEMS version
+    (a hash of the upserted chunks) and notify the backend if it changed.
+    """
+    # DAG city keys are CamelCase ("NewYork"); versions use the backend's city names
+    city = partition_city(re.sub(r"(?<=[a-z])(?=[A-Z])", " ", city_key))
+    payload = json.dumps(vector_metadata, sort_keys=True, default=str).encode("utf-8")
+    version = hashlib.sha1(payload).hexdigest()[:16]
+    conn = (connect or connect_snowflake)()
+    try:
+        changed = record_versions(conn.cursor(), HIDDEN_GEMS, {city: (version, len(vector_metadata))},
+                                  source, complete=False)
+    finally:
+        conn.close()
+    notify_backend(HIDDEN_GEMS, {city: version for city in changed})
+    return changed
+
+
+# ---------------- Backend side ---------------- #
+
+_invalidators = {}
+
+
+def register_invalidator(dataset, invalidate):
+    """invalidate(city) drops the cached entries of one city of the dataset"""
+    _invalidators[dataset] = invalidate
+
+
+def registered_datasets():
+    return sorted(_invalidators)
+
+
+def is_notify_authorized(token):
+    return bool(CACHE_NOTIFY_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), CACHE_NOTIFY_TOKEN.encode())
+
+
+class VersionWatcher:
+    """Remembers the last version seen per (dataset, city) and invalidates on change"""
+
+    def __init__(self, connect=None, interval=None):
+        self.connect = connect
+        self.interval = CATALOG_VERSION_POLL_SECONDS if interval is None else interval
+        self._lock = threading.Lock()
+        self._known = {}
+        self._baseline = False
+        self.last_checked_at = None
+
+    def apply(self, dataset, city, version=None):
+        """Invalidate one (dataset, city) unless version is the one already seen; returns True if it did"""
+        city = partition_city(city)
+        with self._lock:
+            if version is not None and self._known.get((dataset, city)) == version:
+                return False
+            if version is not None:
+                self._known[(dataset, city)] = version
+        invalidate = _invalidators.get(dataset)
+        if invalidate is None:
+            return False
+        invalidate(city)
+        logger.info(f"{dataset} changed for {city} (version {version}), cache entries dropped")
+        return True
+
+    def check(self):
+        """Read CATALOG_VERSIONS once; the first read only records the baseline. Returns the invalidated pairs."""
+        conn = self.connect()
+        try:
+            versions = read_versions(conn.cursor())
+        finally:
+            conn.close()
+        self.last_checked_at = time.time()
+        if not self._baseline:
+            with self._lock:
+                self._known.update(versions)
+            self._baseline = True
+            return []
+        return [key for key, version in sorted(versions.items()) if self.apply(key[0], key[1], version)]
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logger.warning(f"Catalog version check failed: {e}")
+            stop.wait(self.interval)
+
+    def start(self):
+        """Poll in a daemon thread; returns the stop event, or None when polling is disabled"""
+        if self.interval <= 0 or self.connect is None:
+            return None
+        stop = threading.Event()
+        threading.Thread(target=self.run, args=(stop,), name="catalog-versions", daemon=True).start()
+        return stop
@@ -0,0 +1,37 @@
+"""City names shared by the fetch layer, warm-up and the catalog snapshot export"""
+import re
+
+SUPPORTED_CITIES = ["New York", "San Francisco", "Los Angeles", "Las Vegas", "Chicago", "Seattle"]
+
+
+def standardize_city_name(city):
+    if not city:
+        return ""
+    
+    city_lower = city.lower()
+    
+    # Handle common variations
+    if "new york" in city_lower:
+        return "New York"
+    elif "san francisco" in city_lower:
+        return "San Francisco"
+    elif "los angeles" in city_lower:
+        return "Los Angeles"
+    elif "las vegas" in city_lower:
+        return "Las Vegas"
+    elif "chicago" in city_lower:
+        return "Chicago"
+    elif "seattle" in city_lower:
+        return "Seattle"
+    
+    # Default: return the city name as-is
+    return city
+
+
+def partition_city(value):
+    """Catalog CITY value ('Seattle, United States', 'new york city') -> snapshot partition city"""
+    return standardize_city_name(str(value or "").split(",")[0].strip())
+
+
+def city_slug(city):
+    return re.sub(r"[^a-z0-9]+", "_", partition_city(city).lower()).strip("_")
@@ -0,0 +1,208 @@
+"""
+LLM-free itinerary: HTML and text rendered straight from the planned days,
+hotels and hidden gems, in a few milliseconds.
+
+/generate-itinerary takes mode = "llm", "fast" or "auto" (default). In auto
+mode the fast path is used while the LLM is overloaded:
+
+    FAST_ITINERARY_QUEUE_DEPTH      itinerary requests of this worker waiting for an LLM slot or for
+                                    admission (default 4)
+    FAST_ITINERARY_LATENCY_SECONDS  median of the last FAST_ITINERARY_WINDOW (20) LLM itinerary calls (default 60)
+    FAST_ITINERARY_PROBE_SECONDS    while over the latency threshold, one request per this many seconds
+                                    still goes to the LLM so recovery is noticed (default 15)
+    FAST_ITINERARY_ON_ERROR         serve the fast itinerary when the LLM call fails (default true)
+
+Auto and fast requests that admission control turns away (queue full or queue
+timeout) are served from the fast path as well, instead of getting a 429/503;
+only llm requests get the rejection.
+
+The HTML follows the structure the LLM prompt asks for (day-card /
+item-section / image-block, a trip header and a distinct Hidden Gems section),
+so the frontend and the PDF export handle both alike.
+"""
+import os
+import threading
+import time
+from collections import deque
+from html import escape
+from string import Template
+
+import admission
+import llm_client
+from itinerary_planning import plan_days
+from metrics import REGISTRY, quantile
+
+FAST_ITINERARY_QUEUE_DEPTH = int(os.getenv("FAST_ITINERARY_QUEUE_DEPTH", "4"))
+FAST_ITINERARY_LATENCY_SECONDS = float(os.getenv("FAST_ITINERARY_LATENCY_SECONDS", "60"))
+FAST_ITINERARY_PROBE_SECONDS = float(os.getenv("FAST_ITINERARY_PROBE_SECONDS", "15"))
+FAST_ITINERARY_ON_ERROR = os.getenv("FAST_ITINERARY_ON_ERROR", "true").lower() == "true"
+FAST_ITINERARY_WINDOW = int(os.getenv("FAST_ITINERARY_WINDOW", "20"))
+
+ITINERARIES = REGISTRY.counter(
+    "itinerary_generated_total", "Itineraries served by generator and why it was chosen", ["generator", "reason"])
+
+PLACEHOLDER_IMAGE = "https://placehold.co/400x300"
+
+PAGE = Template("""<div class="itinerary">
+<div class="trip-header">
+<h1>$days-Day Itinerary for $city</h1>
+<p>$start_date to $end_date &middot; $travellers &middot; $travel_type &middot; $budget budget</p>
+</div>
+$day_cards
+$hidden_gems
+</div>""")
+
+DAY = Template("""<div class="day-card">
+<h2>Day $day &ndash; $date</h2>
+$sections
+</div>""")
+
+SECTION = Template("""<div class="item-section">
+<h3>$heading</h3>
+$items
+</div>""")
+
+ITEM = Template("""<div class="item">
+<div class="image-block"><img src="$image" alt="Item image" width="300" style="border-radius:10px; margin-bottom:10px;" /></div>
+<p><strong>$name</strong></p>
+<ul>
+$details
+</ul>
+$link
+</div>""")
+
+HIDDEN_GEMS = Template("""<div class="hidden-gems" style="background:#fff8e6; border:2px solid #f0b429; border-radius:10px; padding:16px;">
+<h2>Hidden Gems of $city</h2>
+<p>Go beyond the usual sights with these local favourites.</p>
+<ul>
+$gems
+</ul>
+</div>""")
+
+HOTEL_FIELDS = [("Address", "ADDRESS"), ("Distance", "DISTANCE"), ("Rating", "RATING"), ("Reviews", "REVIEWS"),
+                ("Price", "Price (per night)"), ("Certified", "CERTIFIED")]
+TOUR_FIELDS = [("Rating", "RATING"), ("Reviews", "Review Count"), ("Price", "PRICE")]
+ATTRACTION_FIELDS = [("Ticket details", "Ticket Details"), ("Hours", "HOURS"), ("How to reach", "How to Reach"),
+                     ("About", "Short Description")]
+
+
+def _text(value):
+    return "" if value is None else escape(str(value).strip())
+
+
+def _details(item, fields):
+    return [(label, item.get(key)) for label, key in fields if item.get(key) not in (None, "")]
+
+
+def _item_html(item, name_key, fields, link_key):
+    link = item.get(link_key)
+    return ITEM.substitute(
+        image=_text(item.get("IMAGE") or PLACEHOLDER_IMAGE),
+        name=_text(item.get(name_key)),
+        details="\n".join(f"<li><strong>{label}:</strong> {_text(value)}</li>" for label, value in _details(item, fields)),
+        link=f'<p><a href="{_text(link)}">Know more</a></p>' if link else ""
+    )
+
+
+def _day_html(day):
+    sections = []
+    if day.get("hotel"):
+        sections.append(SECTION.substitute(heading="Hotel", items=_item_html(day["hotel"], "NAME", HOTEL_FIELDS, "LINK")))
+    if day.get("tours"):
+        sections.append(SECTION.substitute(heading="Tours", items="\n".join(
+            _item_html(t, "TITLE", TOUR_FIELDS, "Know More") for t in day["tours"])))
+    if day.get("attractions"):
+        sections.append(SECTION.substitute(heading="Things to Do", items="\n".join(
+            _item_html(a, "PLACENAME", ATTRACTION_FIELDS, "URL") for a in day["attractions"])))
+    if not sections:
+        sections.append("<p>Free day to explore at your own pace.</p>")
+    return DAY.substitute(day=day["day"], date=_text(day["date"]), sections="\n".join(sections))
+
+
+def _gem_lines(gem):
+    details = [gem.get("description"), gem.get("costs") and f"Costs: {gem.get('costs')}",
+               gem.get("food") and f"Food: {gem.get('food')}"]
+    return [str(d) for d in details if d]
+
+
+def _travellers(data):
+    travellers = f"{data['adults']} adult{'s' if data['adults'] != 1 else ''}"
+    if data.get("kids"):
+        travellers += f", {data['kids']} kid{'s' if data['kids'] != 1 else ''}"
+    return travellers
+
+
+def render(data):
+    """(html, text) for the structured data fetch_itinerary_data returns"""
+    days = plan_days(data)
+    gems = data.get("hidden_gems", [])
+    num_days = len(days)
+    travellers = _travellers(data)
+
+    gem_html = "\n".join(
+        f"<li><strong>{_text(g.get('title'))}</strong> &ndash; " + " ".join(_text(line) for line in _gem_lines(g)) + "</li>"
+        for g in gems)
+    html = PAGE.substitute(
+        days=num_days, city=_text(data["city"]), start_date=_text(data["start_date"]), end_date=_text(data["end_date"]),
+        travellers=_text(travellers), travel_type=_text(data["travel_type"]), budget=_text(data["budget"]).capitalize(),
+        day_cards="\n".join(_day_html(day) for day in days),
+        hidden_gems=HIDDEN_GEMS.substitute(city=_text(data["city"]), gems=gem_html) if gems else ""
+    )
+
+    lines = [f"{num_days}-Day Itinerary for {data['city']}",
+             f"{data['start_date']} to {data['end_date']}, {travellers}, {data['travel_type']}, {data['budget']} budget"]
+    for day in days:
+        lines.append(f"Day {day['day']} - {day['date']}")
+        if day.get("hotel"):
+            lines.append(f"Hotel: {day['hotel'].get('NAME')}")
+        lines.extend(f"Tour: {t.get('TITLE')}" for t in day.get("tours", []))
+        lines.extend(f"Things to do: {a.get('PLACENAME')}" for a in day.get("attractions", []))
+    if gems:
+        lines.append("\n" + "-" * 40 + "\n")
+        lines.append("HIDDEN GEMS")
+        lines.append("-" * 40 + "\n")
+        for gem in gems:
+            lines.append(" - ".join([str(gem.get("title"))] + _gem_lines(gem)))
+    return html, "\n".join(lines)
+
+
+class LoadSignal:
+    """Recent LLM itinerary latency and queue depth, deciding when auto mode takes the fast path"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=FAST_ITINERARY_WINDOW)
+        self._last_probe = None
+
+    def observe(self, seconds):
+        """Duration of an LLM itinerary call, failed ones included"""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency(self):
+        with self._lock:
+            return quantile(sorted(self._latencies), 0.5) if self._latencies else None
+
+    def choose(self, requested="auto", overflow=False):
+        """(generator, reason) for a request asking for mode requested; overflow when admission turned it away"""
+        if requested != "auto":
+            return requested, "requested"
+        if overflow:
+            return "fast", "admission"
+        # Admission lets in as many itineraries as there are LLM slots, so the backlog usually waits there
+        if (llm_client.queue_depth("itinerary") >= FAST_ITINERARY_QUEUE_DEPTH
+                or admission.controller.queued("generate-itinerary") >= FAST_ITINERARY_QUEUE_DEPTH):
+            return "fast", "queue_depth"
+        latency = self.latency()
+        if latency is not None and latency >= FAST_ITINERARY_LATENCY_SECONDS:
+            now = self._clock()
+            with self._lock:
+                if self._last_probe is not None and now - self._last_probe < FAST_ITINERARY_PROBE_SECONDS:
+                    return "fast", "latency"
+                self._last_probe = now
+            return "llm", "probe"
+        return "llm", "auto"
+
+
+load_signal = LoadSignal()
@@ -5,6 +5,8 @@ import requests
 from PIL import Image
 import io
 from datetime import datetime, timedelta
+from tracing import start_span
+import cassettes
 
 def clean_text(text):
     text = text.encode("latin-1", "replace").decode("latin-1")  
@@ -61,7 +63,9 @@ class ItineraryPDF(FPDF):
 
     def add_image(self, img_url, caption=None):
         try:
-            r = requests.get(img_url, timeout=5)
+            with start_span("pdf.image_download", url=img_url) as span:
+                r = cassettes.http_get("images", requests.get, img_url, group="image", timeout=5)
+                span.set_attributes(status_code=r.status_code, bytes=len(r.content))
             if r.status_code == 200:
                 img = Image.open(io.BytesIO(r.content))
                 img = img.convert("RGB") if img.mode != "RGB" else img
@@ -153,9 +157,9 @@ def create_itinerary_pdf(city, itinerary_text, start_date_str=""):
             if line.strip() and not any(x in line.lower() for x in ["tips", "beyond the typical"]):
                 pdf.bullet(line)
 
-    output = BytesIO()
-    pdf.output(output)
-    output.seek(0)
+    # PyFPDF 1.7 returns a latin-1 str for dest='S', fpdf2 returns a bytearray
+    data = pdf.output(dest='S')
+    output = BytesIO(data.encode('latin-1') if isinstance(data, str) else bytes(data))
 
     if output.getbuffer().nbytes == 0:
         raise ValueError("Generated PDF is empty.")
@@ -0,0 +1,90 @@
+"""
+Day-by-day assignment of hotels, tours and attractions, ahead of the LLM prompt.
+
+Kept free of crewai/litellm imports so it can be benchmarked and reused on its own.
+"""
+import math
+from datetime import datetime, timedelta
+from random import shuffle
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    if None in (lat1, lon1, lat2, lon2):
+        return float('inf')
+    try:
+        lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
+        R = 6371
+        dLat = math.radians(lat2 - lat1)
+        dLon = math.radians(lon2 - lon1)
+        a = math.sin(dLat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon/2)**2
+        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+        return R * c
+    except:
+        return float('inf')
+
+
+def get_coordinates(item):
+    return item.get("LATITUDE"), item.get("LONGITUDE")
+
+
+def find_closest_hotel(hotels, attractions):
+    if not hotels or not attractions:
+        return hotels[0] if hotels else None
+    avg_lat = sum(float(a.get("LATITUDE", 0)) for a in attractions) / len(attractions)
+    avg_lon = sum(float(a.get("LONGITUDE", 0)) for a in attractions) / len(attractions)
+    closest_hotel = min(hotels, key=lambda h: calculate_distance(avg_lat, avg_lon, h.get("LATITUDE"), h.get("LONGITUDE")))
+    return closest_hotel
+
+
+def plan_days(data):
+    """
+    Spread the fetched tours and attractions over the trip (two of each per day,
+    no repeats) and pick the hotel closest to each day's attractions.
+    Returns the list of day dicts that goes into the prompt.
+    """
+    start = datetime.strptime(data["start_date"], "%Y-%m-%d")
+    end = datetime.strptime(data["end_date"], "%Y-%m-%d")
+    num_days = (end - start).days + 1
+    date_list = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(num_days)]
+
+    hotels = data.get("hotels", [])
+    tours = data.get("tours", [])[:]
+    attractions = data.get("attractions", [])[:]
+
+    shuffle(tours)
+    shuffle(attractions)
+
+    used_tours = set()
+    used_attractions = set()
+
+    days = []
+    for i in range(num_days):
+        today_tours = []
+        today_attractions = []
+
+        for t in tours:
+            t_id = t.get("TITLE") or t.get("URL")
+            if t_id not in used_tours:
+                today_tours.append(t)
+                used_tours.add(t_id)
+            if len(today_tours) == 2:
+                break
+
+        for a in attractions:
+            a_id = a.get("PLACENAME") or a.get("URL")
+            if a_id not in used_attractions:
+                today_attractions.append(a)
+                used_attractions.add(a_id)
+            if len(today_attractions) == 2:
+                break
+
+        hotel = find_closest_hotel(hotels, today_attractions)
+
+        days.append({
+            "day": i + 1,
+            "date": date_list[i],
+            "hotel": hotel,
+            "tours": today_tours,
+            "attractions": today_attractions
+        })
+    return days
@@ -0,0 +1,349 @@
+"""
+Async LLM client for the generation endpoints.
+
+Completions go through litellm.acompletion on the event loop, so a request
+waiting on Grok holds no worker thread. Every call is bounded:
+
+    LLM_MAX_CONCURRENCY        completions in flight per worker, all endpoints (default 16)
+    LLM_ENDPOINT_CONCURRENCY   per-endpoint limits, e.g. "itinerary=8,chat=8"
+    LLM_CONNECT_TIMEOUT        seconds to open the connection (default 5)
+    LLM_FIRST_TOKEN_TIMEOUT    seconds from sending a streamed request to its first token (default 30)
+    LLM_TOTAL_TIMEOUT          seconds for the whole call, queueing, retries and hedges included (default 120)
+    LLM_MAX_RETRIES            retries after a failed attempt (default 2); on the same model only
+                               for 429, 5xx, connection errors and timeouts
+    LLM_RETRY_BASE_SECONDS     first backoff; doubles per retry with full jitter, capped at LLM_RETRY_MAX_SECONDS
+    LLM_HEDGE_QUANTILE         hedge once an attempt is slower than this quantile of the endpoint's recent
+                               first-token times (blocking: total times); 0 disables hedging (default 0.95)
+    LLM_HEDGE_MIN_SAMPLES      observations needed before hedging starts (default 20)
+
+A hedge is a second, identical request; whichever produces its first token
+first is kept and the other is cancelled and its stream closed. Hedges only
+use spare global capacity, so they never queue behind real requests. Only the
+kept attempt's first-token time is recorded, once per call.
+
+Which model each attempt goes to is up to llm_router: a failed attempt is
+retried on the next healthy model straight away, and only backs off when
+there is no other model to try.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+import cassettes
+import llm_router
+from metrics import REGISTRY, STAGE_DURATION, record_timing
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_ENDPOINT_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, limit in (item.split("=") for item in os.getenv("LLM_ENDPOINT_CONCURRENCY", "itinerary=8,chat=8").split(",") if "=" in item)
+}
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "30"))
+LLM_TOTAL_TIMEOUT = float(os.getenv("LLM_TOTAL_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    "itinerary_llm_in_flight", "LLM requests holding a concurrency slot", ["endpoint"])
+LLM_QUEUED = REGISTRY.gauge(
+    "itinerary_llm_queued", "LLM requests waiting for a concurrency slot", ["endpoint"])
+LLM_RETRIES = REGISTRY.counter(
+    "itinerary_llm_retries_total", "LLM attempts retried after a retryable error", ["endpoint", "reason"])
+LLM_HEDGES = REGISTRY.counter(
+    "itinerary_llm_hedges_total", "Hedged LLM requests by which attempt won", ["endpoint", "winner"])
+
+RETRYABLE_ERRORS = {"RateLimitError", "ServiceUnavailableError", "InternalServerError",
+                    "APIConnectionError", "APITimeoutError", "Timeout"}
+# The model or its key cannot serve at all; never retried on the same model, and ejects it
+FATAL_STATUSES = {401, 403, 404}
+
+
+class FirstTokenTimeout(TimeoutError):
+    pass
+
+
+class LLMResult:
+    """Text of a completion plus what it took to get it"""
+
+    def __init__(self, content, usage=None, ttft=None, attempts=1, hedged=False, model=None, seconds=None):
+        self.content = content
+        self.model = model
+        self.seconds = seconds
+        self.usage = usage
+        self.ttft = ttft
+        self.attempts = attempts
+        self.hedged = hedged
+
+
+async def acompletion(**params):
+    """litellm.acompletion, importing litellm on first call"""
+    from litellm import acompletion as litellm_acompletion
+    return await litellm_acompletion(**params)
+
+
+def import_transport():
+    """Import litellm ahead of the first completion; warm-up calls this so no request pays for the import"""
+    import litellm  # noqa: F401
+
+
+def request_timeout():
+    """Connect and overall timeouts for the HTTP layer under litellm"""
+    import httpx
+    return httpx.Timeout(LLM_TOTAL_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+# asyncio primitives belong to one event loop; each loop (uvicorn's, a test client's) gets its own
+_limits = weakref.WeakKeyDictionary()
+
+
+def _semaphores(endpoint):
+    loop = asyncio.get_running_loop()
+    limits = _limits.get(loop)
+    if limits is None:
+        limits = _limits[loop] = {None: asyncio.Semaphore(LLM_MAX_CONCURRENCY)}
+    if endpoint not in limits:
+        limits[endpoint] = asyncio.Semaphore(LLM_ENDPOINT_CONCURRENCY.get(endpoint, LLM_MAX_CONCURRENCY))
+    return limits[endpoint], limits[None]
+
+
+@asynccontextmanager
+async def concurrency_slot(endpoint, stage):
+    """Hold the endpoint's and the global slot; time spent waiting is recorded as <stage>.queue"""
+    endpoint_limit, global_limit = _semaphores(endpoint)
+    start = time.perf_counter()
+    LLM_QUEUED.inc(endpoint=endpoint)
+    queued = True
+    try:
+        async with endpoint_limit, global_limit:
+            LLM_QUEUED.dec(endpoint=endpoint)
+            queued = False
+            record_timing(f"{stage}.queue", time.perf_counter() - start)
+            LLM_IN_FLIGHT.inc(endpoint=endpoint)
+            try:
+                yield
+            finally:
+                LLM_IN_FLIGHT.dec(endpoint=endpoint)
+    finally:
+        if queued:
+            LLM_QUEUED.dec(endpoint=endpoint)
+
+
+def queue_depth(endpoint):
+    """Requests of this worker waiting for an LLM slot on the endpoint"""
+    return LLM_QUEUED.value(endpoint=endpoint)
+
+
+def status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_fatal(error):
+    """The provider refused the model itself (bad or missing key, no access, unknown model)"""
+    return status_code(error) in FATAL_STATUSES
+
+
+def is_retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status = status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def backoff_seconds(retry):
+    """Full-jitter exponential backoff for the given retry (0-based)"""
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** retry))
+
+
+def hedge_after(stage, stream):
+    """Seconds before an attempt is hedged, from the stage's recent latency; None when hedging is off"""
+    if LLM_HEDGE_QUANTILE <= 0:
+        return None
+    snapshot = STAGE_DURATION.snapshot(stage=f"{stage}.ttft" if stream else f"{stage}.attempt")
+    if snapshot["count"] < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    threshold = snapshot.get(LLM_HEDGE_QUANTILE)
+    return threshold if threshold == threshold else None  # NaN when the window is empty
+
+
+class _Attempt:
+    """One request: open() returns once the first token (or the blocking response) has arrived"""
+
+    def __init__(self, params, stage):
+        self.params = params
+        self.stage = stage
+        self.model = params.get("model")
+        self.stream = None
+        self.parts = []
+        self.usage = None
+        self.ttft = None
+        self.opened_in = None
+        self.started = None
+        self.seconds = None
+
+    async def open(self):
+        start = self.started = time.perf_counter()
+        try:
+            response = await cassettes.acompletion(acompletion, self.stage, **self.params)
+            if not self.params.get("stream"):
+                self.parts.append(response['choices'][0]['message']['content'])
+                self.usage = response.get('usage')
+                self.opened_in = time.perf_counter() - start
+                return self
+            self.stream = response.__aiter__()
+            async for chunk in self.stream:
+                if self._take(chunk):
+                    self.ttft = self.opened_in = time.perf_counter() - start
+                    break
+            return self
+        except BaseException:
+            # Failed, timed out or cancelled as a hedge loser: release the connection
+            await self.close()
+            raise
+
+    def record_timing(self):
+        """Report the latency of the attempt that won; failed and losing attempts are not reported"""
+        if self.stream is None:
+            record_timing(f"{self.stage}.attempt", self.opened_in)
+        elif self.ttft is not None:
+            record_timing(f"{self.stage}.ttft", self.ttft)
+
+    def _take(self, chunk):
+        self.usage = getattr(chunk, "usage", None) or self.usage
+        content = getattr(chunk.choices[0].delta, "content", None) if chunk.choices else None
+        if content:
+            self.parts.append(content)
+        return bool(content)
+
+    async def finish(self):
+        if self.stream is not None:
+            async for chunk in self.stream:
+                self._take(chunk)
+        self.seconds = time.perf_counter() - self.started
+        return "".join(self.parts)
+
+    async def close(self):
+        close = getattr(self.stream, "aclose", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                pass
+
+
+async def _open_within(attempt, stream):
+    """
+    Open the attempt and report its latency and outcome to the router. Transient
+    errors (transport, timeouts, 429, 5xx) and fatal ones (401, 403, 404) count
+    against the model; a rejected request is not the model's fault, and a
+    cancelled hedge reports nothing.
+    """
+    start = time.perf_counter()
+    try:
+        if not stream:
+            await attempt.open()
+        else:
+            try:
+                await asyncio.wait_for(attempt.open(), LLM_FIRST_TOKEN_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise FirstTokenTimeout(f"No first token within {LLM_FIRST_TOKEN_TIMEOUT}s") from None
+    except Exception as e:
+        if is_retryable(e) or is_fatal(e):
+            llm_router.stats(attempt.model).record(time.perf_counter() - start, ok=False, fatal=is_fatal(e))
+        raise
+    llm_router.stats(attempt.model).record(time.perf_counter() - start, ok=True)
+    return attempt
+
+
+async def _open_hedged(params, stage, endpoint, stream):
+    """Open an attempt; past the hedge threshold, race a second one if there is spare capacity"""
+    primary = asyncio.ensure_future(_open_within(_Attempt(params, stage), stream))
+    threshold = hedge_after(stage, stream)
+    if threshold is None:
+        return await primary, False
+    done, _ = await asyncio.wait({primary}, timeout=threshold)
+    _, global_limit = _semaphores(endpoint)
+    if done or global_limit.locked():
+        return await primary, False
+
+    async with global_limit:
+        hedge = asyncio.ensure_future(_open_within(_Attempt(params, stage), stream))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            opened = [task for task in done if task.exception() is None]
+            if not opened:
+                error = next(iter(done)).exception()
+                continue
+            winner = primary if primary in opened else hedge
+            for task in pending:
+                task.cancel()
+            # A cancelled attempt closes its own stream; wait for that so no connection outlives the call
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in opened:
+                if task is not winner:
+                    await task.result().close()
+            LLM_HEDGES.inc(endpoint=endpoint, winner="primary" if winner is primary else "hedge")
+            return winner.result(), True
+        raise error
+
+
+async def complete(params, stage, endpoint):
+    """
+    Run one completion under the concurrency limits, timeouts, retries and
+    hedging above. params are litellm arguments (the model is chosen by the
+    endpoint's router); returns an LLMResult.
+    """
+    stream = bool(params.get("stream"))
+    params = dict(params, timeout=request_timeout())
+    route = llm_router.router(endpoint)
+
+    async def run():
+        async with concurrency_slot(endpoint, stage):
+            retry = 0
+            model = route.choose()
+            while True:
+                try:
+                    attempt, hedged = await _open_hedged(llm_router.params_for(model, params), stage, endpoint, stream)
+                    attempt.record_timing()
+                    content = await attempt.finish()
+                    return LLMResult(content, attempt.usage, attempt.ttft, retry + 1, hedged, model, attempt.seconds)
+                except Exception as e:
+                    if retry >= LLM_MAX_RETRIES:
+                        raise
+                    # Any error moves on to another model; only transient ones are retried on the same model
+                    failed, model = model, route.choose(failed=model, retry_same=is_retryable(e))
+                    if model is None:
+                        raise
+                    # Another model can be tried at once; the same one gets a backoff first
+                    delay = 0 if model != failed else backoff_seconds(retry)
+                    retry += 1
+                    reason = status_code(e) or type(e).__name__
+                    LLM_RETRIES.inc(endpoint=endpoint, reason=reason)
+                    logger.warning(f"LLM {endpoint} attempt on {failed} failed ({reason}: {e}); "
+                                   f"retry {retry} on {model} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(run(), LLM_TOTAL_TIMEOUT)
+    except asyncio.TimeoutError:
+        # Since 3.11 asyncio.TimeoutError is TimeoutError, so a first-token timeout also lands here
+        if time.perf_counter() - start < LLM_TOTAL_TIMEOUT:
+            raise
+        raise TimeoutError(f"LLM {endpoint} call exceeded {LLM_TOTAL_TIMEOUT}s") from None
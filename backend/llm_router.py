@@ -0,0 +1,214 @@
+"""
+Latency-aware routing across the configured LLM models.
+
+Each endpoint has an ordered list of litellm model names:
+
+    LLM_MODELS                 itinerary generation, e.g. "xai/grok-2-1212,openai/gpt-4o"
+                               (default: LLM_MODEL, else xai/grok-2-1212)
+    LLM_CHAT_MODELS            /ask; usually a cheaper or faster model (default: LLM_MODELS)
+    LLM_ROUTER_WINDOW          recent calls kept per model (default 50)
+    LLM_ROUTER_MIN_SAMPLES     successful calls before a model's latency is trusted (default 5)
+    LLM_ROUTER_MAX_ERROR_RATIO error ratio over the window that ejects a model (default 0.5)
+    LLM_ROUTER_COOLDOWN        seconds an ejected model is skipped (default 30)
+    LLM_ROUTER_PROBE_SECONDS   how often a model with too few samples is tried first (default 30)
+
+Every attempt reports its latency (time to first token when streaming, the
+whole response otherwise) and outcome. A request goes to the healthy model
+with the lowest median latency; models with too few samples come after the
+measured ones, fewest errors first, except that each is tried first once per
+LLM_ROUTER_PROBE_SECONDS so a new or recovered model gets measured. Ties keep
+the configured order. When an attempt fails, the retry goes to the next
+healthy model, not after a backoff on the same one. A model whose error ratio
+reaches the limit is ejected for the cooldown; one the provider refuses
+outright (bad key, unknown model) is ejected at once. If every model is
+ejected the configured order is used, so requests are never refused here.
+
+Statistics are per model and shared by the endpoints, since a provider that is
+down is down for all of them.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY, quantile
+
+logger = logging.getLogger(__name__)
+
+
+def _models(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+LLM_MODELS = _models(os.getenv("LLM_MODELS") or os.getenv("LLM_MODEL", "xai/grok-2-1212"))
+LLM_CHAT_MODELS = _models(os.getenv("LLM_CHAT_MODELS", "")) or LLM_MODELS
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "50"))
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+LLM_ROUTER_MAX_ERROR_RATIO = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATIO", "0.5"))
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))
+LLM_ROUTER_PROBE_SECONDS = float(os.getenv("LLM_ROUTER_PROBE_SECONDS", "30"))
+
+MODEL_LATENCY = REGISTRY.gauge(
+    "itinerary_llm_model_latency_seconds", "Median recent latency per model (first token when streaming)", ["model"])
+MODEL_ERROR_RATIO = REGISTRY.gauge(
+    "itinerary_llm_model_error_ratio", "Share of recent calls to the model that failed", ["model"])
+MODEL_HEALTHY = REGISTRY.gauge(
+    "itinerary_llm_model_healthy", "1 while the model is routable, 0 while ejected", ["model"])
+ROUTED = REGISTRY.counter(
+    "itinerary_llm_routed_total", "Attempts routed to each model", ["endpoint", "model", "reason"])
+FAILOVERS = REGISTRY.counter(
+    "itinerary_llm_failovers_total", "Retries moved to another model after a failure", ["endpoint", "from_model", "to_model"])
+
+
+class ModelStats:
+    """Rolling latency and error ratio of one model"""
+
+    def __init__(self, model, clock=time.monotonic):
+        self.model = model
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=LLM_ROUTER_WINDOW)
+        self._latencies = deque(maxlen=LLM_ROUTER_WINDOW)
+        self.ejected_until = None
+        self._probed_at = None
+        MODEL_HEALTHY.set(1, model=model)
+
+    def record(self, seconds, ok, fatal=False):
+        """Outcome of one attempt; fatal failures (the model cannot serve at all) eject it at once"""
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok:
+                self._latencies.append(seconds)
+            ratio = self._outcomes.count(False) / len(self._outcomes)
+            if not ok and (fatal or (len(self._outcomes) >= LLM_ROUTER_MIN_SAMPLES
+                                     and ratio >= LLM_ROUTER_MAX_ERROR_RATIO)):
+                # Start afresh after the cooldown so the old failures do not eject it again at once
+                self.ejected_until = self._clock() + LLM_ROUTER_COOLDOWN
+                self._outcomes.clear()
+                logger.warning(f"LLM model {self.model} ejected for {LLM_ROUTER_COOLDOWN}s (error ratio {ratio:.2f})")
+            latency = self._latency()
+        MODEL_ERROR_RATIO.set(ratio, model=self.model)
+        MODEL_HEALTHY.set(0 if self.ejected_until else 1, model=self.model)
+        if latency is not None:
+            MODEL_LATENCY.set(latency, model=self.model)
+
+    def _latency(self):
+        if len(self._latencies) < LLM_ROUTER_MIN_SAMPLES:
+            return None
+        return quantile(sorted(self._latencies), 0.5)
+
+    @property
+    def latency(self):
+        """Median recent latency, or None until there are enough samples"""
+        with self._lock:
+            return self._latency()
+
+    @property
+    def error_ratio(self):
+        with self._lock:
+            return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def probe_due(self):
+        """True at most once per LLM_ROUTER_PROBE_SECONDS, for a model that is still being measured"""
+        now = self._clock()
+        with self._lock:
+            if self._probed_at is not None and now - self._probed_at < LLM_ROUTER_PROBE_SECONDS:
+                return False
+            self._probed_at = now
+            return True
+
+    @property
+    def healthy(self):
+        with self._lock:
+            if self.ejected_until is not None and self._clock() >= self.ejected_until:
+                self.ejected_until = None
+                MODEL_HEALTHY.set(1, model=self.model)
+            return self.ejected_until is None
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def stats(model):
+    with _stats_lock:
+        if model not in _stats:
+            _stats[model] = ModelStats(model)
+        return _stats[model]
+
+
+class Router:
+    """Picks the model for each attempt of one endpoint"""
+
+    def __init__(self, endpoint, models):
+        self.endpoint = endpoint
+        self.models = list(models)
+
+    def ranked(self):
+        """
+        Healthy models: one due for a probe, then the measured ones fastest first,
+        then the unmeasured ones fewest errors first; the configured order when none is healthy
+        """
+        healthy = [(index, model) for index, model in enumerate(self.models) if stats(model).healthy]
+        if not healthy:
+            return list(self.models)
+
+        def key(item):
+            index, model = item
+            model_stats = stats(model)
+            latency = model_stats.latency
+            if latency is not None:
+                return (1, latency, index)
+            if model_stats.probe_due():
+                return (0, 0.0, index)
+            return (2, model_stats.error_ratio, index)
+        return [model for _, model in sorted(healthy, key=key)]
+
+    def choose(self, failed=None, retry_same=True):
+        """
+        Model for the next attempt. After a failure, the best model other than
+        the one that failed; if there is none, the failed one again, or None
+        when retry_same is false.
+        """
+        ranked = self.ranked()
+        model = next((m for m in ranked if m != failed), ranked[0])
+        if failed is not None and model == failed and not retry_same:
+            return None
+        if failed is None:
+            reason = "primary" if model == self.models[0] else "latency"
+        elif model != failed:
+            reason = "failover"
+            FAILOVERS.inc(endpoint=self.endpoint, from_model=failed, to_model=model)
+            logger.warning(f"LLM {self.endpoint}: failing over from {failed} to {model}")
+        else:
+            reason = "retry"
+        ROUTED.inc(endpoint=self.endpoint, model=model, reason=reason)
+        return model
+
+
+def params_for(model, params):
+    """litellm arguments for model: the shared arguments with this model's name and provider key"""
+    provider = model.split("/", 1)[0] if "/" in model else ""
+    params = dict(params, model=model)
+    if provider != "xai":
+        # completion_kwargs() carries the xAI key; other providers read their own
+        params.pop("provider", None)
+        key = os.getenv(f"{provider.upper()}_API_KEY") if provider else None
+        if key:
+            params["api_key"] = key
+        else:
+            params.pop("api_key", None)
+    return params
+
+
+ROUTERS = {
+    "itinerary": Router("itinerary", LLM_MODELS),
+    "chat": Router("chat", LLM_CHAT_MODELS),
+}
+
+
+def router(endpoint):
+    if endpoint not in ROUTERS:
+        ROUTERS[endpoint] = Router(endpoint, LLM_MODELS)
+    return ROUTERS[endpoint]
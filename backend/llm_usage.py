@@ -0,0 +1,221 @@
+"""
+Token and cost accounting for LLM calls, and the per-request prompt budget.
+
+Every completion is accounted once it finishes: prompt and completion tokens
+(from the response's usage, estimated from characters when the provider sends
+none), cost, time to first token and generation time. They go to /metrics per
+endpoint, model, city and trip length, and to one JSON log line per call. The
+metric labels are bounded: cities outside SUPPORTED_CITIES count as "other"
+and trip lengths are bucketed (1-3, 4-7, 8+ days); the log line keeps the
+request's values.
+
+    LLM_PROMPT_TOKEN_BUDGET  prompt token ceiling per endpoint, e.g. "itinerary=12000,chat=6000";
+                             0 or missing means no limit (default: no budget)
+    LLM_PRICES               USD per million prompt:completion tokens per model,
+                             e.g. "xai/grok-2-1212=2:10,openai/gpt-4o-mini=0.15:0.6"
+    LLM_CHARS_PER_TOKEN      characters per token for estimates (default 4)
+
+The budget guard runs before the call, on an estimate. The itinerary prompt is
+shrunk in steps (compact JSON, shorter text fields, fewer hidden gems, one tour
+and attraction per day) until it fits. The itinerary re-sent with each /ask is
+cut to its opening and closing lines around a marker (characters, when even its
+first line does not fit). Both are counted in
+itinerary_llm_budget_truncations_total.
+"""
+import json
+import logging
+import os
+
+from catalog_models import dumps
+from cities import SUPPORTED_CITIES, standardize_city_name
+from metrics import REGISTRY, record_timing
+
+logger = logging.getLogger(__name__)
+
+
+def _pairs(value):
+    return dict(item.split("=", 1) for item in value.split(",") if "=" in item)
+
+
+LLM_PROMPT_TOKEN_BUDGET = {
+    name.strip(): int(limit) for name, limit in _pairs(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "")).items()
+}
+LLM_PRICES = {
+    model.strip(): tuple(float(p) for p in prices.split(":"))
+    for model, prices in _pairs(os.getenv("LLM_PRICES", "xai/grok-2-1212=2:10")).items()
+}
+LLM_CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", "4"))
+
+LLM_TOKENS = REGISTRY.counter(
+    "itinerary_llm_tokens_total", "LLM tokens by endpoint, model, city and trip length",
+    ["endpoint", "model", "kind", "city", "trip_days"])
+LLM_REQUEST_TOKENS = REGISTRY.summary(
+    "itinerary_llm_request_tokens", "Tokens per LLM call", ["endpoint", "kind"])
+LLM_COST = REGISTRY.counter(
+    "itinerary_llm_cost_usd_total", "Estimated LLM spend in USD from LLM_PRICES", ["endpoint", "model"])
+LLM_BUDGET_TRUNCATIONS = REGISTRY.counter(
+    "itinerary_llm_budget_truncations_total", "Prompts shrunk to fit the endpoint's token budget", ["endpoint"])
+
+TRUNCATION_MARKER = "\n[... itinerary shortened to fit the token budget ...]\n"
+
+
+def estimate_tokens(text):
+    return int(len(text) / LLM_CHARS_PER_TOKEN) + 1
+
+
+def _usage_value(usage, name):
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return value if isinstance(value, int) else None
+
+
+def token_counts(usage, prompt_text, completion_text):
+    """(prompt_tokens, completion_tokens, estimated) from a litellm usage, estimating what is missing"""
+    prompt_tokens = _usage_value(usage, "prompt_tokens") if usage else None
+    completion_tokens = _usage_value(usage, "completion_tokens") if usage else None
+    estimated = prompt_tokens is None or completion_tokens is None
+    if prompt_tokens is None:
+        prompt_tokens = estimate_tokens(prompt_text)
+    if completion_tokens is None:
+        completion_tokens = estimate_tokens(completion_text)
+    return prompt_tokens, completion_tokens, estimated
+
+
+def cost_usd(model, prompt_tokens, completion_tokens):
+    """Spend for one call, or None when the model has no configured price"""
+    prices = LLM_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+def city_label(city):
+    """Metric label for a requested city: its standard name, or "other" outside the supported cities"""
+    if not city:
+        return ""
+    city = standardize_city_name(city)
+    return city if city in SUPPORTED_CITIES else "other"
+
+
+def trip_days_label(trip_days):
+    """Metric label for a trip length: "1-3", "4-7" or "8+" days"""
+    if trip_days in ("", None):
+        return ""
+    return "1-3" if trip_days <= 3 else "4-7" if trip_days <= 7 else "8+"
+
+
+def record(endpoint, stage, result, messages, city="", trip_days=""):
+    """Account one finished completion (an llm_client.LLMResult); returns the fields that were logged"""
+    prompt_text = "".join(m["content"] for m in messages)
+    prompt_tokens, completion_tokens, estimated = token_counts(result.usage, prompt_text, result.content)
+    generation = result.seconds - (result.ttft or 0) if result.seconds is not None else None
+    if generation is not None:
+        record_timing(f"{stage}.generation", generation)
+    cost = cost_usd(result.model, prompt_tokens, completion_tokens)
+
+    labels = dict(endpoint=endpoint, model=result.model, city=city_label(city), trip_days=trip_days_label(trip_days))
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt", **labels)
+    LLM_TOKENS.inc(completion_tokens, kind="completion", **labels)
+    LLM_REQUEST_TOKENS.observe(prompt_tokens, endpoint=endpoint, kind="prompt")
+    LLM_REQUEST_TOKENS.observe(completion_tokens, endpoint=endpoint, kind="completion")
+    if cost is not None:
+        LLM_COST.inc(cost, endpoint=endpoint, model=result.model)
+
+    fields = {
+        "event": "llm_usage",
+        **labels,
+        "city": city,
+        "trip_days": trip_days,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "estimated": estimated,
+        "cost_usd": cost,
+        "ttft_seconds": result.ttft,
+        "generation_seconds": generation,
+        "attempts": result.attempts,
+        "hedged": result.hedged
+    }
+    logger.info(json.dumps(fields))
+    return fields
+
+
+def budget(endpoint):
+    """Prompt token ceiling for the endpoint, or None"""
+    return LLM_PROMPT_TOKEN_BUDGET.get(endpoint) or None
+
+
+def _shorten(value, limit):
+    if isinstance(value, str):
+        return value if len(value) <= limit else value[:limit].rstrip() + "…"
+    if isinstance(value, dict):
+        return {key: _shorten(item, limit) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_shorten(item, limit) for item in value]
+    return value
+
+
+def _reductions(data):
+    """Smaller and smaller versions of the prompt data: (data, indent)"""
+    yield data, False
+    for limit in (400, 200, 100):
+        data = _shorten(data, limit)
+        yield data, False
+    data = dict(data, hidden_gems=data.get("hidden_gems", [])[:3])
+    yield data, False
+    data = dict(data, days=[dict(day, tours=day.get("tours", [])[:1], attractions=day.get("attractions", [])[:1])
+                            for day in data.get("days", [])])
+    yield data, False
+
+
+def fit_prompt(endpoint, render, data):
+    """
+    render(data, indent) for the largest reduction of data (a JSON-able dict with
+    days and hidden_gems) that fits the endpoint's budget; the smallest if none does.
+    """
+    limit = budget(endpoint)
+    prompt = render(data, True)
+    if limit is None or estimate_tokens(prompt) <= limit:
+        return prompt
+    original = estimate_tokens(prompt)
+    # Plain dicts from here on, so catalog records can be shortened like everything else
+    for reduced, indent in _reductions(json.loads(dumps(data))):
+        prompt = render(reduced, indent)
+        if estimate_tokens(prompt) <= limit:
+            break
+    LLM_BUDGET_TRUNCATIONS.inc(endpoint=endpoint)
+    logger.warning(f"{endpoint} prompt of ~{original} tokens shrunk to ~{estimate_tokens(prompt)} (budget {limit})")
+    return prompt
+
+
+def fit_text(endpoint, text, reserved=0):
+    """
+    text cut to the endpoint's budget less reserved tokens, keeping whole lines
+    from the start and the end around a marker; characters from both ends when
+    the first line alone is too long (HTML without line breaks)
+    """
+    limit = budget(endpoint)
+    if limit is None or estimate_tokens(text) + reserved <= limit:
+        return text
+    room = max(0, int((limit - reserved) * LLM_CHARS_PER_TOKEN) - len(TRUNCATION_MARKER))
+    lines = text.splitlines()
+    head, tail, used = [], [], 0
+    first, last = 0, len(lines) - 1
+    # Take lines alternately from both ends: the header and days up front, the hidden gems at the back
+    while first <= last:
+        at_head = len(head) <= len(tail)
+        line = lines[first] if at_head else lines[last]
+        if used + len(line) + 1 > room:
+            break
+        if at_head:
+            head.append(line)
+            first += 1
+        else:
+            tail.append(line)
+            last -= 1
+        used += len(line) + 1
+    if not head:
+        half = room // 2
+        head, tail, used = [text[:half]], [text[len(text) - (room - half):]], room
+    LLM_BUDGET_TRUNCATIONS.inc(endpoint=endpoint)
+    logger.warning(f"{endpoint} itinerary of ~{estimate_tokens(text)} tokens cut to "
+                   f"~{int(used / LLM_CHARS_PER_TOKEN)} (budget {limit})")
+    return "\n".join(head) + TRUNCATION_MARKER + "\n".join(reversed(tail))
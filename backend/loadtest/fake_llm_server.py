@@ -0,0 +1,217 @@
+"""
+OpenAI-compatible stand-in for the Grok API, for load tests.
+
+Point the backend at it with LLM_API_BASE=http://localhost:8100/v1 and every
+litellm call (itinerary, chat) goes here instead of xAI. Latency is shaped by:
+
+    FAKE_LLM_TTFT_MS            time to first token (default 800)
+    FAKE_LLM_TTFT_JITTER_MS     +/- uniform jitter on TTFT (default 200)
+    FAKE_LLM_TOKENS_PER_SECOND  generation speed after the first token (default 60)
+    FAKE_LLM_ERROR_RATE         fraction of requests that fail (default 0)
+    FAKE_LLM_ERROR_STATUS       status code for failures, e.g. 429 or 503 (default 500)
+    FAKE_LLM_MAX_TOKENS         cap on generated tokens (default 2000)
+    FAKE_LLM_RESPONSES_DIR      directory with itinerary.html / chat.txt / response.json overrides
+
+Itinerary prompts get canned itinerary HTML, JSON-mode requests get canned JSON
+and anything else gets a short chat answer. Both streaming (SSE) and blocking
+responses are supported. The knobs can be changed at runtime with
+POST /config, so one server can run several load-test scenarios.
+
+Run:
+    python loadtest/fake_llm_server.py --port 8100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CONFIG = {
+    "ttft_ms": float(os.getenv("FAKE_LLM_TTFT_MS", "800")),
+    "ttft_jitter_ms": float(os.getenv("FAKE_LLM_TTFT_JITTER_MS", "200")),
+    "tokens_per_second": float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "60")),
+    "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+    "error_status": int(os.getenv("FAKE_LLM_ERROR_STATUS", "500")),
+    "max_tokens": int(os.getenv("FAKE_LLM_MAX_TOKENS", "2000")),
+}
+RESPONSES_DIR = os.getenv("FAKE_LLM_RESPONSES_DIR", "")
+
+TOKEN_PATTERN = re.compile(r'\S+\s*|\s+')
+
+CANNED_ITINERARY_DAY = """<div class="day-card">
+<h2>Day {day}</h2>
+<div class="item-section"><h3>🏨 Hotel</h3><ul><li><strong>Midtown Suites</strong></li>
+<li>Address: 120 W 44th St, New York</li><li>Rating: 4.4 (1,832 reviews)</li><li>Price: $240 per night</li></ul></div>
+<div class="item-section"><h3>🚌 Tours</h3>
+<h3>Harbor Lights Cruise</h3><p>Rating 4.7 from 2,104 reviews. Price $45. An evening loop past the Statue of Liberty.</p>
+<div class="image-block"><img src="https://placehold.co/400x300" alt="Item image" width="300" /></div>
+<h3>Greenwich Village Food Walk</h3><p>Rating 4.9 from 980 reviews. Price $95. Six tastings across the Village.</p></div>
+<div class="item-section"><h3>📍 Attractions</h3>
+<h3>Central Park</h3><p>Ticket Details: Free entry. Hours: 6am - 1am. How to Reach: Subway to 59 St.</p>
+<h3>Top of the Rock</h3><p>Ticket Details: Adult Price: $40. Hours: 9am - 11pm. How to Reach: Subway to 47-50 Sts.</p></div>
+</div>
+"""
+CANNED_HIDDEN_GEMS = """<div class="hidden-gems" style="border:2px solid #e0a800;padding:16px;">
+<h2>Hidden Gems of New York</h2><p>Step off the tourist trail with these local favourites.</p>
+<ul><li><strong>Elevated Acre</strong> - a quiet rooftop lawn between office towers, free.</li>
+<li><strong>Tiny Cupboard</strong> - a comedy club in a Bushwick apartment, $10.</li>
+<li><strong>Mmuseumm</strong> - a museum in a Tribeca freight elevator, $5.</li></ul></div>
+"""
+CANNED_CHAT = "Based on your itinerary, you are staying at Midtown Suites, which is about a ten minute walk from Top of the Rock."
+CANNED_JSON = {"answer": CANNED_CHAT, "confidence": 0.9}
+
+app = FastAPI()
+
+
+def _load_override(name):
+    if RESPONSES_DIR:
+        path = os.path.join(RESPONSES_DIR, name)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+    return None
+
+
+def canned_output(messages, json_mode=False):
+    """Pick the canned output that matches the request"""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    if json_mode:
+        return _load_override("response.json") or json.dumps(CANNED_JSON)
+    if "HTML travel itinerary" in prompt:
+        override = _load_override("itinerary.html")
+        if override:
+            return override
+        match = re.search(r'(\d+)-day HTML travel itinerary', prompt)
+        days = int(match.group(1)) if match else 3
+        return "".join(CANNED_ITINERARY_DAY.format(day=day) for day in range(1, days + 1)) + CANNED_HIDDEN_GEMS
+    return _load_override("chat.txt") or CANNED_CHAT
+
+
+def tokenize(text, max_tokens):
+    return TOKEN_PATTERN.findall(text)[:max_tokens]
+
+
+def _ttft_seconds():
+    jitter = random.uniform(-CONFIG["ttft_jitter_ms"], CONFIG["ttft_jitter_ms"])
+    return max(0.0, CONFIG["ttft_ms"] + jitter) / 1000
+
+
+def _token_interval():
+    return 1.0 / CONFIG["tokens_per_second"] if CONFIG["tokens_per_second"] > 0 else 0.0
+
+
+def _usage(messages, tokens):
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)}
+
+
+def _error_response():
+    status = CONFIG["error_status"]
+    error_type = "rate_limit_exceeded" if status == 429 else "server_error"
+    headers = {"Retry-After": "1"} if status in (429, 503) else None
+    return JSONResponse(status_code=status, headers=headers,
+                        content={"error": {"message": "Injected fake LLM failure", "type": error_type}})
+
+
+async def _stream(completion_id, model, tokens, usage, include_usage):
+    created = int(time.time())
+
+    def chunk(delta, finish_reason=None):
+        return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    await asyncio.sleep(_ttft_seconds())
+    yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+    interval = _token_interval()
+    for i, token in enumerate(tokens):
+        if i and interval:
+            await asyncio.sleep(interval)
+        yield f"data: {json.dumps(chunk({'content': token}))}\n\n"
+    yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+    if include_usage:
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [], "usage": usage}
+        yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < CONFIG["error_rate"]:
+        await asyncio.sleep(_ttft_seconds())
+        return _error_response()
+
+    messages = body.get("messages", [])
+    model = body.get("model", "grok-2-1212")
+    json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+    max_tokens = min(body.get("max_tokens") or CONFIG["max_tokens"], CONFIG["max_tokens"])
+    tokens = tokenize(canned_output(messages, json_mode), max_tokens)
+    usage = _usage(messages, tokens)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(_stream(completion_id, model, tokens, usage, include_usage),
+                                 media_type="text/event-stream")
+
+    await asyncio.sleep(_ttft_seconds() + _token_interval() * max(0, len(tokens) - 1))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                     "finish_reason": "stop"}],
+        "usage": usage
+    }
+
+
+@app.get("/v1/models")
+@app.get("/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "grok-2-1212", "object": "model", "owned_by": "fake-llm"}]}
+
+
+@app.get("/config")
+def get_config():
+    return CONFIG
+
+
+@app.post("/config")
+async def update_config(request: Request):
+    """Change latency / error knobs between load-test scenarios"""
+    updates = await request.json()
+    unknown = set(updates) - set(CONFIG)
+    if unknown:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown settings: {sorted(unknown)}"})
+    for key, value in updates.items():
+        CONFIG[key] = type(CONFIG[key])(value)
+    return CONFIG
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server for load tests")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_LLM_PORT", "8100")))
+    parser.add_argument("--ttft-ms", type=float)
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--error-rate", type=float)
+    args = parser.parse_args()
+    for key in ("ttft_ms", "tokens_per_second", "error_rate"):
+        if getattr(args, key) is not None:
+            CONFIG[key] = getattr(args, key)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Load generator that replays Streamlit-style sessions against a running backend.
+
+Each session does what the frontend does: POST /generate-itinerary, then
+(usually) POST /generate-pdf with the returned text, then a few /ask
+questions. Cities, trip lengths, budgets and the number of questions are drawn
+from weighted distributions (DEFAULT_MIX, or a JSON file passed with --mix
+that overrides any of its keys).
+
+Two ways to drive load:
+    --users N   closed loop: N virtual users each run sessions back to back
+    --rps R     open loop: sessions start as a Poisson process sized so that
+                requests arrive at about R per second, however slow the backend is
+
+The report has per-endpoint throughput, latency percentiles, error rates and
+the p50/p95 of every Server-Timing stage the backend returned.
+
+For a fully offline run, start the backend with the local stand-ins:
+    CATALOG_BACKEND=sqlite HIDDEN_GEMS_BACKEND=local LLM_API_BASE=http://localhost:8100/v1 \\
+        uvicorn main:app --port 8000
+    python loadtest/fake_llm_server.py --port 8100
+    python loadtest/load_generator.py --base-url http://localhost:8000 --users 20 --duration 120
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import quantile
+
+DEFAULT_MIX = {
+    "cities": {"New York": 0.4, "San Francisco": 0.15, "Chicago": 0.15, "Los Angeles": 0.1,
+               "Las Vegas": 0.1, "Seattle": 0.1},
+    "trip_days": {"1": 0.1, "2": 0.2, "3": 0.3, "5": 0.25, "7": 0.15},
+    "budgets": {"low": 0.3, "medium": 0.5, "high": 0.2},
+    "travel_types": {"Solo": 0.6, "With Family": 0.4},
+    "preferences": {
+        "Suggest an itinerary with Tours, Accommodation, Things to do": 0.6,
+        "Suggest an itinerary with Accommodation, Things to do": 0.3,
+        "Suggest an itinerary with Things to do": 0.1
+    },
+    "questions_per_session": {"0": 0.2, "1": 0.3, "2": 0.3, "3": 0.2},
+    "pdf_probability": 0.8,
+    "think_time_seconds": [1.0, 5.0],
+    "questions": [
+        "Which hotel am I staying at?",
+        "What should I do on day 2 if it rains?",
+        "Are any of the attractions free?",
+        "How do I get from the hotel to the first attraction?",
+        "Which hidden gem is best for dinner?",
+        "Can you summarize the trip in three sentences?"
+    ]
+}
+
+ENDPOINTS = ("/generate-itinerary", "/generate-pdf", "/ask")
+
+
+def _weighted(rng, weights):
+    choices = list(weights)
+    return rng.choices(choices, weights=[weights[c] for c in choices], k=1)[0]
+
+
+def _mean(weights):
+    total = sum(weights.values())
+    return sum(float(k) * w for k, w in weights.items()) / total
+
+
+def expected_requests_per_session(mix):
+    return 1 + mix["pdf_probability"] + _mean(mix["questions_per_session"])
+
+
+def make_itinerary_payload(rng, mix):
+    days = int(_weighted(rng, mix["trip_days"]))
+    start = date.today() + timedelta(days=rng.randint(7, 90))
+    preference = _weighted(rng, mix["preferences"])
+    travel_type = _weighted(rng, mix["travel_types"])
+    return {
+        "city": _weighted(rng, mix["cities"]),
+        "start_date": str(start),
+        "end_date": str(start + timedelta(days=days - 1)),
+        "preference": preference,
+        "travel_type": travel_type,
+        "adults": rng.randint(1, 2) if travel_type == "Solo" else 2,
+        "kids": 0 if travel_type == "Solo" else rng.randint(1, 3),
+        "budget": _weighted(rng, mix["budgets"]),
+        "include_tours": "Tours" in preference,
+        "include_accommodation": "Accommodation" in preference,
+        "include_things": "Things to do" in preference
+    }
+
+
+def parse_server_timing(header):
+    """'a;dur=1.5, b;dur=20' -> {'a': 1.5, 'b': 20.0}"""
+    timings = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+        self.stage_timings = defaultdict(lambda: defaultdict(list))
+        self.sessions = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, endpoint, seconds, status, server_timing=None):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+        if status is None or status >= 400:
+            self.errors[endpoint] += 1
+        for stage, ms in parse_server_timing(server_timing).items():
+            self.stage_timings[endpoint][stage].append(ms)
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            count = len(latencies)
+            endpoints[endpoint] = {
+                "requests": count,
+                "throughput_rps": round(count / elapsed, 3) if elapsed else 0.0,
+                "error_rate": round(self.errors[endpoint] / count, 4) if count else 0.0,
+                "statuses": {str(k): v for k, v in self.statuses[endpoint].items()},
+                "latency_ms": {f"p{int(q * 100)}": round(quantile(latencies, q) * 1000, 1)
+                               for q in (0.5, 0.9, 0.95, 0.99)},
+                "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+                "stages_ms": {
+                    stage: {"p50": round(quantile(sorted(values), 0.5), 1),
+                            "p95": round(quantile(sorted(values), 0.95), 1)}
+                    for stage, values in sorted(self.stage_timings[endpoint].items())
+                }
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "duration_s": round(elapsed, 2),
+            "sessions": self.sessions,
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(sum(self.errors.values()) / total, 4) if total else 0.0,
+            "endpoints": endpoints
+        }
+
+
+def format_report(report):
+    lines = [
+        f"Duration {report['duration_s']}s, {report['sessions']} sessions, {report['requests']} requests, "
+        f"{report['throughput_rps']} req/s, error rate {report['error_rate']:.2%}",
+        "",
+        f"{'endpoint':<22}{'reqs':>7}{'rps':>9}{'err%':>8}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'max':>10}"
+    ]
+    for endpoint, stats in report["endpoints"].items():
+        latency = stats["latency_ms"]
+        lines.append(f"{endpoint:<22}{stats['requests']:>7}{stats['throughput_rps']:>9}"
+                     f"{stats['error_rate'] * 100:>7.1f}%{latency['p50']:>10}{latency['p90']:>10}"
+                     f"{latency['p95']:>10}{latency['p99']:>10}{stats['max_ms']:>10}")
+    for endpoint, stats in report["endpoints"].items():
+        if stats["stages_ms"]:
+            lines.append("")
+            lines.append(f"{endpoint} stages (ms)")
+            for stage, values in stats["stages_ms"].items():
+                lines.append(f"  {stage:<34}p50 {values['p50']:>10}   p95 {values['p95']:>10}")
+    return "\n".join(lines)
+
+
+class LoadGenerator:
+    def __init__(self, base_url, mix=None, seed=None, timeout=180.0, think_time=True, transport=None):
+        self.base_url = base_url
+        self.mix = dict(DEFAULT_MIX, **(mix or {}))
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.think_time = think_time
+        self.transport = transport
+        self.stats = LoadStats()
+
+    async def _post(self, client, endpoint, payload):
+        start = time.perf_counter()
+        try:
+            response = await client.post(endpoint, json=payload)
+        except httpx.HTTPError:
+            self.stats.record(endpoint, time.perf_counter() - start, None)
+            return None
+        self.stats.record(endpoint, time.perf_counter() - start, response.status_code,
+                          response.headers.get("server-timing"))
+        return response
+
+    async def _think(self):
+        if self.think_time:
+            low, high = self.mix["think_time_seconds"]
+            await asyncio.sleep(self.rng.uniform(low, high))
+
+    async def run_session(self, client):
+        """One Streamlit-style session: itinerary, then maybe a PDF, then N questions"""
+        self.stats.sessions += 1
+        payload = make_itinerary_payload(self.rng, self.mix)
+        response = await self._post(client, "/generate-itinerary", payload)
+        if response is None or response.status_code != 200:
+            return
+        itinerary_text = response.json()["data"]["itinerary_text"]
+
+        if self.rng.random() < self.mix["pdf_probability"]:
+            await self._post(client, "/generate-pdf", {
+                "city": payload["city"], "itinerary": itinerary_text, "start_date": payload["start_date"]
+            })
+
+        for _ in range(int(_weighted(self.rng, self.mix["questions_per_session"]))):
+            await self._think()
+            await self._post(client, "/ask", {
+                "itinerary": itinerary_text, "question": self.rng.choice(self.mix["questions"])
+            })
+
+    def _client(self, max_connections):
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits,
+                                 transport=self.transport)
+
+    async def run_users(self, users, duration, max_sessions=None):
+        """Closed loop: each user starts a new session as soon as the last one ends"""
+        deadline = time.perf_counter() + duration
+
+        async def user(client):
+            while time.perf_counter() < deadline:
+                if max_sessions is not None and self.stats.sessions >= max_sessions:
+                    return
+                await self.run_session(client)
+
+        async with self._client(users) as client:
+            await asyncio.gather(*(user(client) for _ in range(users)))
+        self.stats.finished = time.perf_counter()
+        return self.stats.report()
+
+    async def run_rate(self, rps, duration, max_sessions=None, max_in_flight=1000):
+        """Open loop: Poisson session arrivals so that requests arrive at about rps"""
+        session_rate = rps / expected_requests_per_session(self.mix)
+        deadline = time.perf_counter() + duration
+        tasks = set()
+        async with self._client(max_in_flight) as client:
+            while time.perf_counter() < deadline:
+                if max_sessions is not None and self.stats.sessions >= max_sessions:
+                    break
+                if len(tasks) < max_in_flight:
+                    task = asyncio.ensure_future(self.run_session(client))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.sleep(self.rng.expovariate(session_rate))
+            if tasks:
+                await asyncio.gather(*tasks)
+        self.stats.finished = time.perf_counter()
+        return self.stats.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=os.getenv("LOADTEST_BASE_URL", "http://localhost:8000"))
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--users", type=int, help="concurrent virtual users (closed loop)")
+    mode.add_argument("--rps", type=float, help="target requests per second (open loop)")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to keep starting sessions")
+    parser.add_argument("--max-sessions", type=int)
+    parser.add_argument("--mix", help="JSON file overriding keys of DEFAULT_MIX")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--no-think-time", action="store_true")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    mix = None
+    if args.mix:
+        with open(args.mix, "r", encoding="utf-8") as f:
+            mix = json.load(f)
+    generator = LoadGenerator(args.base_url, mix=mix, seed=args.seed, timeout=args.timeout,
+                              think_time=not args.no_think_time)
+    if args.rps:
+        report = asyncio.run(generator.run_rate(args.rps, args.duration, args.max_sessions))
+    else:
+        report = asyncio.run(generator.run_users(args.users or 10, args.duration, args.max_sessions))
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
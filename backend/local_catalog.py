@@ -0,0 +1,189 @@
+"""
+SQLite stand-in for the Snowflake catalog tables.
+
+Set CATALOG_BACKEND=sqlite and snowflake_fetch reads HOTEL_DATA, TOUR and
+ATTRACTION from LOCAL_CATALOG_PATH instead of Snowflake. The tables mirror the
+DAG loaders' schemas, including the column names Snowflake reports (unquoted
+identifiers upper-cased, quoted ones verbatim), so SELECT * yields the same
+record keys. The fetch queries run unchanged apart from ILIKE, which becomes
+LIKE (SQLite's LIKE is already case-insensitive for ASCII).
+
+Seed it from the files the DAGs write:
+
+    python local_catalog.py --hotels /tmp/ihg_data/hotels_with_coordinates.csv \\
+        --tours /tmp/triphobo_data/tours_with_coords.csv \\
+        --attractions /tmp/triphobo_data/attractions_with_coords.csv
+
+CSV and Parquet inputs are accepted. Missing PriceValue / IsFree columns are
+computed with price_parsing, as the DAG loaders do.
+"""
+import argparse
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+import price_parsing
+from catalog_versions import CREATE_VERSIONS_TABLE
+
+LOCAL_CATALOG_PATH = os.getenv("LOCAL_CATALOG_PATH", os.path.join(os.path.dirname(__file__), "data", "catalog.sqlite"))
+
+# Table -> [(column name as Snowflake reports it, SQLite type)], in DAG load order
+CATALOG_SCHEMAS = {
+    "HOTEL_DATA": [
+        ("CITY", "TEXT"), ("NAME", "TEXT"), ("LINK", "TEXT"), ("IMAGE", "TEXT"), ("ADDRESS", "TEXT"),
+        ("DISTANCE", "TEXT"), ("RATING", "TEXT"), ("REVIEWS", "TEXT"), ("Price (per night)", "TEXT"),
+        ("Room Fees", "TEXT"), ("EXCLUSIONS", "TEXT"), ("CERTIFIED", "TEXT"), ("LATITUDE", "REAL"),
+        ("LONGITUDE", "REAL"), ("CALCULATIONMETHOD", "TEXT"), ("PRICEVALUE", "REAL")
+    ],
+    "TOUR": [
+        ("URL", "TEXT"), ("TITLE", "TEXT"), ("RATING", "TEXT"), ("Review Count", "TEXT"), ("PRICE", "TEXT"),
+        ("OVERVIEW", "TEXT"), ("Know More", "TEXT"), ("ITINERARY", "TEXT"), ("INCLUSIONS", "TEXT"),
+        ("EXCLUSIONS", "TEXT"), ("Additional Info", "TEXT"), ("Key Details", "TEXT"), ("REVIEWS", "TEXT"),
+        ("IMAGE", "TEXT"), ("CITY", "TEXT"), ("Short Reviews", "TEXT"), ("LATITUDE", "REAL"),
+        ("LONGITUDE", "REAL"), ("PLACENAME", "TEXT"), ("FORMATTEDADDRESS", "TEXT"), ("PRICEVALUE", "REAL")
+    ],
+    "ATTRACTION": [
+        ("URL", "TEXT"), ("DESCRIPTION", "TEXT"), ("Travel Tips", "TEXT"), ("Ticket Details", "TEXT"),
+        ("HOURS", "TEXT"), ("How to Reach", "TEXT"), ("Restaurants Nearby", "TEXT"), ("IMAGE", "TEXT"),
+        ("CITY", "TEXT"), ("Short Description", "TEXT"), ("LATITUDE", "REAL"), ("LONGITUDE", "REAL"),
+        ("PLACENAME", "TEXT"), ("FORMATTEDADDRESS", "TEXT"), ("ISFREE", "BOOLEAN"), ("PRICEVALUE", "REAL")
+    ]
+}
+
+ILIKE_PATTERN = re.compile(r'\bILIKE\b', re.IGNORECASE)
+
+sqlite3.register_converter("BOOLEAN", lambda value: value not in (b"0", b""))
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def read_frame(source):
+    if source is None or isinstance(source, pd.DataFrame):
+        return source
+    if str(source).endswith(".parquet"):
+        return pd.read_parquet(source)
+    return pd.read_csv(source)
+
+
+def align_frame(frame, table):
+    """Match source columns to the table's columns case-insensitively, as COPY INTO with headers would"""
+    by_name = {str(column).lower(): column for column in frame.columns}
+    aligned = pd.DataFrame(index=frame.index)
+    for column, _ in CATALOG_SCHEMAS[table]:
+        source = by_name.get(column.lower())
+        aligned[column] = frame[source] if source is not None else None
+
+    if table == "ATTRACTION" and aligned["PRICEVALUE"].isna().all():
+        parsed = price_parsing.parse_ticket_details_batch(aligned["Ticket Details"])
+        aligned["ISFREE"] = parsed["IsFree"]
+        aligned["PRICEVALUE"] = parsed["PriceValue"]
+    elif table == "HOTEL_DATA" and aligned["PRICEVALUE"].isna().all():
+        aligned["PRICEVALUE"] = price_parsing.extract_prices(aligned["Price (per night)"])
+    elif table == "TOUR" and aligned["PRICEVALUE"].isna().all():
+        aligned["PRICEVALUE"] = price_parsing.extract_prices(aligned["PRICE"])
+    if table == "ATTRACTION":
+        aligned["ISFREE"] = aligned["ISFREE"].map(lambda v: None if pd.isna(v) else int(str(v).lower() in ("1", "true")))
+    return aligned.astype(object).where(aligned.notna(), None)
+
+
+def seed_catalog(path=None, hotels=None, tours=None, attractions=None):
+    """
+    Build the SQLite catalog from DAG output files (CSV/Parquet paths) or DataFrames.
+    Tables without a source are created empty. The database is written beside
+    the target and renamed into place, so running services never see it half-built.
+    Returns {table: row count}.
+    """
+    path = path or LOCAL_CATALOG_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    sources = {"HOTEL_DATA": hotels, "TOUR": tours, "ATTRACTION": attractions}
+    counts = {}
+    conn = sqlite3.connect(tmp_path)
+    try:
+        for table, columns in CATALOG_SCHEMAS.items():
+            column_sql = ", ".join(f"{_quote(name)} {sql_type}" for name, sql_type in columns)
+            conn.execute(f"CREATE TABLE {table} ({column_sql})")
+            frame = read_frame(sources[table])
+            if frame is None:
+                counts[table] = 0
+                continue
+            rows = list(align_frame(frame, table).itertuples(index=False, name=None))
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            counts[table] = len(rows)
+        # Empty until record_versions() runs against this file, so the backend's version poll has a table to read
+        conn.execute(CREATE_VERSIONS_TABLE)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return counts
+
+
+class LocalCatalogCursor:
+    """DB-API cursor over SQLite that accepts the Snowflake dialect the fetch layer uses"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._cursor.execute(ILIKE_PATTERN.sub("LIKE", query), params)
+        return self
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        self._cursor.close()
+
+
+class LocalCatalogConnection:
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Local catalog not found at {path}; seed it with local_catalog.py")
+        # Autocommit, like the Snowflake connector, so version rows are visible to other connections at once
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                                     isolation_level=None)
+
+    def cursor(self):
+        return LocalCatalogCursor(self._conn.cursor())
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(path=None):
+    return LocalCatalogConnection(path or LOCAL_CATALOG_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the local SQLite catalog from DAG output files")
+    parser.add_argument("--db", default=LOCAL_CATALOG_PATH)
+    parser.add_argument("--hotels", help="hotels_with_coordinates.csv (hotel DAG)")
+    parser.add_argument("--tours", help="tours_with_coords.csv (tours DAG)")
+    parser.add_argument("--attractions", help="attractions_with_coords.csv (attractions DAG)")
+    args = parser.parse_args()
+    counts = seed_catalog(args.db, hotels=args.hotels, tours=args.tours, attractions=args.attractions)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    print(f"Local catalog written to {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Local, memory-mapped vector store for hidden-gem chunks.
+
+The YouTube DAG exports one shard per city next to its Pinecone upserts:
+
+    <LOCAL_VECTOR_DIR>/<city>.<version>.f32   row-major float32 matrix, one L2-normalized embedding per row
+    <LOCAL_VECTOR_DIR>/<city>.json             sidecar: {"vectors", "dimension", "count", "ids", "metadata"}
+
+The sidecar names the matrix file it describes, and a new export only swaps
+the sidecar into place after writing a new matrix file, so a reader always
+pairs the counts and metadata with the matching vectors. The previous
+KEEP_VERSIONS matrix files are kept for readers that loaded an older sidecar.
+
+Shards are opened with numpy.memmap, so worker processes share the OS page
+cache and nothing is read until a query touches it. Shards with at most
+LOCAL_VECTOR_EXACT_MAX rows are searched exactly with one matrix-vector
+product. Larger shards use an HNSW graph when the optional hnswlib package is
+installed, and fall back to exact search otherwise.
+
+LocalVectorIndex.query mirrors the subset of the Pinecone Index.query API that
+pinecone_fetch uses, so it can stand in for the Pinecone index.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+LOCAL_VECTOR_EXACT_MAX = int(os.getenv("LOCAL_VECTOR_EXACT_MAX", "20000"))
+HNSW_M = int(os.getenv("LOCAL_VECTOR_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("LOCAL_VECTOR_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("LOCAL_VECTOR_HNSW_EF_SEARCH", "64"))
+KEEP_VERSIONS = 3
+
+
+def _sidecar_path(directory, city):
+    return os.path.join(directory, f"{city}.json")
+
+
+def _vector_versions(directory, city):
+    """Matrix files of a city, oldest first; {city}.f32 is the unversioned layout"""
+    prefix = f"{city}."
+    names = [name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(".f32")
+             and "." not in name[len(prefix):-len(".f32")]]
+    return sorted(names, key=lambda name: name[len(prefix):-len(".f32")])
+
+
+def _prune(directory, city, current, keep):
+    for name in _vector_versions(directory, city)[:-keep]:
+        if name != current:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def write_city_shard(directory, city, ids, embeddings, metadata, keep=KEEP_VERSIONS):
+    """
+    Write a city's embeddings and metadata as a memory-mappable shard.
+    The matrix goes to a new versioned file and the sidecar naming it is renamed
+    into place, so readers see either the old shard or the new one, never a mix.
+    """
+    os.makedirs(directory, exist_ok=True)
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or len(matrix) != len(ids) or len(ids) != len(metadata):
+        raise ValueError("ids, embeddings and metadata must have the same number of rows")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.maximum(norms, 1e-12)
+
+    vectors_name = f"{city}.{time.time_ns():020d}-{uuid.uuid4().hex[:6]}.f32"
+    vectors_path = os.path.join(directory, vectors_name)
+    sidecar_path = _sidecar_path(directory, city)
+    with open(vectors_path + ".tmp", "wb") as f:
+        f.write(np.ascontiguousarray(matrix).tobytes())
+    os.replace(vectors_path + ".tmp", vectors_path)
+    sidecar_tmp = f"{sidecar_path}.{uuid.uuid4().hex}.tmp"
+    with open(sidecar_tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "city": city,
+            "vectors": vectors_name,
+            "dimension": int(matrix.shape[1]),
+            "count": int(matrix.shape[0]),
+            "ids": list(ids),
+            "metadata": list(metadata)
+        }, f)
+    # The sidecar is the one pointer readers follow; swapping it switches the whole shard
+    os.replace(sidecar_tmp, sidecar_path)
+    _prune(directory, city, vectors_name, keep)
+    return vectors_path
+
+
+class CityShard:
+    """One city's memory-mapped embedding matrix plus its metadata sidecar"""
+
+    def __init__(self, directory, city):
+        sidecar_path = _sidecar_path(directory, city)
+        with open(sidecar_path, "r", encoding="utf-8") as f:
+            # The mtime of the file actually read, so a sidecar swapped meanwhile is noticed next time
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            sidecar = json.load(f)
+        vectors_path = os.path.join(directory, sidecar.get("vectors", f"{city}.f32"))
+        self.city = city
+        self.ids = sidecar["ids"]
+        self.metadata = sidecar["metadata"]
+        self.dimension = sidecar["dimension"]
+        count = sidecar["count"]
+        if count:
+            self.vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(count, self.dimension))
+        else:
+            self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self._hnsw = None
+        self._hnsw_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _hnsw_index(self):
+        if self._hnsw is None:
+            with self._hnsw_lock:
+                if self._hnsw is None:
+                    index = hnswlib.Index(space="ip", dim=self.dimension)
+                    index.init_index(max_elements=len(self), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+                    index.add_items(np.asarray(self.vectors), np.arange(len(self)))
+                    index.set_ef(HNSW_EF_SEARCH)
+                    self._hnsw = index
+        return self._hnsw
+
+    def search(self, query, top_k, allowed=None):
+        """Return [(row, score)] for the top_k rows by cosine similarity. allowed is an optional row mask."""
+        if len(self) == 0 or top_k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        if len(self) > LOCAL_VECTOR_EXACT_MAX and hnswlib is not None:
+            index = self._hnsw_index()
+            k = min(top_k, len(self) if allowed is None else int(allowed.sum()))
+            if k == 0:
+                return []
+            row_filter = None if allowed is None else (lambda row: bool(allowed[row]))
+            labels, distances = index.knn_query(query, k=k, filter=row_filter)
+            return [(int(row), 1.0 - float(distance)) for row, distance in zip(labels[0], distances[0])]
+
+        rows = np.arange(len(self)) if allowed is None else np.flatnonzero(allowed)
+        if len(rows) == 0:
+            return []
+        scores = np.asarray(self.vectors[rows] if allowed is not None else self.vectors) @ query
+        k = min(top_k, len(rows))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+
+def _matches_filter(metadata, metadata_filter):
+    for field, condition in metadata_filter.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    """Pinecone-compatible query interface over the per-city shards in a directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def cities(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def shard(self, city):
+        """Open (or reuse) a city's shard, reopening it when the DAG has written a newer one"""
+        sidecar_path = _sidecar_path(self.directory, city)
+        if not os.path.exists(sidecar_path):
+            return None
+        mtime = os.path.getmtime(sidecar_path)
+        shard = self._shards.get(city)
+        if shard is None or shard.mtime != mtime:
+            with self._lock:
+                shard = self._shards.get(city)
+                if shard is None or shard.mtime != mtime:
+                    shard = CityShard(self.directory, city)
+                    self._shards[city] = shard
+        return shard
+
+    def _cities_for(self, metadata_filter):
+        condition = (metadata_filter or {}).get("city")
+        if isinstance(condition, dict) and "$eq" in condition:
+            return [condition["$eq"]]
+        if isinstance(condition, dict) and "$in" in condition:
+            return list(condition["$in"])
+        if isinstance(condition, str):
+            return [condition]
+        return self.cities()
+
+    def query(self, vector, top_k=10, filter=None, include_metadata=True, include_values=False, **kwargs):
+        matches = []
+        for city in self._cities_for(filter):
+            shard = self.shard(city)
+            if shard is None:
+                continue
+            # Pre-filter on metadata so top_k is taken over eligible rows only
+            other_conditions = {k: v for k, v in (filter or {}).items() if k != "city"}
+            allowed = None
+            if other_conditions:
+                allowed = np.fromiter(
+                    (_matches_filter(m, other_conditions) for m in shard.metadata),
+                    dtype=bool, count=len(shard)
+                )
+            for row, score in shard.search(vector, top_k, allowed):
+                matches.append(SimpleNamespace(
+                    id=shard.ids[row],
+                    score=score,
+                    metadata=shard.metadata[row] if include_metadata else None,
+                    values=np.asarray(shard.vectors[row]).tolist() if include_values else None
+                ))
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return SimpleNamespace(matches=matches[:top_k])
@@ -1,23 +1,34 @@
 import os
+import time
 import traceback
 import logging
 import uvicorn
-from fastapi import FastAPI, HTTPException, Response
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, field_validator
 from datetime import date
-from typing import Literal
+from typing import Dict, List, Literal, Optional
 from dotenv import load_dotenv
 from agents import run_crew_with_data, run_chat_with_agent
 from snowflake_fetch import (
     fetch_attractions,
     fetch_hotels,
     fetch_tours,
-    convert_decimal_to_float
+    version_watcher
 )
 from pinecone_fetch import fetch_hidden_gems
 from llm_formating import convert_itinerary_to_text
 from generate_pdf import create_itinerary_pdf
+from metrics import PROMETHEUS_CONTENT_TYPE, collect_timings, render_prometheus, stage_timer
+from profiling import ProfilerBusy, RequestProfile, is_admin, load_profile, profiling_requested, sampled
+from tracing import start_span
+import warmup
+import admission
+import fast_itinerary
+import catalog_versions
 
 load_dotenv(override=True)
 os.environ["LITELLM_API_KEY"] = os.getenv("XAI_API_KEY")
@@ -25,7 +36,17 @@ os.environ["LITELLM_API_KEY"] = os.getenv("XAI_API_KEY")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm caches in the background; /ready stays 503 until it is done
+    warmup.start_warmup()
+    # Drop cached catalog / hidden-gem entries as the DAGs record new dataset versions
+    stop_polling = version_watcher.start()
+    yield
+    if stop_polling is not None:
+        stop_polling.set()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -34,6 +55,62 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+@app.middleware("http")
+async def admit_requests(request: Request, call_next):
+    """
+    Per-endpoint concurrency, queue and priority limits. Over capacity answers
+    429/503 with Retry-After, except on ADMISSION_DEGRADE endpoints, which get
+    the rejection in request.state and may serve a cheaper response instead.
+    """
+    endpoint = request.url.path.strip("/")
+    if not admission.controller.controls(endpoint):
+        return await call_next(request)
+    with start_span("admission", endpoint=endpoint) as span:
+        try:
+            waited = await admission.controller.acquire(endpoint)
+        except admission.Rejected as e:
+            span.set_attribute("rejected", e.reason)
+            if endpoint not in admission.ADMISSION_DEGRADE:
+                return rejection_response(e)
+            request.state.admission_rejected = e
+            return await call_next(request)
+        span.set_attribute("wait_seconds", waited)
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        admission.controller.release(endpoint, time.perf_counter() - start)
+
+def rejection_response(rejected: admission.Rejected):
+    return JSONResponse(status_code=rejected.status_code, content={"detail": str(rejected)},
+                        headers={"Retry-After": str(rejected.retry_after)})
+
+# Added after admit_requests so it wraps it: the request span covers the queue wait
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Root span for each request; spans opened while handling it share its trace id"""
+    with start_span("http.request", **{"http.method": request.method, "http.path": request.url.path}) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+    response.headers["X-Trace-Id"] = span.trace_id
+    return response
+
+@app.exception_handler(ProfilerBusy)
+def profiler_busy_handler(request: Request, exc: ProfilerBusy):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+def request_profile(request: Request, endpoint: str, sample_caller: bool = True):
+    """
+    Profile this request if it asked to be profiled and carries the admin token.
+    Async endpoints pass sample_caller=False: the event-loop thread runs other
+    requests too, so only their sampled() threadpool work is profiled.
+    """
+    if not profiling_requested(request.headers, request.query_params):
+        return nullcontext()
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid admin token")
+    return RequestProfile(endpoint, sample_caller=sample_caller)
+
 class ItineraryInput(BaseModel):
     city: str
     start_date: date
@@ -50,6 +127,9 @@ class ItineraryInput(BaseModel):
     include_tours: bool = True
     include_accommodation: bool = True
     include_things: bool = True
+    interests: Optional[List[str]] = None
+    # "fast" renders without the LLM; "auto" does so only while the LLM is overloaded
+    mode: Literal["auto", "llm", "fast"] = "auto"
 
     @field_validator('end_date')
     def end_date_after_start(cls, end_date, values):
@@ -66,6 +146,11 @@ class PDFRequest(BaseModel):
     itinerary: str
     start_date: str
 
+class CacheInvalidation(BaseModel):
+    dataset: str
+    # City -> the version the DAG just recorded; None always invalidates
+    versions: Dict[str, Optional[str]]
+
 class RawDataRequest(BaseModel):
     city: str
     budget: Literal["low", "medium", "high"] = "medium"
@@ -74,17 +159,30 @@ class RawDataRequest(BaseModel):
     include_things: bool = True
 
 def fetch_itinerary_data(city, start_date, end_date, travel_type, adults, kids, budget,
-                         include_tours=True, include_accommodation=True, include_things=True):
+                         include_tours=True, include_accommodation=True, include_things=True,
+                         interests=None):
     logger.info("FETCHING ITINERARY DATA")
     logger.info(f"City: {city}, Budget: {budget}, Start: {start_date}, End: {end_date}")
     logger.info(f"Include Tours: {include_tours}, Include Accommodations: {include_accommodation}, Include Things to Do: {include_things}")
-    hotels = convert_decimal_to_float(fetch_hotels(city, budget)) if include_accommodation else []
+    hotels, tours, attractions = [], [], []
+    if include_accommodation:
+        with stage_timer("catalog.hotels"):
+            hotels = fetch_hotels(city, budget)
     logger.info(f"Fetched {len(hotels)} hotels")
-    tours = convert_decimal_to_float(fetch_tours(city, budget)) if include_tours else []
+    if include_tours:
+        with stage_timer("catalog.tours"):
+            tours = fetch_tours(city, budget)
     logger.info(f"Fetched {len(tours)} tours")
-    attractions = convert_decimal_to_float(fetch_attractions(city, budget, include_free=True)) if include_things else []
+    if include_things:
+        with stage_timer("catalog.attractions"):
+            attractions = fetch_attractions(city, budget, include_free=True)
     logger.info(f"Fetched {len(attractions)} attractions")
-    hidden_gems = fetch_hidden_gems(city)
+    with stage_timer("hidden_gems"):
+        hidden_gems = fetch_hidden_gems(city, preferences={
+            "budget": budget,
+            "travel_type": travel_type,
+            "interests": interests
+        })
     logger.info(f"Fetched {len(hidden_gems)} hidden gems")
 
     return {
@@ -106,11 +204,61 @@ def root():
     logger.info("Health check endpoint called")
     return {"status": "online"}
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once startup warm-up has finished, 503 before"""
+    status = warmup.state.as_dict()
+    if not warmup.state.ready:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.post("/cache/invalidate")
+def invalidate_cache(body: CacheInvalidation, request: Request):
+    """Notify endpoint the DAGs call after a load; only the named dataset's cities are refreshed"""
+    if not catalog_versions.is_notify_authorized(request.headers.get("x-notify-token")):
+        raise HTTPException(status_code=403, detail="Invalid notify token")
+    if body.dataset not in catalog_versions.registered_datasets():
+        raise HTTPException(status_code=400, detail=f"Unknown dataset {body.dataset}")
+    invalidated = [city for city, version in body.versions.items()
+                   if version_watcher.apply(body.dataset, city, version)]
+    logger.info(f"Cache invalidation for {body.dataset}: {invalidated}")
+    return {"dataset": body.dataset, "invalidated": invalidated}
+
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, request: Request, collapsed: bool = False):
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    profile = load_profile(profile_id, collapsed=collapsed)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile) if collapsed else profile
+
 @app.post("/generate-itinerary")
-def generate_itinerary(payload: ItineraryInput):
+async def generate_itinerary(payload: ItineraryInput, request: Request, response: Response, timings: bool = False):
+    # Over admission capacity: fast and auto mode are answered from the fast path; only llm mode is refused
+    rejected = getattr(request.state, "admission_rejected", None)
+    if rejected is not None and payload.mode == "llm":
+        return rejection_response(rejected)
+    with request_profile(request, "generate-itinerary", sample_caller=False) as profile, collect_timings() as request_timings:
+        with stage_timer("endpoint.generate_itinerary"):
+            result = await _generate_itinerary(payload, overflow=rejected is not None)
+    response.headers["Server-Timing"] = request_timings.header()
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+    if timings:
+        result["timings"] = request_timings.as_dict()
+    return result
+
+async def _generate_itinerary(payload: ItineraryInput, overflow: bool = False):
     try:
         logger.info("Generating itinerary")
-        structured_data = fetch_itinerary_data(
+        # Catalog and Pinecone clients block; run them in the threadpool and keep the loop free for LLM calls
+        structured_data = await run_in_threadpool(
+            sampled(fetch_itinerary_data),
             city=payload.city,
             start_date=payload.start_date,
             end_date=payload.end_date,
@@ -120,18 +268,37 @@ def generate_itinerary(payload: ItineraryInput):
             budget=payload.budget,
             include_tours=payload.include_tours,
             include_accommodation=payload.include_accommodation,
-            include_things=payload.include_things
+            include_things=payload.include_things,
+            interests=payload.interests
         )
 
-        html = run_crew_with_data(structured_data)
-        text_summary = convert_itinerary_to_text(html)
+        generator, reason = fast_itinerary.load_signal.choose(payload.mode, overflow=overflow)
+        if generator == "llm":
+            start = time.perf_counter()
+            try:
+                html = await run_crew_with_data(structured_data)
+            except Exception:
+                if payload.mode != "auto" or not fast_itinerary.FAST_ITINERARY_ON_ERROR:
+                    raise
+                logger.warning("LLM itinerary failed; serving the fast itinerary", exc_info=True)
+                generator, reason = "fast", "llm_error"
+            finally:
+                fast_itinerary.load_signal.observe(time.perf_counter() - start)
+        if generator == "llm":
+            with stage_timer("html_to_text"):
+                text_summary = await run_in_threadpool(sampled(convert_itinerary_to_text), html)
+        else:
+            with stage_timer("fast_itinerary"):
+                html, text_summary = fast_itinerary.render(structured_data)
+        fast_itinerary.ITINERARIES.inc(generator=generator, reason=reason)
 
-        logger.info("Itinerary generation successful")
+        logger.info(f"Itinerary generation successful ({generator}, {reason})")
         return {
             "status": "success",
             "data": {
                 "itinerary_html": html,
-                "itinerary_text": text_summary
+                "itinerary_text": text_summary,
+                "generator": generator
             }
         }
 
@@ -140,10 +307,20 @@ def generate_itinerary(payload: ItineraryInput):
         raise HTTPException(status_code=500, detail=f"Error generating itinerary: {str(e)}")
 
 @app.post("/generate-pdf")
-def generate_pdf(payload: PDFRequest):
+def generate_pdf(payload: PDFRequest, request: Request):
+    with request_profile(request, "generate-pdf") as profile, collect_timings() as request_timings:
+        with stage_timer("endpoint.generate_pdf"):
+            response = _generate_pdf(payload)
+    response.headers["Server-Timing"] = request_timings.header()
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+def _generate_pdf(payload: PDFRequest):
     try:
         logger.info(f"Generating PDF for city: {payload.city}")
-        pdf_bytes = create_itinerary_pdf(payload.city, payload.itinerary, payload.start_date)
+        with stage_timer("pdf.render"):
+            pdf_bytes = create_itinerary_pdf(payload.city, payload.itinerary, payload.start_date)
 
         if not pdf_bytes or pdf_bytes.getbuffer().nbytes == 0:
             raise ValueError("Generated PDF is empty.")
@@ -159,10 +336,21 @@ def generate_pdf(payload: PDFRequest):
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
 @app.post("/ask")
-def ask_question(req: ChatRequest):
+async def ask_question(req: ChatRequest, request: Request, response: Response, timings: bool = False):
+    with request_profile(request, "ask", sample_caller=False) as profile, collect_timings() as request_timings:
+        with stage_timer("endpoint.ask"):
+            result = await _ask_question(req)
+    response.headers["Server-Timing"] = request_timings.header()
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profile.id
+    if timings:
+        result["timings"] = request_timings.as_dict()
+    return result
+
+async def _ask_question(req: ChatRequest):
     try:
         logger.info("Handling chat request")
-        answer = run_chat_with_agent(req.itinerary, req.question)
+        answer = await run_chat_with_agent(req.itinerary, req.question)
         return {"answer": answer}
     except Exception as e:
         logger.error("Error during chat handling", exc_info=True)
@@ -0,0 +1,230 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Summaries keep a sliding window of recent observations so /metrics can report
+p50/p95/p99 (the official Python client's Summary does not export quantiles).
+Counters and gauges are plain labelled values. Everything is per process; with
+several workers, Prometheus scrapes each one.
+
+Stage timings are also collected per request when a RequestTimings is active
+(see collect_timings), which is what the Server-Timing header is built from.
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from tracing import start_span
+
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def quantile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Summary(_Metric):
+    """Count, sum and windowed quantiles per label set"""
+    kind = "summary"
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0, 0.0, deque(maxlen=METRICS_WINDOW)]
+            entry[0] += 1
+            entry[1] += value
+            entry[2].append(value)
+
+    def snapshot(self, **labels):
+        """Return {"count", "sum", 0.5, 0.95, 0.99} for one label set"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            if entry is None:
+                return {"count": 0, "sum": 0.0, **{q: float("nan") for q in QUANTILES}}
+            count, total, window = entry[0], entry[1], sorted(entry[2])
+        return {"count": count, "sum": total, **{q: quantile(window, q) for q in QUANTILES}}
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (v[0], v[1], sorted(v[2]))) for k, v in self._values.items())
+        lines = self.header()
+        for key, (count, total, window) in items:
+            for q in QUANTILES:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key, [('quantile', q)])} "
+                             f"{_format_value(quantile(window, q))}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(count)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def summary(self, name, documentation, labelnames=()):
+        return self._register(Summary, name, documentation, labelnames)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_DURATION = REGISTRY.summary(
+    "itinerary_stage_duration_seconds", "Time spent in each backend stage", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "itinerary_stage_errors_total", "Stage executions that raised", ["stage"])
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "itinerary_stage_in_flight", "Stage executions currently running", ["stage"])
+
+
+class RequestTimings:
+    """Ordered stage durations for a single request"""
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, stage, seconds):
+        self.entries.append((stage, seconds))
+
+    def as_dict(self):
+        """Milliseconds per stage; repeated stages are summed"""
+        totals = {}
+        for stage, seconds in self.entries:
+            totals[stage] = totals.get(stage, 0.0) + seconds * 1000
+        return {stage: round(ms, 3) for stage, ms in totals.items()}
+
+    def header(self):
+        """Server-Timing header value, e.g. 'catalog.hotels;dur=12.3, llm.itinerary;dur=4210.0'"""
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.as_dict().items())
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def collect_timings():
+    """Collect every stage timed in this context (and threads that copy it) into a RequestTimings"""
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record_timing(stage, seconds):
+    """Record a duration measured elsewhere, e.g. an LLM's time to first token"""
+    STAGE_DURATION.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a block as one execution of a stage: duration summary, error counter, in-flight gauge, span"""
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        with start_span(stage):
+            yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        record_timing(stage, time.perf_counter() - start)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+def render_prometheus():
+    return REGISTRY.render()
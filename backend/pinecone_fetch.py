@@ -1,63 +1,163 @@
 import os
-from pinecone import Pinecone
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from catalog_models import HiddenGem
+from cache import TTLCache
+from retrieval import build_hidden_gems_query, embed_query, mmr_rerank, normalize_query
+from local_vector_store import LocalVectorIndex
+from tracing import start_span
+import cassettes
+import resilience
+import catalog_versions
 
 load_dotenv(override=True)
 
+# Hidden gems only change when the YouTube DAG re-embeds a city, so results are
+# cached per city and dropped on TTL expiry or invalidate_hidden_gems(), which
+# catalog_versions calls when the DAG records a new HIDDEN_GEMS version for the city.
+HIDDEN_GEMS_CACHE_TTL = int(os.getenv("HIDDEN_GEMS_CACHE_TTL", "3600"))
+# Semantic results are keyed by the traveler's (free-form) interests as well, so the cache is LRU-bounded
+HIDDEN_GEMS_CACHE_MAX_ENTRIES = int(os.getenv("HIDDEN_GEMS_CACHE_MAX_ENTRIES", "2048"))
+
+# "semantic" embeds a query built from the traveler's preferences and re-ranks an
+# over-fetched candidate set with MMR; "city" returns arbitrary chunks for the city.
+HIDDEN_GEMS_RETRIEVAL = os.getenv("HIDDEN_GEMS_RETRIEVAL", "semantic")
+HIDDEN_GEMS_OVERFETCH = int(os.getenv("HIDDEN_GEMS_OVERFETCH", "4"))
+HIDDEN_GEMS_MMR_LAMBDA = float(os.getenv("HIDDEN_GEMS_MMR_LAMBDA", "0.7"))
+
+# "pinecone" queries the live index; "local" searches the memory-mapped shards the
+# YouTube DAG exports to LOCAL_VECTOR_DIR, with no network hop.
+HIDDEN_GEMS_BACKEND = os.getenv("HIDDEN_GEMS_BACKEND", "pinecone")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", os.path.join(os.path.dirname(__file__), "data", "vectors"))
+
+# Pinecone queries (with their query embedding) give up after PINECONE_TIMEOUT_SECONDS; slow or
+# failing ones trip the breaker, and expired gems are served for up to HIDDEN_GEMS_STALE_TTL meanwhile
+PINECONE_TIMEOUT_SECONDS = float(os.getenv("PINECONE_TIMEOUT_SECONDS", "3"))
+PINECONE_SLOW_SECONDS = float(os.getenv("PINECONE_SLOW_SECONDS", "1.5"))
+HIDDEN_GEMS_STALE_TTL = int(os.getenv("HIDDEN_GEMS_STALE_TTL", "86400"))
+
+_hidden_gems_cache = TTLCache(HIDDEN_GEMS_CACHE_TTL, stale_ttl=HIDDEN_GEMS_STALE_TTL,
+                              max_entries=HIDDEN_GEMS_CACHE_MAX_ENTRIES)
+pinecone_breaker = resilience.CircuitBreaker("pinecone", PINECONE_TIMEOUT_SECONDS, PINECONE_SLOW_SECONDS)
+_index = None
+_index_lock = threading.Lock()
+_local_index = None
+
+def _pinecone_client(api_key):
+    from pinecone import Pinecone
+    return Pinecone(api_key=api_key)
+
 def initialize_pinecone():
-    try:
-        api_key = os.getenv("PINECONE_API_KEY")
-        pc = Pinecone(api_key=api_key)
-        index_name = os.getenv("PINECONE_INDEX", "bigdatafinal")
-        index = pc.Index(index_name)
+    """
+    Return the process-wide Pinecone index handle, creating it on first use.
+    The handle keeps its HTTP connection pool, so every query reuses connections.
+    """
+    global _index
+    if _index is not None:
+        return _index
+    with _index_lock:
+        if _index is not None:
+            return _index
+        try:
+            api_key = os.getenv("PINECONE_API_KEY")
+            index_name = os.getenv("PINECONE_INDEX", "bigdatafinal")
+            _index = cassettes.proxy("pinecone", lambda: _pinecone_client(api_key).Index(index_name),
+                                     {"query": cassettes.PINECONE_QUERY})
+            return _index
+        except Exception as e:
+            print(f"Error initializing Pinecone: {e}")
+            return None
+
+def get_local_index() -> LocalVectorIndex:
+    global _local_index
+    if _local_index is None:
+        _local_index = LocalVectorIndex(LOCAL_VECTOR_DIR)
+    return _local_index
+
+def get_hidden_gems_index(formatted_city: str):
+    """Index for the configured backend, or None when it cannot serve this city"""
+    if HIDDEN_GEMS_BACKEND == "local":
+        index = get_local_index()
+        if index.shard(formatted_city) is None:
+            print(f"No local vector shard for {formatted_city} in {LOCAL_VECTOR_DIR}")
+            return None
         return index
-    except Exception as e:
-        print(f"Error initializing Pinecone: {e}")
-        return None
+    return initialize_pinecone()
 
-def fetch_hidden_gems(city: str, limit: int = 5) -> List[Dict[Any, Any]]:
+def reset_pinecone():
+    """Drop the shared index handle so the next call builds a new client"""
+    global _index
+    with _index_lock:
+        _index = None
+
+def invalidate_hidden_gems(city: Optional[str] = None) -> int:
+    """Expire cached hidden gems for one city (kept as stale), or drop them for every city when city is None"""
+    if city is None:
+        return _hidden_gems_cache.invalidate()
+    formatted_city = format_city_name(city)
+    return _hidden_gems_cache.invalidate(lambda key: key[0] == formatted_city, keep_stale=True)
+
+catalog_versions.register_invalidator(catalog_versions.HIDDEN_GEMS, invalidate_hidden_gems)
+
+def query_hidden_gem_matches(index, formatted_city: str, limit: int, query_text: Optional[str] = None):
+    """
+    Query the Pinecone (or local) index for a city's transcript chunks. Returns (matches, semantic) where
+    semantic is False when the city-only query was used.
+    """
+    city_filter = {"city": {"$eq": formatted_city}}
+    if query_text:
+        try:
+            query_vector = embed_query(query_text)
+        except Exception as e:
+            print(f"Error embedding hidden gems query, using city-only retrieval: {e}")
+        else:
+            with start_span("vector.query", backend=HIDDEN_GEMS_BACKEND, city=formatted_city,
+                            top_k=limit * HIDDEN_GEMS_OVERFETCH, semantic=True) as span:
+                results = index.query(
+                    vector=query_vector,
+                    filter=city_filter,
+                    top_k=limit * HIDDEN_GEMS_OVERFETCH,
+                    include_metadata=True,
+                    include_values=True
+                )
+                matches = list(results.matches)
+                span.set_attribute("matches", len(matches))
+            vectors = [match.values for match in matches if match.values]
+            if len(matches) > limit and len(vectors) == len(matches):
+                order = mmr_rerank(query_vector, vectors, limit, HIDDEN_GEMS_MMR_LAMBDA)
+                matches = [matches[i] for i in order]
+            return matches[:limit], True
+
+    with start_span("vector.query", backend=HIDDEN_GEMS_BACKEND, city=formatted_city,
+                    top_k=limit, semantic=False) as span:
+        results = index.query(
+            vector=[0] * 1536,
+            filter=city_filter,
+            top_k=limit,
+            include_metadata=True
+        )
+        span.set_attribute("matches", len(results.matches))
+    return results.matches, False
+
+def fetch_hidden_gems(city: str, limit: int = 5,
+                      preferences: Optional[Dict[str, Any]] = None) -> List[HiddenGem]:
+    """
+    Fetch hidden gems for a city. preferences may carry budget, travel_type and
+    interests, which shape the semantic query when HIDDEN_GEMS_RETRIEVAL=semantic.
+    """
     try:
         formatted_city = format_city_name(city)
-        index = initialize_pinecone()
-        if not index:
-            print(f"Failed to initialize Pinecone index, using fallback data")
-            fallback_data = get_fallback_hidden_gems(city)
-            if fallback_data:
-                return fallback_data
-            return []
-        try:
-            results = index.query(
-                vector=[0] * 1536,
-                filter={"city": {"$eq": formatted_city}},
-                top_k=limit,
-                include_metadata=True
-            )
-            hidden_gems = []
-            for match in results.matches:
-                metadata = match.metadata
-                gem = {
-                    "title": metadata.get("title", "Hidden Gem"),
-                    "description": metadata.get("text_sample", ""),
-                    "locations": metadata.get("locations", []),
-                    "costs": metadata.get("costs", []),
-                    "food": metadata.get("food", []),
-                    "url": metadata.get("url", ""),
-                    "source": metadata.get("channel", "Local Guide")
-                }
-                if metadata.get("time_references"):
-                    gem["time_references"] = metadata.get("time_references", [])
-                if metadata.get("landmarks"):
-                    gem["landmarks"] = metadata.get("landmarks", [])
-                if metadata.get("transport"):
-                    gem["transport"] = metadata.get("transport", [])
-                hidden_gems.append(gem)
-            print(f"Found {len(hidden_gems)} hidden gems for {city}")
-            return hidden_gems
-        except Exception as query_error:
-            print(f"Error querying Pinecone: {query_error}")
-            fallback_data = get_fallback_hidden_gems(city)
-            return fallback_data
+        query_text = None
+        if HIDDEN_GEMS_RETRIEVAL == "semantic":
+            query_text = build_hidden_gems_query(city, preferences)
+        cache_key = (formatted_city, limit, normalize_query(query_text) if query_text else None)
+        load = lambda: load_hidden_gems(city, formatted_city, limit, query_text, cache_key)
+        if HIDDEN_GEMS_BACKEND == "local":
+            # Local shards are memory-mapped in process; there is no remote dependency to guard
+            cached = _hidden_gems_cache.get(cache_key)
+            return list(cached if cached is not None else load())
+        return list(resilience.fetch_through(_hidden_gems_cache, cache_key, pinecone_breaker, load))
     except Exception as e:
         print(f"Error fetching hidden gems from Pinecone: {e}")
         fallback_data = get_fallback_hidden_gems(city)
@@ -66,6 +166,39 @@ def fetch_hidden_gems(city: str, limit: int = 5) -> List[Dict[Any, Any]]:
             return fallback_data
         return []
 
+def load_hidden_gems(city: str, formatted_city: str, limit: int, query_text: Optional[str], cache_key) -> List[HiddenGem]:
+    """Query the index for a city's hidden gems; raises when the index cannot serve it"""
+    index = get_hidden_gems_index(formatted_city)
+    if not index:
+        raise LookupError(f"Failed to initialize {HIDDEN_GEMS_BACKEND} index for {formatted_city}")
+    matches, semantic = query_hidden_gem_matches(index, formatted_city, limit, query_text)
+    hidden_gems = []
+    for match in matches:
+        hidden_gems.append(hidden_gem_from_metadata(match.metadata))
+    print(f"Found {len(hidden_gems)} hidden gems for {city}")
+    # Only live results are cached; fallback data is cheap and should not mask recovery
+    if semantic or not query_text:
+        _hidden_gems_cache.set(cache_key, hidden_gems)
+    return hidden_gems
+
+def hidden_gem_from_metadata(metadata: Dict[str, Any]) -> HiddenGem:
+    gem = HiddenGem(
+        title=metadata.get("title", "Hidden Gem"),
+        description=metadata.get("text_sample", ""),
+        locations=metadata.get("locations", []),
+        costs=metadata.get("costs", []),
+        food=metadata.get("food", []),
+        url=metadata.get("url", ""),
+        source=metadata.get("channel", "Local Guide")
+    )
+    if metadata.get("time_references"):
+        gem["time_references"] = metadata.get("time_references", [])
+    if metadata.get("landmarks"):
+        gem["landmarks"] = metadata.get("landmarks", [])
+    if metadata.get("transport"):
+        gem["transport"] = metadata.get("transport", [])
+    return gem
+
 def format_city_name(city: str) -> str:
     city_map = {
         "New York": "NewYork",
@@ -77,7 +210,7 @@ def format_city_name(city: str) -> str:
     }
     return city_map.get(city, city.replace(" ", ""))
 
-def get_fallback_hidden_gems(city: str) -> List[Dict[Any, Any]]:
+def get_fallback_hidden_gems(city: str) -> List[HiddenGem]:
     fallback_data = {
         "New York": [
             {
@@ -277,7 +410,7 @@ def get_fallback_hidden_gems(city: str) -> List[Dict[Any, Any]]:
             }
         ]
     }
-    return fallback_data.get(city, [])
+    return [HiddenGem.from_dict(gem) for gem in fallback_data.get(city, [])]
 
 if __name__ == "__main__":
     test_city = "San Francisco"
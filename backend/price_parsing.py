@@ -0,0 +1,129 @@
+"""
+Price parsing shared by the backend fetch layer and the Airflow DAG loaders.
+
+All patterns are compiled once at import. Each combined regex scans a string a
+single time and keeps the first hit per alternative, so the result matches the
+old "try pattern 1, then pattern 2, ..." behaviour without rescanning. The
+batch functions run the same patterns over a whole pandas column with
+``Series.str.extract``.
+"""
+import re
+
+import pandas as pd
+
+NUMBER = r'\d+(?:\.\d+)?'
+
+DOLLAR_PATTERN = re.compile(rf'\$\s*({NUMBER})')
+USD_PREFIX_PATTERN = re.compile(rf'USD\s*({NUMBER})')
+USD_SUFFIX_PATTERN = re.compile(rf'({NUMBER})\s*USD')
+NUMBER_PATTERN = re.compile(rf'({NUMBER})')
+
+# Ticket details: $ amount, then "USD 25", then "25 USD". The suffix form uses a
+# lookahead so it never consumes a "USD" that starts a prefix match.
+TICKET_PRICE_PATTERN = re.compile(
+    rf'\$\s*(?P<dollar>{NUMBER})'
+    rf'|USD\s*(?P<usd>{NUMBER})'
+    rf'|(?P<usd_suffix>{NUMBER})(?=\s*USD)'
+)
+TICKET_PRICE_GROUPS = ("dollar", "usd", "usd_suffix")
+
+# Hotel and tour price strings: $ amount, then "USD 25", then any number
+PRICE_PATTERN = re.compile(
+    rf'\$\s*(?P<dollar>{NUMBER})'
+    rf'|USD\s*(?P<usd>{NUMBER})'
+    rf'|(?P<number>{NUMBER})'
+)
+PRICE_GROUPS = ("dollar", "usd", "number")
+
+FREE_KEYWORDS = ['free', 'no charge', 'no fee', 'free entry', 'free admission', '$0']
+FREE_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in FREE_KEYWORDS))
+
+
+def _first_by_priority(pattern, groups, text):
+    found = {}
+    for match in pattern.finditer(text):
+        name = match.lastgroup
+        if name not in found:
+            found[name] = match.group(name)
+            if name == groups[0]:
+                break
+    for name in groups:
+        if name in found:
+            return float(found[name])
+    return 0
+
+
+def extract_ticket_price(ticket_details):
+    """Extract numeric price from ticket details text"""
+    if not ticket_details:
+        return 0
+    return _first_by_priority(TICKET_PRICE_PATTERN, TICKET_PRICE_GROUPS, ticket_details)
+
+
+def extract_price(price_text):
+    """Extract numeric price from a price string"""
+    if not price_text or not isinstance(price_text, str):
+        return 0
+    return _first_by_priority(PRICE_PATTERN, PRICE_GROUPS, price_text)
+
+
+def parse_ticket_details(ticket_details):
+    """
+    Return (is_free, price_value) for an attraction's ticket details in one pass.
+
+    Matches the old is_attraction_free + extract_price_from_ticket_details pair:
+    text with a free keyword, or with no non-zero $ amount, counts as free.
+    """
+    text = str(ticket_details if ticket_details is not None else 'None')
+    if FREE_PATTERN.search(text.lower()):
+        return True, 0
+    match = DOLLAR_PATTERN.search(text)
+    dollar_value = float(match.group(1)) if match else 0
+    if dollar_value == 0 and text:
+        return True, 0
+    return False, extract_ticket_price(ticket_details)
+
+
+def _extract_first(text, patterns):
+    result = None
+    for pattern in patterns:
+        values = pd.to_numeric(text.str.extract(pattern, expand=False), errors='coerce')
+        result = values if result is None else result.fillna(values)
+        if not result.isna().any():
+            break
+    return result.fillna(0).astype(float)
+
+
+def _as_text(series):
+    """Object column of strings, with None for missing and non-string values"""
+    series = pd.Series(series, dtype=object)
+    return series.where(series.map(type) == str, None)
+
+
+def extract_ticket_prices(series):
+    """Vectorized extract_ticket_price over a column of ticket details"""
+    return _extract_first(_as_text(series), [DOLLAR_PATTERN, USD_PREFIX_PATTERN, USD_SUFFIX_PATTERN])
+
+
+def extract_prices(series):
+    """Vectorized extract_price over a column of hotel or tour price strings"""
+    return _extract_first(_as_text(series), [DOLLAR_PATTERN, USD_PREFIX_PATTERN, NUMBER_PATTERN])
+
+
+def parse_ticket_details_batch(series):
+    """
+    Vectorized parse_ticket_details.
+
+    Returns a DataFrame with boolean ``IsFree`` and float ``PriceValue`` columns
+    aligned with the input index.
+    """
+    series = pd.Series(series, dtype=object)
+    text = series.fillna('None').astype(str)
+    has_keyword = text.str.contains(FREE_PATTERN.pattern, case=False, regex=True)
+    dollar = _extract_first(text, [DOLLAR_PATTERN])
+    is_free = has_keyword | ((dollar == 0) & (text.str.len() > 0))
+    # A paid row always has a non-zero $ amount, which is also what extract_ticket_price
+    # returns first, so the dollar column doubles as the price.
+    prices = dollar.where(~is_free, 0.0)
+    return pd.DataFrame({"IsFree": is_free.astype(bool), "PriceValue": prices.astype(float)},
+                        index=series.index)
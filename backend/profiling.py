@@ -0,0 +1,217 @@
+"""
+On-demand profiling of a single request.
+
+A request opts in with the X-Profile: 1 header (or ?profile=true) and must
+carry X-Admin-Token matching PROFILE_ADMIN_TOKEN; with no token configured,
+profiling is disabled. The request's threads are sampled every
+PROFILE_SAMPLE_INTERVAL_MS into collapsed stacks (the flamegraph.pl /
+speedscope input format) while tracemalloc records allocations. The report is
+written to PROFILE_OUTPUT_DIR as <id>.json plus <id>.folded.
+
+A sync endpoint is sampled on its own thread. An async endpoint shares the
+event-loop thread with every other request, so it passes sample_caller=False
+and only the threadpool work wrapped in sampled() is sampled, on whichever
+worker thread runs it.
+
+tracemalloc is process-wide, so only one request is profiled at a time and
+its allocation figures include anything other threads allocated meanwhile.
+"""
+import contextvars
+import functools
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", os.path.join(os.path.dirname(__file__), "data", "profiles"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))
+
+# Samples whose stack passes through one of these are also counted per section
+PROFILE_SECTIONS = ("fetch_itinerary_data", "run_crew_with_data", "build_itinerary_prompt", "convert_itinerary_to_text",
+                    "create_itinerary_pdf")
+
+_profile_lock = threading.Lock()
+# The profile of the request being handled, visible in the threadpool through the copied context
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def profiling_requested(headers, query_params):
+    flag = headers.get("x-profile") or query_params.get("profile") or ""
+    return flag.lower() in ("1", "true", "yes")
+
+
+def is_admin(token):
+    return bool(PROFILE_ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """Samples the Python stacks of a set of threads at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_ids, interval):
+        super().__init__(daemon=True)
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, thread_id):
+        """Start sampling thread_id; returns False if it already was"""
+        with self._lock:
+            if thread_id in self.thread_ids:
+                return False
+            self.thread_ids.add(thread_id)
+            return True
+
+    def discard(self, thread_id):
+        with self._lock:
+            self.thread_ids.discard(thread_id)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self.thread_ids)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+@contextmanager
+def sampled_thread():
+    """Sample the current thread for the active request profile, if there is one, while in the block"""
+    profile = _active_profile.get()
+    thread_id = threading.get_ident()
+    added = profile is not None and profile._sampler.add(thread_id)
+    try:
+        yield
+    finally:
+        if added:
+            profile._sampler.discard(thread_id)
+
+
+def sampled(fn):
+    """fn wrapped to run under sampled_thread(), for run_in_threadpool / asyncio.to_thread"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with sampled_thread():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class RequestProfile:
+    """
+    Context manager that profiles the request for the duration of the block: the
+    calling thread (unless sample_caller is false) and the threads entering sampled_thread()
+    """
+
+    def __init__(self, endpoint, output_dir=None, sample_caller=True):
+        self.id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.output_dir = output_dir or PROFILE_OUTPUT_DIR
+        self.sample_caller = sample_caller
+        self.report = None
+
+    def __enter__(self):
+        if not _profile_lock.acquire(blocking=False):
+            raise ProfilerBusy("Another request is being profiled")
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._before = tracemalloc.take_snapshot()
+        self._sampler = StackSampler([threading.get_ident()] if self.sample_caller else [],
+                                     PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        self._context_token = _active_profile.set(self)
+        self._started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            duration = time.perf_counter() - self._start
+            _active_profile.reset(self._context_token)
+            self._sampler.stop()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self.report = self._build_report(duration, after, peak, exc)
+            self._write(self._sampler.stacks)
+        finally:
+            _profile_lock.release()
+        return False
+
+    def _build_report(self, duration, after, peak, exc):
+        stacks = self._sampler.stacks
+        sections = {
+            name: sum(count for stack, count in stacks.items() if f";{name} (" in f";{stack}")
+            for name in PROFILE_SECTIONS
+        }
+        allocations = [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_kib": round(stat.size_diff / 1024, 1),
+                "count": stat.count_diff
+            }
+            for stat in after.compare_to(self._before, "lineno")[:PROFILE_TOP_ALLOCATIONS]
+        ]
+        return {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "started_at": self._started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "sample_interval_ms": PROFILE_SAMPLE_INTERVAL_MS,
+            "samples": sum(stacks.values()),
+            "sections": sections,
+            "peak_traced_kib": round(peak / 1024, 1),
+            "top_allocations": allocations,
+            "error": repr(exc) if exc is not None else None
+        }
+
+    def _write(self, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, f"{self.id}.json"), "w", encoding="utf-8") as f:
+            json.dump(self.report, f, indent=2)
+        with open(os.path.join(self.output_dir, f"{self.id}.folded"), "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def load_profile(profile_id, output_dir=None, collapsed=False):
+    """Return a stored report (dict) or its collapsed stacks (str); None if unknown"""
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(output_dir or PROFILE_OUTPUT_DIR, f"{profile_id}.{'folded' if collapsed else 'json'}")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read() if collapsed else json.load(f)
@@ -0,0 +1,208 @@
+"""
+Circuit breakers and stale-while-revalidate for the catalog (Snowflake) and
+hidden-gem (Pinecone) dependencies.
+
+Every call to a dependency runs under its breaker with a deadline, so a hung
+driver costs a request at most the breaker's timeout rather than the driver's.
+The breaker trips on latency as well as errors: when at least half of the last
+calls in its window failed, timed out or took longer than slow_seconds, it
+opens and calls fail fast for open_seconds. It then lets a single probe through
+(half-open); a good probe closes it again.
+
+fetch_through() puts the breaker in front of a TTLCache:
+
+    fresh entry           returned, the dependency is not called
+    breaker closed        load synchronously within the deadline; on failure
+                          or timeout the last good (stale) value is served
+    breaker open/probing  the stale value is served at once and one background
+                          refresh per key is started whenever the breaker lets
+                          a call through, so the cache catches up on recovery
+
+A call that misses its deadline keeps running in the breaker's pool; if it
+succeeds, load() still stores its result for the next request.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = REGISTRY.gauge(
+    "itinerary_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["dependency"])
+BREAKER_REJECTED = REGISTRY.counter(
+    "itinerary_breaker_rejected_total", "Calls failed fast by an open breaker", ["dependency"])
+STALE_SERVED = REGISTRY.counter(
+    "itinerary_stale_served_total", "Requests served stale cached data instead of a live call", ["dependency"])
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class DependencyTimeout(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    """Per-dependency breaker that counts errors, timeouts and slow calls over a sliding window"""
+
+    def __init__(self, name, timeout, slow_seconds, window=20, min_calls=5, failure_ratio=0.5,
+                 open_seconds=30, max_workers=8, clock=time.monotonic):
+        self.name = name
+        self.timeout = timeout
+        self.slow_seconds = slow_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], dependency=name)
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def _set_state(self, state):
+        self._state = state
+        BREAKER_STATE.set(STATE_VALUES[state], dependency=self.name)
+        logger.warning(f"Circuit breaker {self.name} is now {state}")
+
+    def allow(self):
+        """Reserve a call: always when closed, one probe at a time once the open period has passed"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._clock() - self._opened_at < self.open_seconds:
+                return False
+            if self._probing:
+                return False
+            if self._state == OPEN:
+                self._set_state(HALF_OPEN)
+            self._probing = True
+            return True
+
+    def record(self, seconds, ok):
+        good = ok and seconds <= self.slow_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                if good:
+                    self._outcomes.clear()
+                    self._set_state(CLOSED)
+                else:
+                    self._opened_at = self._clock()
+                    self._set_state(OPEN)
+                return
+            self._outcomes.append(good)
+            bad = self._outcomes.count(False)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and bad >= self.failure_ratio * len(self._outcomes)):
+                self._opened_at = self._clock()
+                self._set_state(OPEN)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run fn in the breaker's pool (with the caller's trace context). Returns
+        (future, settle): settle(seconds, ok) records the outcome once, whether
+        the call finishes first or the caller gives up on it.
+        """
+        context = contextvars.copy_context()
+        settled = threading.Lock()
+
+        def settle(seconds, ok):
+            if settled.acquire(blocking=False):
+                self.record(seconds, ok)
+
+        def run():
+            start = time.perf_counter()
+            try:
+                result = context.run(fn, *args, **kwargs)
+            except BaseException:
+                settle(time.perf_counter() - start, ok=False)
+                raise
+            settle(time.perf_counter() - start, ok=True)
+            return result
+
+        return self._pool.submit(run), settle
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) within the deadline; raises CircuitOpen or DependencyTimeout"""
+        if not self.allow():
+            BREAKER_REJECTED.inc(dependency=self.name)
+            raise CircuitOpen(f"{self.name} circuit is open")
+        future, settle = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Counted as a failure now; the call keeps running and may still fill the cache
+            settle(self.timeout, ok=False)
+            raise DependencyTimeout(f"{self.name} did not answer within {self.timeout}s") from None
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def refresh_in_background(breaker, key, load):
+    """Start load() for key unless a refresh for it is running or the breaker refuses the call"""
+    with _refreshing_lock:
+        if (breaker.name, key) in _refreshing:
+            return False
+        if not breaker.allow():
+            return False
+        _refreshing.add((breaker.name, key))
+
+    def done(future):
+        with _refreshing_lock:
+            _refreshing.discard((breaker.name, key))
+        if future.exception() is not None:
+            logger.info(f"Background refresh of {breaker.name} {key} failed: {future.exception()}")
+
+    future, settle = breaker.submit(load)
+    # Nobody waits on a refresh, so the deadline is enforced here: a hung probe must not hold the breaker half-open
+    deadline = threading.Timer(breaker.timeout, settle, args=(breaker.timeout, False))
+    deadline.daemon = True
+    deadline.start()
+    future.add_done_callback(lambda f: deadline.cancel())
+    future.add_done_callback(done)
+    return True
+
+
+def fetch_through(cache, key, breaker, load):
+    """
+    The value for key: fresh from cache, live from load() (which stores what is
+    worth keeping), or the last good value while the dependency is degraded.
+    Raises when there is neither a live nor a stale value.
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    stale = cache.get_stale(key)
+    if stale is not None and breaker.state != CLOSED:
+        refresh_in_background(breaker, key, load)
+        STALE_SERVED.inc(dependency=breaker.name)
+        return stale
+    try:
+        return breaker.call(load)
+    except Exception as e:
+        if stale is None:
+            raise
+        logger.warning(f"{breaker.name} failed ({e}); serving stale data for {key}")
+        STALE_SERVED.inc(dependency=breaker.name)
+        return stale
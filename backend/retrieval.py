@@ -0,0 +1,124 @@
+import os
+import re
+import threading
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+
+import cassettes
+from tracing import start_span
+
+load_dotenv(override=True)
+
+# Must match the model the YouTube DAG used to embed the transcript chunks
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "512"))
+# Query embeddings run in pinecone_breaker's pool, whose deadline is PINECONE_TIMEOUT_SECONDS; a call
+# that outlives it keeps a worker busy, so the client gives up at the same time and does not retry
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", os.getenv("PINECONE_TIMEOUT_SECONDS", "3")))
+
+BUDGET_PHRASES = {
+    "low": "cheap or free spots on a low budget",
+    "medium": "good value places on a moderate budget",
+    "high": "special experiences worth paying for",
+}
+TRAVEL_TYPE_PHRASES = {
+    "Solo": "for a solo traveler",
+    "With Family": "that are family friendly and fun for kids",
+}
+
+_openai_client = None
+_client_lock = threading.Lock()
+
+
+def build_hidden_gems_query(city: str, preferences: Optional[Dict[str, Any]] = None) -> str:
+    """Describe what the traveler is looking for, in the register of the transcript chunks"""
+    preferences = preferences or {}
+    parts = [f"hidden gems and local insider tips in {city}"]
+    travel_type = preferences.get("travel_type")
+    if travel_type in TRAVEL_TYPE_PHRASES:
+        parts.append(TRAVEL_TYPE_PHRASES[travel_type])
+    budget = preferences.get("budget")
+    if budget in BUDGET_PHRASES:
+        parts.append(BUDGET_PHRASES[budget])
+    interests = preferences.get("interests") or []
+    if isinstance(interests, str):
+        interests = [interests]
+    interests = sorted({i.strip().lower() for i in interests if i and i.strip()})
+    if interests:
+        parts.append("interested in " + ", ".join(interests))
+    return ", ".join(parts)
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        with _client_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=EMBEDDING_TIMEOUT_SECONDS,
+                                        max_retries=0)
+    return _openai_client
+
+
+@lru_cache(maxsize=EMBEDDING_CACHE_SIZE)
+def _embed_normalized(normalized_text: str) -> tuple:
+    with start_span("embedding.create", model=EMBEDDING_MODEL, chars=len(normalized_text)) as span:
+        response = cassettes.call(
+            "embeddings", (EMBEDDING_MODEL, normalized_text),
+            lambda: _get_openai_client().embeddings.create(input=normalized_text, model=EMBEDDING_MODEL),
+            to_record=lambda r: {"embedding": list(r.data[0].embedding),
+                                 "prompt_tokens": getattr(getattr(r, "usage", None), "prompt_tokens", None)},
+            from_record=lambda d: SimpleNamespace(data=[SimpleNamespace(embedding=d["embedding"])],
+                                                  usage=SimpleNamespace(prompt_tokens=d["prompt_tokens"]))
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            span.set_attribute("llm.prompt_tokens", getattr(usage, "prompt_tokens", None))
+    return tuple(response.data[0].embedding)
+
+
+def embed_query(text: str) -> List[float]:
+    """Embed a query, memoized in an LRU keyed by the normalized query text"""
+    return list(_embed_normalized(normalize_query(text)))
+
+
+def embedding_cache_info():
+    return _embed_normalized.cache_info()
+
+
+def mmr_rerank(query_vector: Sequence[float], candidate_vectors: Sequence[Sequence[float]],
+               k: int, lambda_mult: float = 0.7) -> List[int]:
+    """
+    Maximal marginal relevance: pick k candidates that are relevant to the query
+    but not redundant with each other. Returns indices into candidate_vectors.
+    """
+    if k <= 0 or len(candidate_vectors) == 0:
+        return []
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    remaining = np.ones(len(candidates), dtype=bool)
+    remaining[selected[0]] = False
+
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
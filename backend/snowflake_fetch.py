@@ -1,13 +1,40 @@
 import os
-import snowflake.connector
 import pandas as pd
 from dotenv import load_dotenv
 import math
 import re
 from decimal import Decimal
+from catalog_models import Attraction, Hotel, Tour, records_from_cursor
+import price_parsing
+import local_catalog
+import catalog_snapshot
+import catalog_versions
+from cities import standardize_city_name
+import cassettes
+from tracing import start_span
+from cache import TTLCache
+import resilience
 
 load_dotenv(override=True)
 
+# "snowflake", "sqlite" to read the catalog tables from a local file seeded by local_catalog.py,
+# or "snapshot" to read the DAG-exported, memory-mapped Arrow snapshots (catalog_snapshot.py) with
+# Snowflake as the fallback
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "snowflake")
+LOCAL_CATALOG_PATH = os.getenv("LOCAL_CATALOG_PATH", local_catalog.LOCAL_CATALOG_PATH)
+
+# Priced catalog rows per (table, city), shared by every budget; startup warm-up
+# fills it so first requests skip the query and price parsing.
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "900"))
+# Expired rows are kept this long to be served while Snowflake is degraded
+CATALOG_STALE_TTL = int(os.getenv("CATALOG_STALE_TTL", "86400"))
+_catalog_cache = TTLCache(CATALOG_CACHE_TTL, stale_ttl=CATALOG_STALE_TTL)
+
+# Catalog queries give up after SNOWFLAKE_TIMEOUT_SECONDS; slow or failing queries trip the breaker
+SNOWFLAKE_TIMEOUT_SECONDS = float(os.getenv("SNOWFLAKE_TIMEOUT_SECONDS", "10"))
+SNOWFLAKE_SLOW_SECONDS = float(os.getenv("SNOWFLAKE_SLOW_SECONDS", "3"))
+snowflake_breaker = resilience.CircuitBreaker("snowflake", SNOWFLAKE_TIMEOUT_SECONDS, SNOWFLAKE_SLOW_SECONDS)
+
 def convert_decimal_to_float(obj):
     """Convert Decimal values to float for JSON serialization"""
     if isinstance(obj, dict):
@@ -20,9 +47,12 @@ def convert_decimal_to_float(obj):
         return obj
 
 def get_connection():
-    """Establish connection to Snowflake"""
+    """Establish connection to Snowflake, or to the local catalog when CATALOG_BACKEND=sqlite"""
     try:
-        return snowflake.connector.connect(
+        if CATALOG_BACKEND == "sqlite":
+            return local_catalog.connect(LOCAL_CATALOG_PATH)
+        import snowflake.connector  # only the snowflake backend pays for the connector import
+        return cassettes.connection("snowflake", lambda: snowflake.connector.connect(
             user=os.getenv("SNOWFLAKE_USER"),
             password=os.getenv("SNOWFLAKE_PASSWORD"),
             account=os.getenv("SNOWFLAKE_ACCOUNT"),
@@ -30,11 +60,120 @@ def get_connection():
             database=os.getenv("SNOWFLAKE_DATABASE"),
             schema=os.getenv("SNOWFLAKE_SCHEMA"),
             role=os.getenv("SNOWFLAKE_ROLE")
-        )
+        ))
     except Exception as e:
-        print(f"Error connecting to Snowflake: {e}")
+        print(f"Error connecting to {CATALOG_BACKEND} catalog: {e}")
         raise
 
+def run_catalog_query(cursor, query, record_type, table, city):
+    """Execute a catalog query and fetch its rows as records, tracing each round trip"""
+    attributes = {"db.system": "sqlite" if CATALOG_BACKEND == "sqlite" else "snowflake", "db.table": table, "city": city}
+    with start_span("snowflake.execute", **attributes) as span:
+        cursor.execute(query)
+        span.set_attribute("db.query_id", getattr(cursor, "sfqid", None))
+    with start_span("snowflake.fetchall", **attributes) as span:
+        results = records_from_cursor(cursor, record_type)
+        span.set_attribute("db.rows", len(results))
+    return results
+
+CATALOG_QUERIES = {
+    "ATTRACTION": (Attraction, """
+        SELECT * FROM ATTRACTION 
+        WHERE (CITY ILIKE '%{city}%' 
+        OR CITY ILIKE '%{city} United States%')
+        """),
+    "HOTEL_DATA": (Hotel, """
+        SELECT * FROM HOTEL_DATA 
+        WHERE CITY ILIKE '%{city}%'
+        """),
+    "TOUR": (Tour, """
+        SELECT * FROM TOUR 
+        WHERE (CITY ILIKE '%{city}%' 
+        OR CITY ILIKE '%{city} United States%')
+        """)
+}
+
+def _price_catalog(table, records):
+    """Set PriceValue (and IsFree) and make hotel and tour ratings numeric, once per load"""
+    if table == "ATTRACTION":
+        add_ticket_prices(records)
+        return
+    add_prices(records, 'Price (per night)' if table == "HOTEL_DATA" else 'PRICE')
+    for record in records:
+        if record.get('RATING') and not isinstance(record.get('RATING'), (int, float)):
+            try:
+                record['RATING'] = float(record['RATING'])
+            except ValueError:
+                record['RATING'] = 0
+
+def load_snapshot(table, city):
+    """
+    A city's priced rows from the DAG-exported snapshot, or None when there is no snapshot of the table.
+    A city's rows are materialized and priced on first use, then shared until CURRENT moves to a new version.
+    """
+    record_type, _ = CATALOG_QUERIES[table]
+    with start_span("snapshot.read", **{"db.table": table, "city": city}) as span:
+        try:
+            results = catalog_snapshot.get_reader().records(table, city, record_type,
+                                                            lambda records: _price_catalog(table, records))
+        except catalog_snapshot.SnapshotNotFound:
+            results = None
+        span.set_attribute("db.rows", None if results is None else len(results))
+    return results
+
+def load_catalog(table, city):
+    """
+    Priced rows of one catalog table for a city, from the cache or a single query.
+    Callers filter a new list; the records themselves are shared and must not be mutated.
+    """
+    standardized_city = standardize_city_name(city)
+    if CATALOG_BACKEND == "snapshot":
+        results = load_snapshot(table, standardized_city)
+        if results is not None:
+            return list(results)
+        print(f"No {table} snapshot for {standardized_city}, falling back to Snowflake")
+
+    # Fresh cache, else a query under the Snowflake breaker, else the last good rows while it is degraded
+    return list(resilience.fetch_through(_catalog_cache, (table, standardized_city), snowflake_breaker,
+                                         lambda: query_catalog(table, standardized_city)))
+
+def query_catalog(table, standardized_city):
+    """Run the catalog query for a city and cache the priced rows"""
+    record_type, query = CATALOG_QUERIES[table]
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        print(f"Executing {table} query for city: {standardized_city}")
+        results = run_catalog_query(cursor, query.format(city=standardized_city), record_type, table, standardized_city)
+    finally:
+        if conn:
+            conn.close()
+    _price_catalog(table, results)
+    _catalog_cache.set((table, standardized_city), results)
+    return results
+
+def warm_catalog(city):
+    """Load every catalog table for a city into the cache; returns {table: row count}"""
+    return {table: len(load_catalog(table, city)) for table in CATALOG_QUERIES}
+
+def invalidate_catalog(city=None, table=None):
+    """
+    Expire cached catalog rows for one city (or every city), of one table (or every
+    table); they stay available as stale rows. With no arguments the cache is emptied.
+    """
+    standardized_city = standardize_city_name(city) if city is not None else None
+    if standardized_city is None and table is None:
+        return _catalog_cache.invalidate()
+    return _catalog_cache.invalidate(lambda key: (table is None or key[0] == table)
+                                     and (standardized_city is None or key[1] == standardized_city),
+                                     keep_stale=True)
+
+# Loads recorded in CATALOG_VERSIONS (or announced on /cache/invalidate) drop only their table and city
+for _table in CATALOG_QUERIES:
+    catalog_versions.register_invalidator(_table, lambda city, table=_table: invalidate_catalog(city, table))
+version_watcher = catalog_versions.VersionWatcher(get_connection)
+
 def fetch_attractions(city, budget="medium", include_free=True):
     """
     Fetch attractions data for a specific city with error handling and budget filtering
@@ -44,39 +183,15 @@ def fetch_attractions(city, budget="medium", include_free=True):
         budget: 'low', 'medium', or 'high'
         include_free: Whether to include free attractions
     """
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
         standardized_city = standardize_city_name(city)
-        query = f"""
-        SELECT * FROM ATTRACTION 
-        WHERE (CITY ILIKE '%{standardized_city}%' 
-        OR CITY ILIKE '%{standardized_city} United States%')
-        """
-        
-        print(f"Executing attractions query for city: {standardized_city}")
-        cursor.execute(query)
-        
-        columns = [desc[0] for desc in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        results = convert_decimal_to_float(results)
-        
-        # Process the results to determine if attractions are free and their price range
+        # Rows arrive with IsFree / PriceValue already set
+        results = load_catalog("ATTRACTION", standardized_city)
         processed_results = []
         
         for attraction in results:
-            is_free = is_attraction_free(attraction)
-            
-            price_value = 0
-            if not is_free:
-                price_value = extract_price_from_ticket_details(attraction.get('Ticket Details', ''))
-            
-            # Add flags to the attraction
-            attraction['IsFree'] = is_free
-            attraction['PriceValue'] = price_value
+            is_free = attraction['IsFree']
+            price_value = attraction['PriceValue']
             
             # Determine which budget category this fits
             if is_free:
@@ -102,33 +217,14 @@ def fetch_attractions(city, budget="medium", include_free=True):
     except Exception as e:
         print(f"Error fetching attractions: {e}")
         return []
-    
-    finally:
-        if conn:
-            conn.close()
 
 def fetch_hotels(city, budget="medium", top_n=5):
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
         standardized_city = standardize_city_name(city)
+        # Rows come back as Hotel records with Decimal values converted and PriceValue set
+        results = load_catalog("HOTEL_DATA", standardized_city)
         
-        query = f"""
-        SELECT * FROM HOTEL_DATA 
-        WHERE CITY ILIKE '%{standardized_city}%'
-        """
-        
-        print(f"Executing hotels query for city: {standardized_city}")
-        cursor.execute(query)
-        
-        columns = [desc[0] for desc in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        # Convert Decimal values to float for JSON serialization
-        results = convert_decimal_to_float(results)
-        
-        # Process hotels to extract price values and filter out those with no price
+        # Filter out hotels with no price
         hotels_with_price = []
         
         for hotel in results:
@@ -140,23 +236,10 @@ def fetch_hotels(city, budget="medium", top_n=5):
                 print(f"Skipping hotel with no price: {hotel.get('NAME', 'Unknown')}")
                 continue
                 
-            # Extract price value
-            price_value = extract_price(price_text)
-            
             # Skip hotels where price extraction failed (returned 0 or negative)
-            if price_value <= 0:
+            if hotel['PriceValue'] <= 0:
                 print(f"Skipping hotel with invalid price: {hotel.get('NAME', 'Unknown')} ('{price_text}')")
                 continue
-                
-            # Add price value to hotel data
-            hotel['PriceValue'] = price_value
-            
-            # Convert rating to numeric if it's not already
-            if hotel.get('RATING') and not isinstance(hotel.get('RATING'), (int, float)):
-                try:
-                    hotel['RATING'] = float(hotel['RATING'])
-                except ValueError:
-                    hotel['RATING'] = 0
             
             # Add to list of hotels with valid prices
             hotels_with_price.append(hotel)
@@ -193,8 +276,9 @@ def fetch_hotels(city, budget="medium", top_n=5):
                 end_idx = min(len(all_sorted), start_idx + top_n)
                 filtered_hotels = all_sorted[start_idx:end_idx]
         
-        # Sort by a combination of rating and price appropriateness for the budget
-        sorted_results = sort_hotels_by_value(filtered_hotels, budget)
+        # Sort by a combination of rating and price appropriateness for the budget.
+        # Scoring writes ValueScore, so it works on copies of the cached records.
+        sorted_results = sort_hotels_by_value([h.copy() for h in filtered_hotels], budget)
         
         # Return the top N hotels (or fewer if not enough available)
         top_hotels = sorted_results[:min(top_n, len(sorted_results))]
@@ -205,47 +289,12 @@ def fetch_hotels(city, budget="medium", top_n=5):
     except Exception as e:
         print(f"Error fetching hotels: {e}")
         return []
-    
-    finally:
-        if conn:
-            conn.close()
 
 def fetch_tours(city, budget="medium"):
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
         # Standardize city name for query
         standardized_city = standardize_city_name(city)
-        
-        query = f"""
-        SELECT * FROM TOUR 
-        WHERE (CITY ILIKE '%{standardized_city}%' 
-        OR CITY ILIKE '%{standardized_city} United States%')
-        """
-        
-        print(f"Executing tours query for city: {standardized_city}")
-        cursor.execute(query)
-        
-        columns = [desc[0] for desc in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        results = convert_decimal_to_float(results)
-        
-        # Process tours to extract price values
-        for tour in results:
-            # Extract numeric price from the price string
-            price_text = tour.get('PRICE', '')
-            price_value = extract_price(price_text)
-            tour['PriceValue'] = price_value
-            
-            # Convert rating to numeric
-            if tour.get('RATING') and isinstance(tour.get('RATING'), str):
-                try:
-                    tour['RATING'] = float(tour['RATING'])
-                except ValueError:
-                    tour['RATING'] = 0
+        results = load_catalog("TOUR", standardized_city)
         
         # Filter tours based on budget
         if budget == "low":
@@ -277,10 +326,6 @@ def fetch_tours(city, budget="medium"):
     except Exception as e:
         print(f"Error fetching tours: {e}")
         return []
-    
-    finally:
-        if conn:
-            conn.close()
 
 def get_next_closest_places(current_url, all_places, category_type="attraction", max_results=3):
     # Different field mappings based on category type
@@ -363,108 +408,47 @@ def get_next_closest_places(current_url, all_places, category_type="attraction",
 
 def is_attraction_free(attraction):
     """Determine if an attraction is free based on ticket details"""
-    # Check ticket details field (updated column name)
-    ticket_details = str(attraction.get('Ticket Details', '')).lower()
-    
-    # Keywords indicating free entry
-    free_keywords = ['free', 'no charge', 'no fee', 'free entry', 'free admission', '$0']
-    
-    # Check for free keywords
-    for keyword in free_keywords:
-        if keyword in ticket_details:
-            return True
-    
-    # Check if price has actual value
-    price_value = extract_price_from_ticket_details(ticket_details)
-    if price_value == 0 and ticket_details:
-        return True
-    
-    # Default to not free
-    return False
+    is_free, _ = price_parsing.parse_ticket_details(attraction.get('Ticket Details', ''))
+    return is_free
 
 def extract_price_from_ticket_details(ticket_details):
     """Extract numeric price from ticket details text"""
-    if not ticket_details:
-        return 0
-    
-    # Look for price patterns
-    price_patterns = [
-        r'\$\s*(\d+(?:\.\d+)?)',  
-        r'USD\s*(\d+(?:\.\d+)?)',  
-        r'(\d+(?:\.\d+)?)\s*USD',  
-        r'Adult(?:[^$])\$\s(\d+(?:\.\d+)?)', 
-        r'Price(?:[^$])\$\s(\d+(?:\.\d+)?)'   
-    ]
-    
-    for pattern in price_patterns:
-        matches = re.findall(pattern, ticket_details)
-        if matches:
-            try:
-                # Return the first price found
-                return float(matches[0])
-            except ValueError:
-                continue
-    
-    return 0
+    return price_parsing.extract_ticket_price(ticket_details)
 
 def extract_price(price_text):
     """Extract numeric price from a price string"""
-    if not price_text or not isinstance(price_text, str):
-        return 0
-    
-    # Look for price patterns
-    price_pattern = r'\$\s*(\d+(?:\.\d+)?)'
-    usd_pattern = r'USD\s*(\d+(?:\.\d+)?)'   
-    
-    # Try dollar sign pattern
-    dollar_matches = re.findall(price_pattern, price_text)
-    if dollar_matches:
-        try:
-            return float(dollar_matches[0])
-        except ValueError:
-            pass
-    
-    # Try USD pattern
-    usd_matches = re.findall(usd_pattern, price_text)
-    if usd_matches:
-        try:
-            return float(usd_matches[0])
-        except ValueError:
-            pass
-    
-    # Try extracting any number
-    number_pattern = r'(\d+(?:\.\d+)?)'
-    number_matches = re.findall(number_pattern, price_text)
-    if number_matches:
-        try:
-            return float(number_matches[0])
-        except ValueError:
-            pass
-    
-    return 0
-
-def standardize_city_name(city):
-    if not city:
-        return ""
-    
-    city_lower = city.lower()
-    
-    # Handle common variations
-    if "new york" in city_lower:
-        return "New York"
-    elif "san francisco" in city_lower:
-        return "San Francisco"
-    elif "los angeles" in city_lower:
-        return "Los Angeles"
-    elif "las vegas" in city_lower:
-        return "Las Vegas"
-    elif "chicago" in city_lower:
-        return "Chicago"
-    elif "seattle" in city_lower:
-        return "Seattle"
-    
-    # Default: return the city name as-is
-    return city
+    return price_parsing.extract_price(price_text)
+
+def _missing_price(records):
+    return [record for record in records if record.get('PriceValue') is None]
+
+def add_ticket_prices(attractions):
+    """
+    Set IsFree and PriceValue on attractions, parsing ticket details in one batch.
+    Rows loaded with the DAG's precomputed PRICEVALUE/ISFREE columns are kept as-is.
+    """
+    missing = _missing_price(attractions)
+    if not missing:
+        return attractions
+    parsed = price_parsing.parse_ticket_details_batch(
+        pd.Series([a.get('Ticket Details', '') for a in missing], dtype=object)
+    )
+    for attraction, is_free, price_value in zip(missing, parsed['IsFree'], parsed['PriceValue']):
+        attraction['IsFree'] = bool(is_free)
+        attraction['PriceValue'] = float(price_value)
+    return attractions
+
+def add_prices(records, price_column):
+    """Set PriceValue on hotels or tours from their price column in one batch"""
+    missing = _missing_price(records)
+    if not missing:
+        return records
+    prices = price_parsing.extract_prices(
+        pd.Series([r.get(price_column, '') for r in missing], dtype=object)
+    )
+    for record, price_value in zip(missing, prices):
+        record['PriceValue'] = float(price_value)
+    return records
 
 def sort_hotels_by_value(hotels, budget):
     # Calculate a value score for each hotel
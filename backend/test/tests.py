@@ -3,7 +3,7 @@ import os
 import sys
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from io import BytesIO
 
 # Add backend path
@@ -14,8 +14,8 @@ sys.modules['agents'] = MagicMock()
 sys.modules['agents'].Agent = MagicMock()
 sys.modules['agents'].Runner = MagicMock()
 sys.modules['agents'].trace = MagicMock()
-sys.modules['agents'].run_crew_with_data = MagicMock(return_value="<html><body>Mock Itinerary</body></html>")
-sys.modules['agents'].run_chat_with_agent = MagicMock(return_value="Mock Answer")
+sys.modules['agents'].run_crew_with_data = AsyncMock(return_value="<html><body>Mock Itinerary</body></html>")
+sys.modules['agents'].run_chat_with_agent = AsyncMock(return_value="Mock Answer")
 
 # Mock other dependencies
 sys.modules['langchain_openai'] = MagicMock()
@@ -100,4 +100,934 @@ def test_ask_question_valid():
     payload = {"itinerary": "Sample Itinerary", "question": "What places do I visit?"}
     response = client.post("/ask", json=payload)
     assert response.status_code == 200
-    assert response.json() == {"answer": "Mock Answer"}
\ No newline at end of file
+    assert response.json() == {"answer": "Mock Answer"}
+# ---------------- Catalog Record Tests ---------------- #
+
+def test_catalog_record_dict_access_and_json():
+    from decimal import Decimal
+    from catalog_models import Attraction, dumps
+
+    attraction = Attraction.from_row(
+        ["PLACENAME", "Ticket Details", "LATITUDE", "NEW_COLUMN"],
+        ["Museum", "Adult Price: $32", Decimal("40.7"), "x"]
+    )
+    attraction["PriceValue"] = 32.0
+
+    assert attraction.get("LATITUDE") == 40.7
+    assert attraction.get("IMAGE", "none") == "none"
+    assert "IMAGE" not in attraction
+    assert attraction.to_dict() == {
+        "Ticket Details": "Adult Price: $32",
+        "LATITUDE": 40.7,
+        "PLACENAME": "Museum",
+        "PriceValue": 32.0,
+        "NEW_COLUMN": "x"
+    }
+    assert '"PriceValue":32.0' in dumps({"attractions": [attraction]}).replace(" ", "")
+
+# ---------------- Price Parsing Tests ---------------- #
+
+def test_price_parsing_batch_matches_scalar():
+    import pandas as pd
+    import price_parsing
+
+    ticket_details = [
+        "Adult Price: $32\nChild Price: $26", "Free entry", "N/A", None, "",
+        "Tickets from USD 25", "General admission 18 USD", "Adult: $0 under 3"
+    ]
+    parsed = price_parsing.parse_ticket_details_batch(pd.Series(ticket_details, dtype=object))
+    assert list(zip(parsed["IsFree"], parsed["PriceValue"])) == [
+        price_parsing.parse_ticket_details(value) for value in ticket_details
+    ]
+    assert price_parsing.parse_ticket_details("Adult Price: $32\nChild Price: $26") == (False, 32.0)
+
+    prices = ["$189", "USD 240 per night", "From 99", "N/A", None]
+    assert price_parsing.extract_prices(pd.Series(prices, dtype=object)).tolist() == [189.0, 240.0, 99.0, 0.0, 0.0]
+
+# ---------------- Hidden Gems Cache Tests ---------------- #
+
+def test_hidden_gems_cached_per_city_until_invalidated():
+    import pinecone_fetch
+
+    match = MagicMock(metadata={"title": "Sutro Baths", "text_sample": "Ruins", "channel": "SF"})
+    index = MagicMock()
+    index.query.return_value = MagicMock(matches=[match])
+
+    pinecone_fetch.invalidate_hidden_gems()
+    with patch.object(pinecone_fetch, "get_hidden_gems_index", return_value=index), \
+         patch.object(pinecone_fetch, "embed_query", return_value=[1.0, 0.0]):
+        first = pinecone_fetch.fetch_hidden_gems("San Francisco")
+        second = pinecone_fetch.fetch_hidden_gems("San Francisco")
+        assert index.query.call_count == 1
+        assert first == second and first[0]["title"] == "Sutro Baths"
+
+        assert pinecone_fetch.invalidate_hidden_gems("Chicago") == 0
+        assert pinecone_fetch.invalidate_hidden_gems("San Francisco") == 1
+        pinecone_fetch.fetch_hidden_gems("San Francisco")
+        assert index.query.call_count == 2
+
+        # Every distinct set of interests is its own entry; the cache stays within its LRU bound
+        with patch.object(pinecone_fetch._hidden_gems_cache, "max_entries", 3):
+            for i in range(10):
+                pinecone_fetch.fetch_hidden_gems("San Francisco", preferences={"interests": [f"interest {i}"]})
+            assert len(pinecone_fetch._hidden_gems_cache._entries) == 3
+    pinecone_fetch.invalidate_hidden_gems()
+
+
+def test_semantic_hidden_gems_rerank_with_mmr():
+    import pinecone_fetch
+    from retrieval import build_hidden_gems_query, mmr_rerank
+
+    # Two near-duplicate chunks and one distinct chunk: MMR keeps the distinct one
+    assert mmr_rerank([1.0, 0.0], [[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]], k=2, lambda_mult=0.3) == [0, 2]
+
+    query = build_hidden_gems_query("Chicago", {"budget": "low", "travel_type": "With Family",
+                                                "interests": ["Food", "art "]})
+    assert "family friendly" in query and "low budget" in query and "art, food" in query
+
+    matches = [MagicMock(metadata={"title": f"Gem {i}"}, values=[1.0, i / 10]) for i in range(8)]
+    index = MagicMock()
+    index.query.return_value = MagicMock(matches=matches)
+    with patch.object(pinecone_fetch, "embed_query", return_value=[1.0, 0.0]):
+        gems, semantic = pinecone_fetch.query_hidden_gem_matches(index, "Chicago", 3, query)
+    assert semantic and len(gems) == 3
+    assert index.query.call_args.kwargs["top_k"] == 3 * pinecone_fetch.HIDDEN_GEMS_OVERFETCH
+
+
+def test_local_vector_index_serves_hidden_gems_offline(tmp_path):
+    import numpy as np
+    import pinecone_fetch
+    from local_vector_store import LocalVectorIndex, write_city_shard
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 1536)).astype("float32")
+    metadata = [{"city": "Seattle", "title": f"Chunk {i}", "costs": ["free"] if i % 2 else []} for i in range(50)]
+    write_city_shard(str(tmp_path), "Seattle", [f"Seattle_{i}" for i in range(50)], vectors, metadata)
+
+    index = LocalVectorIndex(str(tmp_path))
+    results = index.query(vector=vectors[7].tolist(), filter={"city": {"$eq": "Seattle"}}, top_k=3)
+    assert results.matches[0].id == "Seattle_7"
+    assert abs(results.matches[0].score - 1.0) < 1e-5
+    free_only = index.query(vector=vectors[8].tolist(), filter={"city": {"$eq": "Seattle"}, "costs": {"$eq": ["free"]}}, top_k=5)
+    assert len(free_only.matches) == 5 and all(m.metadata["costs"] == ["free"] for m in free_only.matches)
+    assert index.query(vector=vectors[0].tolist(), filter={"city": {"$eq": "Chicago"}}).matches == []
+
+    # Re-exports swap the sidecar onto a new matrix file; the shard reopens whole and old files are pruned
+    import local_vector_store
+    for rows in (10, 20, 30, 40):
+        write_city_shard(str(tmp_path), "Seattle", [f"Seattle_{i}" for i in range(rows)], vectors[:rows], metadata[:rows])
+    shard = index.shard("Seattle")
+    assert len(shard) == shard.vectors.shape[0] == 40
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".f32")]) == local_vector_store.KEEP_VERSIONS
+    write_city_shard(str(tmp_path), "Seattle", [f"Seattle_{i}" for i in range(50)], vectors, metadata)
+
+    pinecone_fetch.invalidate_hidden_gems()
+    with patch.object(pinecone_fetch, "HIDDEN_GEMS_BACKEND", "local"), \
+         patch.object(pinecone_fetch, "HIDDEN_GEMS_RETRIEVAL", "city"), \
+         patch.object(pinecone_fetch, "_local_index", index):
+        gems = pinecone_fetch.fetch_hidden_gems("Seattle", limit=4)
+        assert len(gems) == 4 and gems[0]["title"].startswith("Chunk")
+        # No shard for Chicago: falls back to the built-in list
+        assert pinecone_fetch.fetch_hidden_gems("Chicago")[0]["title"] == "Garfield Park Conservatory"
+    pinecone_fetch.invalidate_hidden_gems()
+
+
+# ---------------- Metrics Tests ---------------- #
+
+def test_metrics_endpoint_reports_stage_quantiles():
+    client.post("/ask", json={"itinerary": "Sample Itinerary", "question": "Where do I stay?"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert '# TYPE itinerary_stage_duration_seconds summary' in body
+    assert 'itinerary_stage_duration_seconds{stage="endpoint.ask",quantile="0.99"}' in body
+    assert 'itinerary_stage_duration_seconds_count{stage="endpoint.ask"}' in body
+    assert 'itinerary_stage_in_flight{stage="endpoint.ask"} 0.0' in body
+
+
+# ---------------- Server-Timing Tests ---------------- #
+
+def test_server_timing_header_and_timings_field():
+    payload = {
+        "city": "New York",
+        "start_date": "2025-05-01",
+        "end_date": "2025-05-03",
+        "preference": "Suggest an itinerary with Tours, Accommodation, Things to do",
+        "travel_type": "Solo",
+        "budget": "medium"
+    }
+    response = client.post("/generate-itinerary?timings=true", json=payload)
+    assert response.status_code == 200
+    header = response.headers["Server-Timing"]
+    for stage in ("catalog.hotels", "catalog.tours", "catalog.attractions", "hidden_gems",
+                  "html_to_text", "endpoint.generate_itinerary"):
+        assert f"{stage};dur=" in header
+    timings = response.json()["timings"]
+    assert set(timings) >= {"catalog.hotels", "hidden_gems", "endpoint.generate_itinerary"}
+    assert timings["endpoint.generate_itinerary"] >= timings["catalog.hotels"]
+
+    response = client.post("/ask", json={"itinerary": "Sample Itinerary", "question": "Where?"})
+    assert "endpoint.ask;dur=" in response.headers["Server-Timing"]
+    assert "timings" not in response.json()
+
+
+# ---------------- Profiler Tests ---------------- #
+
+def test_profiling_requires_admin_token_and_stores_report(tmp_path):
+    import profiling
+    with patch.object(profiling, "PROFILE_ADMIN_TOKEN", "secret"), \
+         patch.object(profiling, "PROFILE_OUTPUT_DIR", str(tmp_path)):
+        payload = {"city": "Paris", "itinerary": "Day 1: Louvre", "start_date": "2025-05-01"}
+        denied = client.post("/generate-pdf", json=payload, headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+        assert denied.status_code == 403
+        # A non-ASCII token is refused like any wrong one, not an error
+        denied = client.post("/generate-pdf", json=payload, headers={"X-Profile": "1", "X-Admin-Token": "sécret".encode()})
+        assert denied.status_code == 403
+
+        response = client.post("/generate-pdf?profile=true", json=payload, headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        profile_id = response.headers["X-Profile-Id"]
+
+        report = client.get(f"/profiles/{profile_id}", headers={"X-Admin-Token": "secret"}).json()
+        assert report["endpoint"] == "generate-pdf"
+        assert set(report["sections"]) == set(profiling.PROFILE_SECTIONS)
+        assert isinstance(report["top_allocations"], list)
+        collapsed = client.get(f"/profiles/{profile_id}?collapsed=true", headers={"X-Admin-Token": "secret"})
+        assert collapsed.status_code == 200
+        assert client.get(f"/profiles/{profile_id}").status_code == 403
+
+    assert "X-Profile-Id" not in client.post("/generate-pdf", json=payload).headers
+
+
+def test_profiling_async_endpoint_samples_its_threadpool_work(tmp_path, monkeypatch):
+    import time
+    import profiling
+
+    def slow_hotels(*args, **kwargs):
+        time.sleep(0.1)
+        return [{"name": "Mock Hotel"}]
+
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_INTERVAL_MS", 2)
+    monkeypatch.setattr(mock_fetch_hotels, "side_effect", slow_hotels)
+    payload = {
+        "city": "New York",
+        "start_date": "2025-04-20",
+        "end_date": "2025-04-21",
+        "preference": "Suggest an itinerary with Things to do",
+        "travel_type": "Solo",
+        "mode": "fast"
+    }
+    response = client.post("/generate-itinerary?profile=true", json=payload, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+
+    # The catalog fetch ran in the threadpool, not on the event-loop thread, and is still in the profile
+    report = profiling.load_profile(response.headers["X-Profile-Id"])
+    assert report["sections"]["fetch_itinerary_data"] > 0
+    assert report["sections"]["fetch_itinerary_data"] == report["samples"]
+
+
+# ---------------- Tracing Tests ---------------- #
+
+def test_request_spans_form_one_trace(tmp_path):
+    import json
+    import tracing
+    trace_file = tmp_path / "traces.jsonl"
+    previous = tracing.set_exporter(tracing.build_exporter("file", str(trace_file)))
+    try:
+        payload = {
+            "city": "New York",
+            "start_date": "2025-05-01",
+            "end_date": "2025-05-02",
+            "preference": "Suggest an itinerary with Tours, Accommodation, Things to do",
+            "travel_type": "Solo"
+        }
+        response = client.post("/generate-itinerary", json=payload)
+    finally:
+        tracing.set_exporter(previous)
+
+    spans = {span["name"]: span for span in map(json.loads, trace_file.read_text().splitlines())}
+    root = spans["http.request"]
+    assert response.headers["X-Trace-Id"] == root["trace_id"]
+    assert root["parent_id"] is None
+    assert root["attributes"]["http.status_code"] == 200
+    endpoint = spans["endpoint.generate_itinerary"]
+    assert endpoint["parent_id"] == root["span_id"]
+    assert spans["catalog.hotels"]["parent_id"] == endpoint["span_id"]
+    assert {span["trace_id"] for span in spans.values()} == {root["trace_id"]}
+
+
+# ---------------- Local Catalog Tests ---------------- #
+
+def test_local_catalog_backend_matches_fetch_semantics(tmp_path):
+    import pandas as pd
+    import local_catalog
+    import snowflake_fetch
+
+    hotels = pd.DataFrame({
+        "City": ["New York", "New York", "New York", "Boston"],
+        "Name": ["Budget Inn", "Midtown Suites", "Grand Palace", "Harbor Hotel"],
+        "Rating": [3.9, 4.4, 4.8, 4.1],
+        "Price (per night)": ["$120", "USD 240", "$480", "$200"],
+        "Latitude": [40.75, 40.76, 40.77, 42.36],
+        "Longitude": [-73.99, -73.98, -73.97, -71.05]
+    })
+    attractions = pd.DataFrame({
+        "City": ["New York", "New York, United States", "Chicago"],
+        "PlaceName": ["Central Park", "Top of the Rock", "Bean"],
+        "Ticket Details": ["Free entry", "Adult Price: $40", "Free"],
+        "Latitude": [40.78, 40.76, 41.88],
+        "Longitude": [-73.96, -73.98, -87.62]
+    })
+    tours_path = tmp_path / "tours.csv"
+    pd.DataFrame({
+        "City": ["New York"] * 2,
+        "Title": ["Harbor Cruise", "Food Walk"],
+        "Rating": ["4.6", "4.9"],
+        "Price": ["$35", "$95"]
+    }).to_csv(tours_path, index=False)
+
+    db = str(tmp_path / "catalog.sqlite")
+    counts = local_catalog.seed_catalog(db, hotels=hotels, tours=str(tours_path), attractions=attractions)
+    assert counts == {"HOTEL_DATA": 4, "TOUR": 2, "ATTRACTION": 3}
+
+    snowflake_fetch.invalidate_catalog()
+    with patch.object(snowflake_fetch, "CATALOG_BACKEND", "sqlite"), \
+         patch.object(snowflake_fetch, "LOCAL_CATALOG_PATH", db):
+        fetched_hotels = snowflake_fetch.fetch_hotels("new york city", "medium")
+        fetched_attractions = snowflake_fetch.fetch_attractions("New York", "low")
+        fetched_tours = snowflake_fetch.fetch_tours("New York", "low")
+    snowflake_fetch.invalidate_catalog()
+
+    assert {h["NAME"] for h in fetched_hotels} == {"Budget Inn", "Midtown Suites", "Grand Palace"}
+    assert all(isinstance(h["PriceValue"], float) for h in fetched_hotels)
+    by_name = {a["PLACENAME"]: a for a in fetched_attractions}
+    assert set(by_name) == {"Central Park", "Top of the Rock"}
+    assert by_name["Central Park"]["IsFree"] is True
+    assert by_name["Top of the Rock"]["PriceValue"] == 40.0
+    assert [t["TITLE"] for t in fetched_tours] == ["Food Walk", "Harbor Cruise"]
+
+
+# ---------------- Fake LLM Server Tests ---------------- #
+
+def test_fake_llm_server_streams_and_injects_errors():
+    import json
+    from loadtest import fake_llm_server
+
+    fake_client = TestClient(fake_llm_server.app)
+    settings = {"ttft_ms": 0, "ttft_jitter_ms": 0, "tokens_per_second": 0, "error_rate": 0}
+    with patch.dict(fake_llm_server.CONFIG, settings):
+        prompt = "Generate a professional 2-day HTML travel itinerary for New York"
+        blocking = fake_client.post("/v1/chat/completions", json={
+            "model": "grok-2-1212", "messages": [{"role": "user", "content": prompt}]
+        }).json()
+        html = blocking["choices"][0]["message"]["content"]
+        assert "Day 2" in html and "Day 3" not in html and "Hidden Gems" in html
+        assert blocking["usage"]["completion_tokens"] > 0
+
+        streamed = fake_client.post("/chat/completions", json={
+            "messages": [{"role": "user", "content": "Where is my hotel?"}],
+            "stream": True,
+            "stream_options": {"include_usage": True}
+        })
+        events = [line[len("data: "):] for line in streamed.text.splitlines() if line.startswith("data: ")]
+        assert events[-1] == "[DONE]"
+        chunks = [json.loads(event) for event in events[:-1]]
+        text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        assert text == fake_llm_server.CANNED_CHAT
+        assert chunks[-1]["usage"]["completion_tokens"] == len(fake_llm_server.tokenize(text, 10000))
+
+        fake_client.post("/config", json={"error_rate": 1, "error_status": 429})
+        failed = fake_client.post("/v1/chat/completions", json={"messages": []})
+        assert failed.status_code == 429
+        assert failed.headers["Retry-After"] == "1"
+
+
+# ---------------- Load Generator Tests ---------------- #
+
+def test_load_generator_replays_sessions_in_process():
+    import asyncio
+    import httpx
+    from loadtest.load_generator import LoadGenerator, format_report
+
+    generator = LoadGenerator("http://backend", seed=7, think_time=False,
+                              transport=httpx.ASGITransport(app=app))
+    report = asyncio.run(generator.run_users(users=3, duration=30, max_sessions=6))
+
+    assert report["sessions"] == 6
+    itinerary = report["endpoints"]["/generate-itinerary"]
+    assert itinerary["requests"] == 6
+    assert itinerary["error_rate"] == 0
+    assert itinerary["latency_ms"]["p50"] <= itinerary["latency_ms"]["p99"]
+    assert "catalog.hotels" in itinerary["stages_ms"] or "catalog.attractions" in itinerary["stages_ms"]
+    assert report["requests"] == sum(e["requests"] for e in report["endpoints"].values())
+    assert "/generate-itinerary" in format_report(report)
+
+
+# ---------------- Cassette Tests ---------------- #
+
+def test_cassettes_record_then_replay_without_services(tmp_path, monkeypatch):
+    import sqlite3
+    from types import SimpleNamespace
+    import cassettes
+
+    monkeypatch.setattr(cassettes, "CASSETTE_DIR", str(tmp_path))
+    monkeypatch.setattr(cassettes, "CASSETTE_LATENCY_SCALE", 0.0)
+    db = sqlite3.connect(":memory:", check_same_thread=False)
+    db.execute("CREATE TABLE HOTEL_DATA (NAME TEXT, CITY TEXT)")
+    db.execute("INSERT INTO HOTEL_DATA VALUES ('Midtown Suites', 'New York')")
+
+    def fake_stream(**params):
+        for token in ["Midtown ", "Suites"]:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=12, completion_tokens=2))
+
+    monkeypatch.setattr(cassettes, "CASSETTE_MODE", "record")
+    cursor = cassettes.connection("snowflake", lambda: db).cursor()
+    cursor.execute("SELECT * FROM HOTEL_DATA")
+    assert cursor.fetchall() == [("Midtown Suites", "New York")]
+    messages = [{"role": "user", "content": "Where is my hotel?"}]
+    recorded = list(cassettes.completion(fake_stream, "llm.chat", model="grok", messages=messages, stream=True))
+    assert len(recorded) == 3
+
+    monkeypatch.setattr(cassettes, "_cassettes", {})
+    monkeypatch.setattr(cassettes, "CASSETTE_MODE", "replay")
+    cursor = cassettes.connection("snowflake", lambda: pytest.fail("replay must not connect")).cursor()
+    cursor.execute("SELECT * FROM HOTEL_DATA")
+    assert [column[0] for column in cursor.description] == ["NAME", "CITY"]
+    assert cursor.fetchall() == [("Midtown Suites", "New York")]
+
+    other_prompt = [{"role": "user", "content": "Something else"}]
+    replayed = list(cassettes.completion(None, "llm.chat", model="grok", messages=other_prompt, stream=True))
+    assert "".join(c.choices[0].delta.content for c in replayed if c.choices) == "Midtown Suites"
+    assert replayed[-1].usage.completion_tokens == 2
+
+    with pytest.raises(cassettes.CassetteMiss):
+        cursor.execute("SELECT * FROM TOUR")
+
+
+# ---------------- Warm-up Tests ---------------- #
+
+def test_warmup_preloads_catalog_and_gates_readiness(tmp_path, monkeypatch):
+    import pandas as pd
+    import local_catalog
+    import pinecone_fetch
+    import snowflake_fetch
+    import warmup
+
+    db = str(tmp_path / "catalog.sqlite")
+    local_catalog.seed_catalog(db, hotels=pd.DataFrame({
+        "City": ["Chicago"], "Name": ["Loop Hotel"], "Price (per night)": ["$210"], "Rating": ["4.2"]
+    }))
+    monkeypatch.setattr(snowflake_fetch, "CATALOG_BACKEND", "sqlite")
+    monkeypatch.setattr(snowflake_fetch, "LOCAL_CATALOG_PATH", db)
+    monkeypatch.setattr(pinecone_fetch, "HIDDEN_GEMS_BACKEND", "local")
+    monkeypatch.setattr(pinecone_fetch, "_local_index", None)
+    monkeypatch.setattr(pinecone_fetch, "LOCAL_VECTOR_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setattr(warmup, "state", warmup.WarmupState())
+    imported = []
+    monkeypatch.setattr(warmup.llm_client, "import_transport", lambda: imported.append(warmup.state.status))
+    snowflake_fetch.invalidate_catalog()
+
+    assert client.get("/ready").status_code == 503
+    warmup.run_warmup(["Chicago"])
+    ready = client.get("/ready")
+    assert ready.status_code == 200
+    assert imported == ["running"]  # the LLM transport is loaded before the instance reports ready
+    assert ready.json()["cities"]["Chicago"]["rows"] == {"ATTRACTION": 0, "HOTEL_DATA": 1, "TOUR": 0}
+
+    # Served from the cache: no connection needed, and ratings were made numeric once at load
+    with patch.object(snowflake_fetch, "get_connection", side_effect=AssertionError("cache miss")):
+        hotels = snowflake_fetch.fetch_hotels("Chicago", "medium")
+    assert hotels[0]["RATING"] == 4.2 and "ValueScore" in hotels[0]
+    assert "ValueScore" not in snowflake_fetch.load_catalog("HOTEL_DATA", "Chicago")[0]
+    snowflake_fetch.invalidate_catalog()
+
+
+# ---------------- Catalog Snapshot Tests ---------------- #
+
+def test_catalog_snapshot_is_memory_mapped_and_switches_versions(tmp_path, monkeypatch):
+    import pandas as pd
+    import pyarrow as pa
+    import catalog_snapshot
+    import snowflake_fetch
+
+    directory = str(tmp_path / "snapshots")
+    hotels = pd.DataFrame({"City": ["Seattle", "Boston, United States", "Seattle"],
+                           "Name": ["Pike Inn", "Harbor Hotel", "Sound Suites"],
+                           "Price (per night)": ["$180", "$200", "$260"], "Rating": ["4.1", "4.3", "4.6"]})
+    first = catalog_snapshot.export_table_snapshot("HOTEL_DATA", hotels, directory, source_name="ihg_hotels_dag")
+    assert first["tables"]["HOTEL_DATA"]["cities"]["Seattle"] == {"rows": 2, "file": "HOTEL_DATA/seattle.arrow"}
+    assert first["tables"]["HOTEL_DATA"]["cities"]["Boston"]["rows"] == 1
+
+    reader = catalog_snapshot.SnapshotReader(directory, check_seconds=0)
+    allocated = pa.total_allocated_bytes()
+    mapped = reader.table("HOTEL_DATA", "seattle")
+    assert pa.total_allocated_bytes() == allocated  # zero-copy: buffers point into the mapping
+    assert mapped.column("NAME").to_pylist() == ["Sound Suites", "Pike Inn"]  # ranked by rating
+    assert reader.table("TOUR", "Seattle") is None
+
+    monkeypatch.setattr(catalog_snapshot, "_reader", reader)
+    monkeypatch.setattr(snowflake_fetch, "CATALOG_BACKEND", "snapshot")
+    seattle = snowflake_fetch.load_catalog("HOTEL_DATA", "Seattle")
+    assert seattle[0]["PriceValue"] == 260.0
+    # Priced once per version: later requests share the records instead of re-reading and re-pricing
+    with patch.object(snowflake_fetch, "_price_catalog") as price:
+        assert snowflake_fetch.load_catalog("HOTEL_DATA", "Seattle")[0] is seattle[0]
+    price.assert_not_called()
+    assert snowflake_fetch.load_catalog("HOTEL_DATA", "Chicago") == []
+    # Tables the DAGs have not exported yet come from Snowflake
+    with patch.object(snowflake_fetch, "get_connection", side_effect=RuntimeError("snowflake")) as connect:
+        assert snowflake_fetch.fetch_tours("Seattle", "low") == []
+    connect.assert_called_once()
+
+    tours = pd.DataFrame({"City": ["Seattle"], "Title": ["Ferry Ride"], "Price": ["$20"], "Rating": ["4.0"]})
+    second = catalog_snapshot.export_table_snapshot("TOUR", tours, directory, source_name="tours_dag")
+    assert set(second["tables"]) == {"HOTEL_DATA", "TOUR"} and second["previous"] == first["version"]
+    assert reader.version == second["version"]
+    assert [t["TITLE"] for t in snowflake_fetch.fetch_tours("Seattle", "low")] == ["Ferry Ride"]
+    reloaded = snowflake_fetch.load_catalog("HOTEL_DATA", "Seattle")
+    assert len(reloaded) == 2 and reloaded[0] is not seattle[0]  # a new version is read afresh
+    assert mapped.column("NAME").to_pylist() == ["Sound Suites", "Pike Inn"]  # old version stays readable
+
+
+# ---------------- Catalog Version Tests ---------------- #
+
+def test_catalog_versions_invalidate_only_changed_cities(tmp_path, monkeypatch):
+    import pandas as pd
+    import catalog_versions
+    import local_catalog
+    import pinecone_fetch
+    import snowflake_fetch
+
+    hotels = pd.DataFrame({"City": ["Chicago", "Seattle, United States"], "Name": ["Loop Hotel", "Pike Inn"],
+                           "Price (per night)": ["$210", "$180"], "Rating": ["4.2", "4.1"]})
+    db = str(tmp_path / "catalog.sqlite")
+    local_catalog.seed_catalog(db, hotels=hotels)
+    monkeypatch.setattr(snowflake_fetch, "CATALOG_BACKEND", "sqlite")
+    monkeypatch.setattr(snowflake_fetch, "LOCAL_CATALOG_PATH", db)
+    snowflake_fetch.invalidate_catalog()
+
+    conn = local_catalog.connect(db)
+    assert catalog_versions.publish_load(conn.cursor(), "HOTEL_DATA", hotels, "ihg_hotels_dag") == ["Chicago", "Seattle"]
+    watcher = catalog_versions.VersionWatcher(lambda: local_catalog.connect(db))
+    assert watcher.check() == []  # baseline
+    snowflake_fetch.warm_catalog("Chicago")
+    snowflake_fetch.warm_catalog("Seattle")
+
+    # A reload that only changes Chicago drops only Chicago's hotel rows
+    hotels.loc[0, "Price (per night)"] = "$190"
+    assert catalog_versions.publish_load(conn.cursor(), "HOTEL_DATA", hotels, "ihg_hotels_dag") == ["Chicago"]
+    conn.close()
+    assert watcher.check() == [("HOTEL_DATA", "Chicago")]
+    cached = set(snowflake_fetch._catalog_cache.keys())
+    assert ("HOTEL_DATA", "Chicago") not in cached
+    assert {("TOUR", "Chicago"), ("HOTEL_DATA", "Seattle")} <= cached
+    assert watcher.check() == []
+    snowflake_fetch.invalidate_catalog()
+
+    # The notify endpoint applies the same per-city versions
+    monkeypatch.setattr(catalog_versions, "CACHE_NOTIFY_TOKEN", "notify-secret")
+    monkeypatch.setattr("main.version_watcher", catalog_versions.VersionWatcher())
+    pinecone_fetch._hidden_gems_cache.set(("NewYork", 5, None), [{"name": "Cached Gem"}])
+    body = {"dataset": "HIDDEN_GEMS", "versions": {"New York": "v2"}}
+    assert client.post("/cache/invalidate", json=body).status_code == 403
+    assert client.post("/cache/invalidate", json=body, headers={"X-Notify-Token": "sécret".encode()}).status_code == 403
+    headers = {"X-Notify-Token": "notify-secret"}
+    assert client.post("/cache/invalidate", json=body, headers=headers).json()["invalidated"] == ["New York"]
+    assert pinecone_fetch._hidden_gems_cache.get(("NewYork", 5, None)) is None
+    assert client.post("/cache/invalidate", json=body, headers=headers).json()["invalidated"] == []
+    assert client.post("/cache/invalidate", json={"dataset": "FLIGHTS", "versions": {}}, headers=headers).status_code == 400
+
+
+# ---------------- Resilience Tests ---------------- #
+
+def test_breaker_trips_on_slow_snowflake_and_serves_stale_rows(monkeypatch):
+    import threading
+    import time
+    import resilience
+    import snowflake_fetch
+    from cache import TTLCache
+
+    now = [0.0]
+    cache = TTLCache(10, clock=lambda: now[0], stale_ttl=100)
+    breaker = resilience.CircuitBreaker("test-snowflake", timeout=0.2, slow_seconds=0.1, min_calls=2,
+                                        open_seconds=30, clock=lambda: now[0])
+    release = threading.Event()
+    upstream = {"mode": "ok", "version": "v1", "calls": 0}
+
+    def query_catalog(table, city):
+        upstream["calls"] += 1
+        if upstream["mode"] == "hang":
+            release.wait(5)
+            raise RuntimeError("driver timeout")
+        rows = [{"TITLE": upstream["version"]}]
+        cache.set((table, city), rows)
+        return rows
+
+    monkeypatch.setattr(snowflake_fetch, "CATALOG_BACKEND", "snowflake")
+    monkeypatch.setattr(snowflake_fetch, "_catalog_cache", cache)
+    monkeypatch.setattr(snowflake_fetch, "snowflake_breaker", breaker)
+    monkeypatch.setattr(snowflake_fetch, "query_catalog", query_catalog)
+
+    assert snowflake_fetch.load_catalog("TOUR", "Seattle") == [{"TITLE": "v1"}]
+
+    # Expired and Snowflake hangs: the deadline bounds the wait, the stale rows are served, the breaker opens
+    now[0] += 20
+    upstream["mode"] = "hang"
+    start = time.perf_counter()
+    assert snowflake_fetch.load_catalog("TOUR", "Seattle") == [{"TITLE": "v1"}]
+    assert time.perf_counter() - start < 1
+    assert breaker.state == resilience.OPEN
+
+    # While open, requests get the stale rows without calling Snowflake; with nothing cached they fail fast
+    calls = upstream["calls"]
+    assert snowflake_fetch.load_catalog("TOUR", "Seattle") == [{"TITLE": "v1"}]
+    assert snowflake_fetch.fetch_tours("Chicago", "low") == []
+    assert upstream["calls"] == calls
+    release.set()
+
+    # After open_seconds one background probe refreshes the cache and closes the breaker
+    upstream.update(mode="ok", version="v2")
+    now[0] += 31
+    assert snowflake_fetch.load_catalog("TOUR", "Seattle") == [{"TITLE": "v1"}]
+    deadline = time.time() + 2
+    while breaker.state != resilience.CLOSED and time.time() < deadline:
+        time.sleep(0.01)
+    assert breaker.state == resilience.CLOSED
+    assert snowflake_fetch.load_catalog("TOUR", "Seattle") == [{"TITLE": "v2"}]
+
+
+# ---------------- LLM Client Tests ---------------- #
+
+def test_llm_client_retries_rate_limits_and_hedges_slow_attempts(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    import llm_client
+    from metrics import collect_timings
+
+    class RateLimited(Exception):
+        status_code = 429
+
+    def chunk(content):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+
+    class Stream:
+        def __init__(self, delay):
+            self.delay = delay
+            self.tokens = ["Day 1", ": Harbor"]
+            self.closed = False
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(self.delay)
+            if not self.tokens:
+                raise StopAsyncIteration
+            return chunk(self.tokens.pop(0))
+
+        async def aclose(self):
+            self.closed = True
+
+    calls = []
+    streams = []
+
+    async def fake_acompletion(**params):
+        calls.append(params)
+        if len(calls) == 1:
+            raise RateLimited("slow down")
+        streams.append(Stream(1.0 if len(calls) == 3 else 0))
+        return streams[-1]
+
+    monkeypatch.setattr(llm_client, "acompletion", fake_acompletion)
+    monkeypatch.setattr(llm_client, "LLM_RETRY_BASE_SECONDS", 0)
+    params = {"model": "grok", "messages": [{"role": "user", "content": "Plan"}], "stream": True}
+
+    # A 429 is retried; the connect timeout is passed down to the HTTP layer
+    result = asyncio.run(llm_client.complete(params, "test.llm", "chat"))
+    assert result.content == "Day 1: Harbor"
+    assert result.attempts == 2 and not result.hedged
+    assert calls[-1]["timeout"].connect == llm_client.LLM_CONNECT_TIMEOUT
+
+    # With a latency baseline, an attempt slower than the threshold is raced by a hedge, which wins
+    # The losing attempt's stream is closed, and only the winner's first-token time is recorded
+    monkeypatch.setattr(llm_client, "hedge_after", lambda stage, stream: 0.05)
+    with collect_timings() as timings:
+        result = asyncio.run(llm_client.complete(params, "test.llm", "chat"))
+    assert result.content == "Day 1: Harbor"
+    assert result.hedged and len(calls) == 4
+    assert streams[1].closed
+    assert [stage for stage, _ in timings.entries].count("test.llm.ttft") == 1
+    assert timings.as_dict()["test.llm.ttft"] < 500
+
+    # A stream that never produces a token fails within the first-token timeout, not the total one
+    monkeypatch.setattr(llm_client, "hedge_after", lambda stage, stream: None)
+    monkeypatch.setattr(llm_client, "LLM_FIRST_TOKEN_TIMEOUT", 0.05)
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 0)
+    with pytest.raises(llm_client.FirstTokenTimeout):
+        calls[:] = [None, None]
+        asyncio.run(llm_client.complete(params, "test.llm", "chat"))
+
+
+# ---------------- LLM Router Tests ---------------- #
+
+def test_llm_router_fails_over_and_ejects_unhealthy_model(monkeypatch):
+    import asyncio
+    import llm_client
+    import llm_router
+
+    class Unavailable(Exception):
+        status_code = 503
+
+    calls = []
+
+    async def fake_acompletion(**params):
+        calls.append(params["model"])
+        if params["model"] == "xai/grok-primary":
+            raise Unavailable("overloaded")
+        return {"choices": [{"message": {"content": "Take the ferry"}}], "usage": None}
+
+    monkeypatch.setattr(llm_client, "acompletion", fake_acompletion)
+    monkeypatch.setattr(llm_router, "LLM_ROUTER_MIN_SAMPLES", 2)
+    monkeypatch.setattr(llm_router, "_stats", {})
+    monkeypatch.setitem(llm_router.ROUTERS, "chat", llm_router.Router("chat", ["xai/grok-primary", "openai/mini"]))
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    params = {"model": "xai/grok-primary", "messages": [], "provider": "grok", "api_key": "xai-key"}
+
+    # A failure on the primary moves the request to the next model at once, with that provider's key
+    result = asyncio.run(llm_client.complete(params, "test.router", "chat"))
+    assert (result.content, result.model, result.attempts) == ("Take the ferry", "openai/mini", 2)
+    assert calls == ["xai/grok-primary", "openai/mini"]
+    assert llm_router.params_for("openai/mini", params)["api_key"] == "sk-test"
+    assert "provider" not in llm_router.params_for("openai/mini", params)
+
+    # A request the provider rejects as invalid is not held against the model
+    class BadRequest(Exception):
+        status_code = 400
+
+    async def rejecting_acompletion(**params):
+        raise BadRequest("context length exceeded")
+
+    monkeypatch.setattr(llm_client, "acompletion", rejecting_acompletion)
+    for _ in range(3):
+        with pytest.raises(BadRequest):
+            asyncio.run(llm_client.complete(params, "test.router", "chat"))
+    assert llm_router.stats("openai/mini").healthy
+    monkeypatch.setattr(llm_client, "acompletion", fake_acompletion)
+
+    # Until its next probe the failed primary ranks behind the model that works
+    calls.clear()
+    asyncio.run(llm_client.complete(params, "test.router", "chat"))
+    assert calls == ["openai/mini"]
+
+    # Probed again, its error ratio crosses the limit and it is ejected and skipped entirely
+    monkeypatch.setattr(llm_router, "LLM_ROUTER_PROBE_SECONDS", 0)
+    asyncio.run(llm_client.complete(params, "test.router", "chat"))
+    assert not llm_router.stats("xai/grok-primary").healthy
+    calls.clear()
+    asyncio.run(llm_client.complete(params, "test.router", "chat"))
+    assert calls == ["openai/mini"]
+    assert llm_router.FAILOVERS.value(endpoint="chat", from_model="xai/grok-primary", to_model="openai/mini") >= 2
+    assert 'itinerary_llm_model_healthy{model="xai/grok-primary"} 0.0' in client.get("/metrics").text
+
+    # A model the provider refuses (missing key, unknown model) is ejected on its first failure
+    class Unauthorized(Exception):
+        status_code = 401
+
+    async def unauthorized_acompletion(**params):
+        calls.append(params["model"])
+        if params["model"] == "openai/no-key":
+            raise Unauthorized("missing api key")
+        return {"choices": [{"message": {"content": "Take the ferry"}}], "usage": None}
+
+    monkeypatch.setattr(llm_client, "acompletion", unauthorized_acompletion)
+    monkeypatch.setitem(llm_router.ROUTERS, "chat", llm_router.Router("chat", ["openai/no-key", "xai/grok-ok"]))
+    calls.clear()
+    for _ in range(10):
+        assert asyncio.run(llm_client.complete(params, "test.router", "chat")).model == "xai/grok-ok"
+    assert calls.count("openai/no-key") == 1
+
+
+# ---------------- Token Accounting Tests ---------------- #
+
+def test_token_usage_is_accounted_and_prompts_fit_the_budget(monkeypatch):
+    import json
+    from types import SimpleNamespace
+    import llm_usage
+
+    result = SimpleNamespace(content="<html>Day 1</html>", usage={"prompt_tokens": 1200, "completion_tokens": 300},
+                             model="xai/grok-2-1212", ttft=0.4, seconds=2.5, attempts=1, hedged=False)
+    messages = [{"role": "user", "content": "Plan a trip"}]
+    fields = llm_usage.record("itinerary", "test.usage", result, messages, city="Seattle", trip_days=3)
+    assert fields["cost_usd"] == pytest.approx((1200 * 2 + 300 * 10) / 1_000_000)
+    assert fields["generation_seconds"] == pytest.approx(2.1) and not fields["estimated"]
+    assert llm_usage.LLM_TOKENS.value(endpoint="itinerary", model="xai/grok-2-1212", kind="prompt",
+                                      city="Seattle", trip_days="1-3") >= 1200
+
+    # Free-text cities and long trips share bounded label values instead of adding series
+    llm_usage.record("itinerary", "test.usage", result, messages, city="seattle, wa", trip_days=5)
+    llm_usage.record("itinerary", "test.usage", result, messages, city="Atlantis 123", trip_days=400)
+    assert llm_usage.LLM_TOKENS.value(endpoint="itinerary", model="xai/grok-2-1212", kind="prompt",
+                                      city="Seattle", trip_days="4-7") >= 1200
+    assert llm_usage.LLM_TOKENS.value(endpoint="itinerary", model="xai/grok-2-1212", kind="prompt",
+                                      city="other", trip_days="8+") >= 1200
+
+    # Without usage from the provider the counts are estimated from characters
+    result.usage = None
+    assert llm_usage.record("chat", "test.usage", result, messages)["estimated"]
+
+    # Over budget, the prompt data is shrunk step by step until it fits
+    monkeypatch.setitem(llm_usage.LLM_PROMPT_TOKEN_BUDGET, "itinerary", 300)
+    data = {"city": "Seattle", "hidden_gems": [{"title": f"Gem {i}", "description": "x" * 300} for i in range(5)],
+            "days": [{"day": 1, "tours": [{"TITLE": "Ferry", "DESCRIPTION": "y" * 500}] * 2, "attractions": []}]}
+    prompt = llm_usage.fit_prompt("itinerary", lambda d, indent: "Plan:\n" + json.dumps(d, indent=2 if indent else None), data)
+    assert llm_usage.estimate_tokens(prompt) <= 300
+    assert '"city": "Seattle"' in prompt
+
+    # The itinerary re-sent with /ask keeps its opening and closing lines
+    monkeypatch.setitem(llm_usage.LLM_PROMPT_TOKEN_BUDGET, "chat", 60)
+    itinerary = "\n".join(["Trip to Seattle"] + [f"Day {i}: museum visit and harbor walk" for i in range(1, 30)] + ["Hidden Gems"])
+    cut = llm_usage.fit_text("chat", itinerary, reserved=10)
+    assert cut.startswith("Trip to Seattle") and cut.endswith("Hidden Gems")
+    assert llm_usage.TRUNCATION_MARKER in cut and len(cut) < len(itinerary)
+
+    # A single long line (HTML without breaks) keeps characters from both ends instead of nothing
+    html = "<div>Trip to Seattle" + "<p>harbor walk</p>" * 100 + "Hidden Gems</div>"
+    cut = llm_usage.fit_text("chat", html, reserved=10)
+    assert cut.startswith("<div>Trip to Seattle") and cut.endswith("Hidden Gems</div>")
+    assert len(cut) <= 50 * llm_usage.LLM_CHARS_PER_TOKEN
+
+    # Without a configured budget nothing is cut
+    monkeypatch.delitem(llm_usage.LLM_PROMPT_TOKEN_BUDGET, "chat")
+    assert llm_usage.fit_text("chat", itinerary, reserved=10) == itinerary
+
+
+# ---------------- Fast Itinerary Tests ---------------- #
+
+def test_fast_itinerary_on_request_overload_and_llm_failure(monkeypatch):
+    import agents
+    import fast_itinerary
+
+    payload = {
+        "city": "New York",
+        "start_date": "2025-04-20",
+        "end_date": "2025-04-21",
+        "preference": "Suggest an itinerary with Things to do",
+        "travel_type": "With Family",
+        "adults": 2,
+        "kids": 1
+    }
+    calls = agents.run_crew_with_data.await_count
+
+    fast = client.post("/generate-itinerary", json=dict(payload, mode="fast")).json()["data"]
+    assert fast["generator"] == "fast"
+    assert fast["itinerary_html"].count('class="day-card"') == 2
+    assert "Hidden Gems of New York" in fast["itinerary_html"]
+    assert "HIDDEN GEMS" in fast["itinerary_text"] and "2 adults, 1 kid" in fast["itinerary_text"]
+    assert agents.run_crew_with_data.await_count == calls
+
+    # Auto mode switches to the fast path while itinerary requests are queueing for the LLM
+    monkeypatch.setattr(fast_itinerary, "FAST_ITINERARY_QUEUE_DEPTH", 0)
+    assert client.post("/generate-itinerary", json=payload).json()["data"]["generator"] == "fast"
+    monkeypatch.setattr(fast_itinerary, "FAST_ITINERARY_QUEUE_DEPTH", 4)
+
+    # A failed LLM call is served from the fast path in auto mode, and is still an error when the LLM was asked for
+    monkeypatch.setattr(fast_itinerary, "load_signal", fast_itinerary.LoadSignal())
+    monkeypatch.setattr(agents.run_crew_with_data, "side_effect", RuntimeError("Grok timed out"))
+    assert client.post("/generate-itinerary", json=payload).json()["data"]["generator"] == "fast"
+    assert client.post("/generate-itinerary", json=dict(payload, mode="llm")).status_code == 500
+    assert fast_itinerary.ITINERARIES.value(generator="fast", reason="llm_error") >= 1
+
+
+# ---------------- Admission Control Tests ---------------- #
+
+def test_admission_prioritises_chat_and_sheds_load_with_retry_after(monkeypatch):
+    import asyncio
+    import admission
+
+    controller = admission.AdmissionController(
+        limits={"ask": (1, 1), "generate-itinerary": (1, 1)},
+        priority={"ask": 0, "generate-itinerary": 1},
+        timeouts={"ask": 5, "generate-itinerary": 0.2},
+        total=1
+    )
+
+    async def scenario():
+        await controller.acquire("generate-itinerary")
+        queued_itinerary = asyncio.ensure_future(controller.acquire("generate-itinerary"))
+        await asyncio.sleep(0)
+        queued_chat = asyncio.ensure_future(controller.acquire("ask"))
+        await asyncio.sleep(0)
+
+        # The itinerary queue is full: the next one is turned away at once
+        with pytest.raises(admission.Rejected) as full:
+            await controller.acquire("generate-itinerary")
+        assert full.value.status_code == 429 and full.value.retry_after >= 1
+
+        # The freed slot goes to the chat request even though the itinerary queued first
+        controller.release("generate-itinerary", 2.0)
+        await asyncio.wait_for(queued_chat, 1)
+        assert not queued_itinerary.done()
+
+        # The itinerary gives up after its queue timeout
+        with pytest.raises(admission.Rejected) as timed_out:
+            await queued_itinerary
+        assert timed_out.value.status_code == 503
+        controller.release("ask", 0.1)
+
+    asyncio.run(scenario())
+    assert admission.ADMISSION_REJECTED.value(endpoint="generate-itinerary", reason="timeout") >= 1
+
+    # Over HTTP the rejection is a fast 429 with Retry-After
+    monkeypatch.setattr(admission, "controller", admission.AdmissionController(limits={"generate-pdf": (0, 0)}))
+    response = client.post("/generate-pdf", json={"city": "New York", "itinerary": "Day 1", "start_date": "2025-04-20"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_saturated_admission_serves_auto_itineraries_from_the_fast_path(monkeypatch):
+    import asyncio
+    import admission
+    import fast_itinerary
+
+    payload = {
+        "city": "New York",
+        "start_date": "2025-04-20",
+        "end_date": "2025-04-21",
+        "preference": "Suggest an itinerary with Things to do",
+        "travel_type": "Solo"
+    }
+    # No itinerary slots and no queue: every request is over capacity
+    monkeypatch.setattr(admission, "controller", admission.AdmissionController(limits={"generate-itinerary": (0, 0)}))
+    served = client.post("/generate-itinerary", json=payload)
+    assert served.status_code == 200
+    assert served.json()["data"]["generator"] == "fast"
+    assert fast_itinerary.ITINERARIES.value(generator="fast", reason="admission") >= 1
+
+    # Fast mode never needs the LLM, so it is served too; only llm mode is refused
+    fast = client.post("/generate-itinerary", json=dict(payload, mode="fast"))
+    assert fast.status_code == 200 and fast.json()["data"]["generator"] == "fast"
+
+    rejected = client.post("/generate-itinerary", json=dict(payload, mode="llm"))
+    assert rejected.status_code == 429 and int(rejected.headers["Retry-After"]) >= 1
+
+    # Requests backed up in the admission queue switch admitted ones to the fast path too
+    controller = admission.AdmissionController(limits={"generate-itinerary": (0, 8)}, timeouts={"generate-itinerary": 5})
+    monkeypatch.setattr(admission, "controller", controller)
+
+    async def backlog():
+        waiting = [asyncio.ensure_future(controller.acquire("generate-itinerary"))
+                   for _ in range(fast_itinerary.FAST_ITINERARY_QUEUE_DEPTH)]
+        await asyncio.sleep(0)
+        try:
+            return fast_itinerary.LoadSignal().choose("auto")
+        finally:
+            for task in waiting:
+                task.cancel()
+            await asyncio.gather(*waiting, return_exceptions=True)
+
+    assert asyncio.run(backlog()) == ("fast", "queue_depth")
+    assert controller.queued("generate-itinerary") == 0
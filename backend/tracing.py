@@ -0,0 +1,139 @@
+"""
+Lightweight OpenTelemetry-style tracing.
+
+start_span opens a span that is a child of the current one (tracked in a
+contextvar, so it follows the request into FastAPI's worker threads) and hands
+it to the configured exporter when it ends. Span ids and the JSON layout follow
+OpenTelemetry naming so the output can be loaded into the usual tools.
+
+TRACING_EXPORTER picks the exporter:
+    none     (default) spans are created but dropped
+    console  one JSON line per span on stdout
+    file     one JSON line per span appended to TRACING_FILE
+Anything with an export(span) method can be installed with set_exporter.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", os.path.join(os.path.dirname(__file__), "data", "traces.jsonl"))
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "itinerary-backend")
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "service": SERVICE_NAME,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class NoopExporter:
+    def export(self, span):
+        pass
+
+
+class ConsoleExporter:
+    def export(self, span):
+        print(json.dumps(span.to_dict(), default=str))
+
+
+class FileExporter:
+    """Appends finished spans to a JSON Lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+def build_exporter(name, path=None):
+    if name == "console":
+        return ConsoleExporter()
+    if name == "file":
+        return FileExporter(path or TRACING_FILE)
+    if name in ("", "none"):
+        return NoopExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {name}")
+
+
+_exporter = build_exporter(TRACING_EXPORTER)
+
+
+def set_exporter(exporter):
+    """Install an exporter; returns the previous one"""
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name, **attributes):
+    """Run a block inside a span; exceptions mark the span as an error and propagate"""
+    span = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error"
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(token)
+        try:
+            _exporter.export(span)
+        except Exception as e:
+            print(f"Error exporting span {name}: {e}")
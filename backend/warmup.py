@@ -0,0 +1,139 @@
+"""
+Startup warm-up for new instances.
+
+Opens the catalog and Pinecone clients and imports the LLM transport (litellm),
+then loads every configured city's catalog tables and hidden gems into the
+fetch-layer caches, so the first real request for a city skips connection
+setup, imports, queries and price parsing. main.py
+runs it in a background thread at startup; /ready answers 503 until it has
+finished, so the instance only takes traffic once it is warm.
+
+    WARMUP_ENABLED   false skips warm-up; the instance is ready immediately
+    WARMUP_CITIES    comma-separated cities to preload (default: every supported city)
+"""
+import logging
+import os
+import threading
+import time
+
+import catalog_snapshot
+import llm_client
+import pinecone_fetch
+import snowflake_fetch
+from cities import SUPPORTED_CITIES
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_CITIES = [city.strip() for city in os.getenv(
+    "WARMUP_CITIES", ",".join(SUPPORTED_CITIES)).split(",") if city.strip()]
+
+# Hidden gems are cached per semantic query, which depends on budget and travel type
+WARMUP_BUDGETS = ["low", "medium", "high"]
+WARMUP_TRAVEL_TYPES = ["Solo", "With Family"]
+
+
+class WarmupState:
+    """Progress of the warm-up, as reported by /ready"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "pending"
+        self.started_at = None
+        self.finished_at = None
+        self.cities = {}
+        self.errors = {}
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def record_city(self, city, seconds, rows=None, error=None):
+        with self._lock:
+            self.cities[city] = {"seconds": round(seconds, 3), "rows": rows}
+            if error is not None:
+                self.errors[city] = error
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def as_dict(self):
+        with self._lock:
+            duration = None
+            if self.started_at is not None:
+                duration = round((self.finished_at or time.time()) - self.started_at, 3)
+            return {"status": self.status, "duration_seconds": duration,
+                    "cities": dict(self.cities), "errors": dict(self.errors)}
+
+
+state = WarmupState()
+
+
+def open_clients():
+    """Connect to the catalog (or map its snapshot) once, create the shared Pinecone handle and import litellm"""
+    with stage_timer("warmup.connect"):
+        snapshot_version = None
+        if snowflake_fetch.CATALOG_BACKEND == "snapshot":
+            try:
+                snapshot_version = catalog_snapshot.get_reader().version
+                logger.info(f"Serving catalog snapshot {snapshot_version}")
+            except catalog_snapshot.SnapshotNotFound:
+                logger.warning("No catalog snapshot yet, warming the Snowflake fallback")
+        if snapshot_version is None:
+            snowflake_fetch.get_connection().close()
+        if pinecone_fetch.HIDDEN_GEMS_BACKEND == "pinecone" and pinecone_fetch.initialize_pinecone() is None:
+            raise RuntimeError("Pinecone index could not be initialized")
+        # litellm is imported lazily to keep startup fast; pay for it here rather than in the first itinerary
+        llm_client.import_transport()
+
+
+def warm_city(city):
+    """Load a city's catalog tables and hidden gems into the caches; returns {table: rows}"""
+    with stage_timer("warmup.city"):
+        rows = snowflake_fetch.warm_catalog(city)
+        for budget in WARMUP_BUDGETS:
+            for travel_type in WARMUP_TRAVEL_TYPES:
+                pinecone_fetch.fetch_hidden_gems(city, preferences={"budget": budget, "travel_type": travel_type})
+    return rows
+
+
+def run_warmup(cities=None):
+    """Warm every city; a failing city is logged and left cold rather than blocking readiness"""
+    cities = WARMUP_CITIES if cities is None else cities
+    state.update(status="running", started_at=time.time(), finished_at=None)
+    try:
+        open_clients()
+    except Exception as e:
+        logger.error(f"Warm-up could not open clients: {e}", exc_info=True)
+        state.update(status="failed", finished_at=time.time(), errors={"clients": str(e)})
+        return state
+
+    for city in cities:
+        start = time.perf_counter()
+        try:
+            rows = warm_city(city)
+        except Exception as e:
+            seconds = time.perf_counter() - start
+            logger.warning(f"Warm-up failed for {city} after {seconds:.2f}s: {e}")
+            state.record_city(city, seconds, error=str(e))
+            continue
+        seconds = time.perf_counter() - start
+        logger.info(f"Warmed {city} in {seconds:.2f}s ({rows})")
+        state.record_city(city, seconds, rows=rows)
+
+    state.update(status="ready", finished_at=time.time())
+    logger.info(f"Warm-up finished for {len(cities)} cities in {state.as_dict()['duration_seconds']:.2f}s")
+    return state
+
+
+def start_warmup():
+    """Start warm-up in the background, or mark the instance ready when it is disabled"""
+    if not WARMUP_ENABLED:
+        state.update(status="ready")
+        return None
+    thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -104,12 +104,13 @@ if st.session_state.get("loading", False):
         }
 
         try:
-            res = requests.post(f"{BACKEND_URL}/generate-itinerary", json=payload, timeout=180)
+            res = requests.post(f"{BACKEND_URL}/generate-itinerary", params={"timings": "true"}, json=payload, timeout=180)
             res.raise_for_status()
             data = res.json()
             st.session_state.itinerary_html = data["data"]["itinerary_html"]
             st.session_state.itinerary_text = data["data"]["itinerary_text"]
             st.session_state.generated_itinerary = data["data"]["itinerary_text"]
+            st.session_state.timings = data.get("timings", {})
 
             pdf_response = requests.post(
                 f"{BACKEND_URL}/generate-pdf",
@@ -135,6 +136,10 @@ if st.session_state.get("loading", False):
 # ------------------ Display Itinerary ------------------
 if st.session_state.get("itinerary_html"):
     st.success("✅ Your personalized itinerary is ready!")
+    if st.session_state.get("timings"):
+        with st.expander("⏱️ Where the time went"):
+            st.table({"Stage": list(st.session_state.timings),
+                      "ms": list(st.session_state.timings.values())})
 
     tabs = st.tabs(["📋 Itinerary", "📄 PDF Download", "💬 Ask About Your Itinerary"])
 